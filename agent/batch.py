@@ -0,0 +1,229 @@
+import argparse
+import io
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+BATCH_POLL_INTERVAL = float(os.environ.get("BATCH_POLL_INTERVAL", "30"))
+BATCH_COMPLETION_WINDOW = os.environ.get("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_STATE_DIR = os.environ.get("BATCH_STATE_DIR", os.path.join(os.getcwd(), "cache", "batches"))
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+# Per-batch limits of the Batch API: requests per input file and file size.
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", "50000"))
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+class BatchRequest:
+    def __init__(self, custom_id, model, messages, metadata=None):
+        self.custom_id = custom_id
+        self.model = model
+        self.messages = messages
+        self.metadata = metadata or {}
+
+    def to_line(self):
+        return json.dumps({
+            "custom_id": self.custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {"model": self.model, "messages": self.messages},
+        })
+
+
+# Collects chat completion requests into Batch API submissions. Each request
+# carries a custom_id and free-form metadata (file, line range, Slack user...)
+# so results can be routed back to where they came from. Requests beyond the
+# API's per-batch limits (BATCH_MAX_REQUESTS lines, BATCH_MAX_BYTES of input
+# file) are submitted as several batches, tracked together as one job. The
+# submitted state is saved to disk so a later process can pick the job up again.
+class BatchJob:
+    def __init__(self, client, name=None, max_requests=None, max_bytes=None):
+        self.client = client
+        self.name = name or time.strftime("batch-%Y%m%d-%H%M%S")
+        self.max_requests = max_requests or BATCH_MAX_REQUESTS
+        self.max_bytes = max_bytes or BATCH_MAX_BYTES
+        self.requests = {}
+        # One entry per submitted batch: id, status, custom_ids, output/error file ids.
+        self.parts = []
+
+    @property
+    def batch_ids(self):
+        return [part["id"] for part in self.parts]
+
+    @property
+    def status(self):
+        # Unfinished while any part is; otherwise "completed" only if every
+        # part completed.
+        if not self.parts:
+            return "pending"
+        statuses = [part["status"] for part in self.parts]
+        unfinished = [status for status in statuses if status not in FINISHED_STATUSES]
+        if unfinished:
+            return unfinished[0]
+        return next((status for status in statuses if status != "completed"), "completed")
+
+    def add(self, custom_id, model, messages, metadata=None):
+        if custom_id in self.requests:
+            raise ValueError(f"Duplicate batch request id: {custom_id}")
+        self.requests[custom_id] = BatchRequest(custom_id, model, messages, metadata)
+
+    def to_jsonl(self):
+        return "\n".join(request.to_line() for request in self.requests.values()) + "\n"
+
+    def split(self):
+        # Groups of (custom_id, line) that each fit in one batch.
+        groups, current, size = [], [], 0
+        for request in self.requests.values():
+            line = request.to_line() + "\n"
+            length = len(line.encode())
+            if length > self.max_bytes:
+                raise ValueError(f"Batch request {request.custom_id} is larger than {self.max_bytes} bytes")
+            if current and (len(current) >= self.max_requests or size + length > self.max_bytes):
+                groups.append(current)
+                current, size = [], 0
+            current.append((request.custom_id, line))
+            size += length
+        if current:
+            groups.append(current)
+        return groups
+
+    def submit(self):
+        if not self.requests:
+            raise ValueError("Cannot submit an empty batch")
+        groups = self.split()
+        for number, group in enumerate(groups, start=1):
+            name = self.name if len(groups) == 1 else f"{self.name}-{number}"
+            input_file = self.client.files.create(
+                file=(f"{name}.jsonl", io.BytesIO("".join(line for _, line in group).encode())),
+                purpose="batch"
+            )
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=BATCH_COMPLETION_WINDOW,
+                metadata={"name": self.name, "part": f"{number}/{len(groups)}"}
+            )
+            self.parts.append({
+                "id": batch.id,
+                "status": batch.status,
+                "custom_ids": [custom_id for custom_id, _ in group],
+                "output_file_id": None,
+                "error_file_id": None,
+            })
+            logger.info(f"Submitted batch {batch.id} with {len(group)} requests (part {number}/{len(groups)} of {self.name})")
+        return self.batch_ids
+
+    def refresh(self):
+        for part in self.parts:
+            if part["status"] in FINISHED_STATUSES:
+                continue
+            batch = self.client.batches.retrieve(part["id"])
+            part["status"] = batch.status
+            part["output_file_id"] = batch.output_file_id
+            part["error_file_id"] = batch.error_file_id
+        return self.status
+
+    def wait(self, poll_interval=None, timeout=None):
+        poll_interval = BATCH_POLL_INTERVAL if poll_interval is None else poll_interval
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.refresh() not in FINISHED_STATUSES:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Batch {self.name} still {self.status} after {timeout}s")
+            time.sleep(poll_interval)
+        logger.info(f"Batch {self.name} finished with status {self.status}")
+        return self.status
+
+    def _read_file(self, file_id):
+        if not file_id:
+            return []
+        content = self.client.files.content(file_id).text
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def results(self):
+        # custom_id -> {"metadata", "content", "error"}; requests a batch did
+        # not answer come back with an error naming that batch's status.
+        results = {}
+        for part in self.parts:
+            custom_ids = set(part["custom_ids"])
+            for line in self._read_file(part["output_file_id"]) + self._read_file(part["error_file_id"]):
+                custom_id = line.get("custom_id")
+                if custom_id not in custom_ids or custom_id not in self.requests:
+                    continue
+                response = line.get("response") or {}
+                body = response.get("body") or {}
+                error = line.get("error") or (body.get("error") if response.get("status_code", 200) >= 400 else None)
+                content = None
+                if not error and body.get("choices"):
+                    content = body["choices"][0]["message"]["content"]
+                results[custom_id] = {"metadata": self.requests[custom_id].metadata, "content": content, "error": error}
+            for custom_id in part["custom_ids"]:
+                if custom_id not in results and custom_id in self.requests:
+                    results[custom_id] = {"metadata": self.requests[custom_id].metadata, "content": None, "error": f"No result (batch {part['status']})"}
+        for custom_id, request in self.requests.items():
+            if custom_id not in results:
+                results[custom_id] = {"metadata": request.metadata, "content": None, "error": "Not submitted"}
+        return results
+
+    def save(self, state_dir=None):
+        state_dir = state_dir or BATCH_STATE_DIR
+        os.makedirs(state_dir, exist_ok=True)
+        path = os.path.join(state_dir, f"{self.name}.json")
+        with open(path, 'w') as f:
+            json.dump({
+                "name": self.name,
+                "parts": [{"id": part["id"], "custom_ids": part["custom_ids"]} for part in self.parts],
+                "requests": [
+                    {"custom_id": r.custom_id, "model": r.model, "messages": r.messages, "metadata": r.metadata}
+                    for r in self.requests.values()
+                ],
+            }, f)
+        return path
+
+    @classmethod
+    def load(cls, client, path):
+        with open(path, 'r') as f:
+            state = json.load(f)
+        job = cls(client, state["name"])
+        for request in state["requests"]:
+            job.add(request["custom_id"], request["model"], request["messages"], request["metadata"])
+        parts = state.get("parts")
+        if parts is None:
+            # Saved before jobs could span several batches.
+            parts = [{"id": state["batch_id"], "custom_ids": list(job.requests)}]
+        # Statuses and file ids are fetched again by the next refresh().
+        job.parts = [{**part, "status": "in_progress", "output_file_id": None, "error_file_id": None} for part in parts]
+        return job
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from dotenv import load_dotenv
+    load_dotenv()
+    from agent.core import ConsultAIAgent
+    from agent.code_review import format_report
+
+    parser = argparse.ArgumentParser(description="Run ConsultAIng reviews through the OpenAI Batch API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    review = subparsers.add_parser("review", help="Batch review a project path or the files changed in a range")
+    review.add_argument("project")
+    review.add_argument("--path", default="")
+    review.add_argument("--base")
+    review.add_argument("--head", default="HEAD")
+    review.add_argument("--no-wait", action="store_true", help="Submit and save the batch without waiting")
+    collect = subparsers.add_parser("collect", help="Wait for a saved batch and print its report")
+    collect.add_argument("state_file")
+    args = parser.parse_args()
+
+    agent = ConsultAIAgent()
+    if args.command == "review":
+        job = agent.submit_review_batch(args.project, path=args.path, base=args.base, head=args.head)
+        print(f"Submitted batch {', '.join(job.batch_ids)}, state saved to {job.save()}")
+        if args.no_wait:
+            raise SystemExit(0)
+    else:
+        job = BatchJob.load(agent.client, args.state_file)
+    job.wait()
+    print(format_report(agent.review_batch_results(job)))
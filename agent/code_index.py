@@ -0,0 +1,374 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from agent.code_review import SKIP_DIRS, SOURCE_EXTENSIONS, chunk_source, inside_root
+from agent.prompt_builder import count_tokens
+from agent.response_cache import embed
+import agent.file_operations as file_operations
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+CODE_INDEX_DIR = os.environ.get("CODE_INDEX_DIR", os.path.join(os.getcwd(), "cache", "code_index"))
+CODE_INDEX_CHUNK_TOKENS = int(os.environ.get("CODE_INDEX_CHUNK_TOKENS", "400"))
+CODE_INDEX_EMBEDDINGS = os.environ.get("CODE_INDEX_EMBEDDINGS", "false").lower() == "true"
+CODE_CONTEXT_TOP_K = int(os.environ.get("CODE_CONTEXT_TOP_K", "5"))
+CODE_CONTEXT_TOKEN_BUDGET = int(os.environ.get("CODE_CONTEXT_TOKEN_BUDGET", "2000"))
+# How often a project's clone is checked for new commits while it is in use.
+CODE_INDEX_CHECK_INTERVAL = float(os.environ.get("CODE_INDEX_CHECK_INTERVAL", "60"))
+MAX_INDEXED_FILE_BYTES = 512 * 1024
+GIT_SYMLINK_MODE = "120000"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+EMBEDDING_WEIGHT = 0.5
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_CASE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text):
+    # Identifiers are indexed whole and by their snake_case/camelCase parts,
+    # so "load_context" matches both "load context" and "loadContext".
+    terms = []
+    for identifier in IDENTIFIER.findall(text):
+        lowered = identifier.lower()
+        terms.append(lowered)
+        parts = [p.lower() for piece in identifier.split("_") for p in CAMEL_CASE.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class IndexedChunk:
+    def __init__(self, path, start_line, end_line, text):
+        self.path = path
+        self.start_line = start_line
+        self.end_line = end_line
+        self.text = text
+        self.terms = Counter(tokenize(text) + tokenize(path))
+        self.length = sum(self.terms.values())
+
+
+# BM25 index over chunks of a cloned repository, optionally combined with a
+# NumPy matrix of locally computed embeddings. Files are tracked by their git
+# blob id, so an update after new commits only re-chunks the files that changed.
+# Saved as <project>.json (chunks and file ids; terms are re-derived on load)
+# plus <project>.npy for the embedding matrix.
+class CodeIndex:
+    def __init__(self, project_name, root=None, index_dir=None, use_embeddings=None):
+        self.project_name = project_name
+        self.root = root or file_operations.get_project_path(project_name)
+        self.index_dir = index_dir or CODE_INDEX_DIR
+        self.use_embeddings = (CODE_INDEX_EMBEDDINGS if use_embeddings is None else use_embeddings) and numpy is not None
+        self.revision = None
+        self.files = {}
+        self.chunks = {}
+        self.postings = defaultdict(set)
+        self.total_length = 0
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids = []
+        self.ready = False
+        # Guards the searchable state; held only to swap in what update()
+        # built, so searches are not blocked while files are re-chunked.
+        self._lock = threading.RLock()
+        self._update_lock = threading.Lock()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.index_dir, f"{self.project_name}.json")
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.index_dir, f"{self.project_name}.npy")
+
+    def _current_revision(self):
+        try:
+            result = subprocess.run(['git', '-C', self.root, 'rev-parse', 'HEAD'], check=True, capture_output=True, text=True)
+            return result.stdout.strip()
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            return None
+
+    def _tracked_files(self):
+        # path -> content id. Git blob ids are free; outside git hash the file.
+        # Symlinks are never indexed: they can point outside the clone.
+        try:
+            result = subprocess.run(['git', '-C', self.root, 'ls-files', '-s'], check=True, capture_output=True, text=True)
+            files = {}
+            for line in result.stdout.splitlines():
+                meta, path = line.split("\t", 1)
+                mode, content_id = meta.split()[:2]
+                if mode != GIT_SYMLINK_MODE and os.path.splitext(path)[1] in SOURCE_EXTENSIONS:
+                    files[path] = content_id
+            return files
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            files = {}
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and inside_root(self.root, os.path.join(dirpath, d))]
+                for filename in filenames:
+                    full_path = os.path.join(dirpath, filename)
+                    if os.path.splitext(filename)[1] in SOURCE_EXTENSIONS and inside_root(self.root, full_path):
+                        with open(full_path, 'rb') as f:
+                            files[os.path.relpath(full_path, self.root)] = hashlib.sha1(f.read()).hexdigest()
+            return files
+
+    def is_stale(self):
+        revision = self._current_revision()
+        if revision is None:
+            # Not a git checkout: index once, refresh only on explicit update().
+            return not self.files
+        return revision != self.revision
+
+    def update(self):
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(f"Project clone not found: {self.root}")
+        with self._update_lock:
+            revision = self._current_revision()
+            tracked = self._tracked_files()
+            with self._lock:
+                files = dict(self.files)
+            changed = [path for path in files if tracked.get(path) != files[path][0]]
+            added = [path for path in tracked if path not in files or tracked[path] != files[path][0]]
+            built = {path: self._chunk_file(path) for path in added}
+            with self._lock:
+                for path in changed:
+                    self._remove_file(path)
+                for path, chunks in built.items():
+                    if chunks is not None:
+                        self._add_chunks(path, tracked[path], chunks)
+                self.revision = revision
+                self.ready = True
+            if self.use_embeddings:
+                self._embed_new_chunks()
+            logger.info(f"Indexed {self.project_name} at {revision}: {len(added)} files (re)indexed, {len(self.chunks)} chunks total")
+            return len(added)
+
+    def _chunk_file(self, path):
+        # The file's chunks, or None if it is not indexed (and retried next update).
+        full_path = os.path.join(self.root, path)
+        if not inside_root(self.root, full_path):
+            logger.warning(f"Skipping {path} while indexing: symlink or outside the project")
+            return None
+        try:
+            if os.path.getsize(full_path) > MAX_INDEXED_FILE_BYTES:
+                return None
+            with open(full_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Skipping {path} while indexing: {e}")
+            return None
+        return [IndexedChunk(path, chunk.start_line, chunk.end_line, chunk.text) for chunk in chunk_source(path, text, CODE_INDEX_CHUNK_TOKENS)]
+
+    def _add_chunks(self, path, content_id, chunks):
+        chunk_ids = []
+        for indexed in chunks:
+            chunk_id = self._next_id
+            self._next_id += 1
+            self.chunks[chunk_id] = indexed
+            self.total_length += indexed.length
+            for term in indexed.terms:
+                self.postings[term].add(chunk_id)
+            chunk_ids.append(chunk_id)
+        self.files[path] = (content_id, chunk_ids)
+
+    def _remove_file(self, path):
+        _, chunk_ids = self.files.pop(path)
+        for chunk_id in chunk_ids:
+            indexed = self.chunks.pop(chunk_id)
+            self.total_length -= indexed.length
+            for term in indexed.terms:
+                postings = self.postings[term]
+                postings.discard(chunk_id)
+                if not postings:
+                    del self.postings[term]
+
+    def _bm25(self, terms):
+        scores = defaultdict(float)
+        count = len(self.chunks)
+        average_length = self.total_length / count if count else 0
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id in postings:
+                chunk = self.chunks[chunk_id]
+                tf = chunk.terms[term]
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / average_length))
+        return scores
+
+    def _embed_new_chunks(self):
+        # Embeds the chunks update() added without holding the lock; the
+        # matrix is swapped in unless the chunks changed in the meantime.
+        with self._lock:
+            ids = list(self.chunks)
+            rows = dict(zip(self._matrix_ids, self._matrix)) if self._matrix is not None else {}
+            texts = {i: self.chunks[i].text for i in ids if i not in rows}
+        rows.update((i, embed(text)) for i, text in texts.items())
+        matrix = numpy.array([rows[i] for i in ids], dtype=numpy.float32)
+        with self._lock:
+            if list(self.chunks) == ids:
+                self._matrix_ids, self._matrix = ids, matrix
+
+    def _ensure_matrix(self):
+        # Rows of chunks that survived an update are reused; only new chunks
+        # are embedded.
+        ids = list(self.chunks)
+        if self._matrix is not None and self._matrix_ids == ids:
+            return
+        rows = dict(zip(self._matrix_ids, self._matrix)) if self._matrix is not None else {}
+        self._matrix_ids = ids
+        self._matrix = numpy.array([rows[i] if i in rows else embed(self.chunks[i].text) for i in ids], dtype=numpy.float32)
+
+    def _embedding_scores(self, query):
+        self._ensure_matrix()
+        if not self._matrix_ids:
+            return {}
+        similarities = self._matrix @ numpy.array(embed(query), dtype=numpy.float32)
+        return dict(zip(self._matrix_ids, similarities.tolist()))
+
+    def search(self, query, k=None):
+        k = k or CODE_CONTEXT_TOP_K
+        with self._lock:
+            scores = self._bm25(tokenize(query))
+            if self.use_embeddings and self.chunks:
+                top = max(scores.values()) if scores else 0
+                for chunk_id, similarity in self._embedding_scores(query).items():
+                    normalized = scores.get(chunk_id, 0) / top if top else 0
+                    scores[chunk_id] = normalized + EMBEDDING_WEIGHT * max(similarity, 0)
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [self.chunks[chunk_id] for chunk_id, score in ranked if score > 0]
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            state = {
+                "revision": self.revision,
+                "next_id": self._next_id,
+                "files": {path: [content_id, chunk_ids] for path, (content_id, chunk_ids) in self.files.items()},
+                "chunks": [[chunk_id, c.path, c.start_line, c.end_line, c.text] for chunk_id, c in self.chunks.items()],
+                "matrix_ids": [],
+            }
+            if self.use_embeddings:
+                self._ensure_matrix()
+                state["matrix_ids"] = self._matrix_ids
+                tmp_path = self.vectors_path + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    numpy.save(f, self._matrix, allow_pickle=False)
+                os.replace(tmp_path, self.vectors_path)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.index_path)
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return False
+        with self._lock:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable code index {self.index_path}: {e}")
+                return False
+            self.revision = state["revision"]
+            self._next_id = state["next_id"]
+            self.files = {path: (content_id, chunk_ids) for path, (content_id, chunk_ids) in state["files"].items()}
+            self.chunks, self.postings, self.total_length = {}, defaultdict(set), 0
+            for chunk_id, path, start_line, end_line, text in state["chunks"]:
+                indexed = IndexedChunk(path, start_line, end_line, text)
+                self.chunks[chunk_id] = indexed
+                self.total_length += indexed.length
+                for term in indexed.terms:
+                    self.postings[term].add(chunk_id)
+            self._matrix, self._matrix_ids = None, []
+            if self.use_embeddings and state["matrix_ids"] and os.path.exists(self.vectors_path):
+                matrix = numpy.load(self.vectors_path, allow_pickle=False)
+                if len(matrix) == len(state["matrix_ids"]):
+                    self._matrix, self._matrix_ids = matrix, state["matrix_ids"]
+            self.ready = True
+        return True
+
+
+# One CodeIndex per project, loaded from disk and refreshed when the clone's
+# HEAD moves. Loading, building and HEAD checks run on a background thread, at
+# most every CODE_INDEX_CHECK_INTERVAL seconds per project, so a message never
+# waits for them: retrieval is skipped until the first build has finished.
+class CodeIndexRegistry:
+    def __init__(self, index_dir=None):
+        self.index_dir = index_dir or CODE_INDEX_DIR
+        self.indexes = {}
+        self._checked_at = {}
+        self._building = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="consultai-indexer")
+
+    def get(self, project_name):
+        # The project's index if it can be searched yet, otherwise None.
+        now = time.monotonic()
+        with self._lock:
+            index = self.indexes.get(project_name)
+            if index is None:
+                index = self.indexes[project_name] = CodeIndex(project_name, index_dir=self.index_dir)
+            checked_at = self._checked_at.get(project_name)
+            if project_name not in self._building and (checked_at is None or now - checked_at >= CODE_INDEX_CHECK_INTERVAL):
+                self._building.add(project_name)
+                self._checked_at[project_name] = now
+                self._executor.submit(self._refresh, index)
+        return index if index.ready else None
+
+    def refresh(self, project_name):
+        # Checks the clone on the next get(), e.g. right after a clone or pull.
+        with self._lock:
+            self._checked_at.pop(project_name, None)
+        return self.get(project_name)
+
+    def _refresh(self, index):
+        try:
+            if not index.ready:
+                index.load()
+            if index.is_stale():
+                index.update()
+                index.save()
+        except Exception as e:
+            logger.error(f"Error indexing {index.project_name}: {e}")
+        finally:
+            with self._lock:
+                self._building.discard(index.project_name)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def has_clone(self, project_name):
+        return bool(project_name) and os.path.isdir(file_operations.get_project_path(project_name))
+
+    def retrieve(self, project_name, query, k=None, token_budget=None):
+        # Top-k chunks for the query as a prompt section, within a token budget.
+        if not self.has_clone(project_name):
+            return ""
+        index = self.get(project_name)
+        if index is None:
+            return ""
+        token_budget = token_budget or CODE_CONTEXT_TOKEN_BUDGET
+        sections, used = [], 0
+        for chunk in index.search(query, k):
+            section = f"--- {chunk.path} (lines {chunk.start_line}-{chunk.end_line})\n{chunk.text}"
+            tokens = count_tokens(section)
+            if used + tokens > token_budget:
+                continue
+            sections.append(section)
+            used += tokens
+        return "\n".join(sections)
@@ -0,0 +1,400 @@
+import ast
+import logging
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from agent.prompt_builder import count_tokens
+from agent.response_cache import ResponseCache
+from agent.metrics import metrics
+import agent.file_operations as file_operations
+
+logger = logging.getLogger(__name__)
+
+REVIEW_MODEL = os.environ.get("REVIEW_MODEL")
+REVIEW_MAX_WORKERS = int(os.environ.get("REVIEW_MAX_WORKERS", "8"))
+REVIEW_CHUNK_TOKENS = int(os.environ.get("REVIEW_CHUNK_TOKENS", "3000"))
+REVIEW_DIFF_CONTEXT_LINES = int(os.environ.get("REVIEW_DIFF_CONTEXT_LINES", "10"))
+REVIEW_FINDINGS_CACHE_PATH = os.environ.get("REVIEW_FINDINGS_CACHE_PATH", os.path.join(os.getcwd(), "cache", "review_findings.db"))
+REVIEW_FINDINGS_TTL = float(os.environ.get("REVIEW_FINDINGS_TTL", str(30 * 86400)))
+REVIEW_FINDINGS_MAX_ENTRIES = int(os.environ.get("REVIEW_FINDINGS_MAX_ENTRIES", "20000"))
+
+REVIEW_SYSTEM_MESSAGE = (
+    "You are a code review assistant. You are shown one excerpt of a larger file. "
+    "List concrete problems (bugs, security, performance, style) as bullet points, "
+    "each starting with the line number it refers to. "
+    "If the excerpt has no problems, reply with exactly: No issues."
+)
+HUNK_SYSTEM_MESSAGE = (
+    "You are a code review assistant. You are shown one hunk of a unified diff with "
+    "surrounding context. Review only the added and changed lines (prefixed with '+'). "
+    "List concrete problems (bugs, security, performance, style) as bullet points, "
+    "quoting the line each one refers to. "
+    "If the change has no problems, reply with exactly: No issues."
+)
+NO_ISSUES = "no issues"
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+SOURCE_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".kt", ".go", ".rb", ".rs", ".c", ".h",
+    ".cc", ".cpp", ".hpp", ".cs", ".php", ".swift", ".scala", ".sh", ".sql",
+}
+SKIP_DIRS = {".git", "node_modules", "venv", ".venv", "__pycache__", "dist", "build"}
+
+
+# False for symlinks and for anything that resolves outside the clone, so a
+# repository cannot point a review at the bot's own files (.env, /proc, ...).
+def inside_root(root, path):
+    if os.path.islink(path):
+        return False
+    real_root = os.path.realpath(root)
+    real_path = os.path.realpath(path)
+    return real_path == real_root or real_path.startswith(real_root + os.sep)
+
+# A line at column 0 that starts a definition in most C-like and scripting languages.
+TOP_LEVEL_DEFINITION = re.compile(
+    r"^(?:export\s+|public\s+|private\s+|protected\s+|static\s+|async\s+|abstract\s+|final\s+)*"
+    r"(?:def|class|function|func|fn|interface|struct|enum|impl|module|type|const|let|var)\b"
+)
+
+
+class DiffHunk:
+    def __init__(self, path, start_line, line_count, body):
+        self.path = path
+        self.start_line = start_line
+        self.line_count = line_count
+        self.body = body
+
+    @property
+    def end_line(self):
+        return self.start_line + max(self.line_count, 1) - 1
+
+    def has_additions(self):
+        return any(line.startswith("+") for line in self.body.splitlines())
+
+
+def parse_diff(diff_text):
+    # Splits `git diff` output into hunks. The @@ header is kept out of the body
+    # so the same change reviewed at a different position hashes the same.
+    hunks = []
+    path = None
+    current = None
+    for line in diff_text.splitlines(keepends=True):
+        if line.startswith("diff --git "):
+            current = None
+            path = None
+        elif line.startswith("+++ ") and current is None:
+            target = line[4:].strip()
+            path = None if target == "/dev/null" else target[2:] if target.startswith("b/") else target
+        elif line.startswith("@@"):
+            match = HUNK_HEADER.match(line)
+            if match and path:
+                current = DiffHunk(path, int(match.group(1)), int(match.group(2) or 1), "")
+                hunks.append(current)
+            else:
+                current = None
+        elif current is not None and line[:1] in (" ", "+", "-", "\\"):
+            current.body += line
+    return hunks
+
+
+class CodeChunk:
+    def __init__(self, path, start_line, end_line, text):
+        self.path = path
+        self.start_line = start_line
+        self.end_line = end_line
+        self.text = text
+
+
+def _python_boundaries(text):
+    # Start lines of every top level statement and of every method, so a
+    # large class can be split between methods. Decorators belong to the
+    # function or class they decorate.
+    tree = ast.parse(text)
+    starts = []
+    nodes = list(tree.body)
+    while nodes:
+        node = nodes.pop()
+        decorators = getattr(node, "decorator_list", [])
+        starts.append(min([node.lineno] + [d.lineno for d in decorators]))
+        if isinstance(node, ast.ClassDef):
+            nodes.extend(n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)))
+    return starts
+
+
+def _generic_boundaries(lines):
+    return [i + 1 for i, line in enumerate(lines) if TOP_LEVEL_DEFINITION.match(line)]
+
+
+def _split_units(path, text):
+    lines = text.splitlines(keepends=True)
+    starts = None
+    if path.endswith(".py"):
+        try:
+            starts = _python_boundaries(text)
+        except SyntaxError:
+            starts = None
+    if starts is None:
+        starts = _generic_boundaries(lines)
+    starts = sorted(set([1] + [s for s in starts if 1 <= s <= len(lines)]))
+    ends = [s - 1 for s in starts[1:]] + [len(lines)]
+    return [(start, end, "".join(lines[start - 1:end])) for start, end in zip(starts, ends)]
+
+
+def chunk_source(path, text, max_tokens=None, model=None):
+    # Packs consecutive definitions into chunks of at most max_tokens. A single
+    # definition that is bigger than that is split on line boundaries.
+    max_tokens = max_tokens or REVIEW_CHUNK_TOKENS
+    chunks = []
+    current = []
+
+    def flush():
+        if current:
+            chunks.append(CodeChunk(path, current[0][0], current[-1][1], "".join(unit[2] for unit in current)))
+            current.clear()
+
+    current_tokens = 0
+    for start, end, unit_text in _split_units(path, text):
+        tokens = count_tokens(unit_text, model)
+        if tokens > max_tokens:
+            flush()
+            current_tokens = 0
+            chunks.extend(_split_lines(path, start, unit_text, max_tokens, model))
+            continue
+        if current_tokens + tokens > max_tokens:
+            flush()
+            current_tokens = 0
+        current.append((start, end, unit_text))
+        current_tokens += tokens
+    flush()
+    return chunks
+
+
+def _split_lines(path, first_line, text, max_tokens, model):
+    chunks = []
+    buffer, buffer_tokens, start = [], 0, first_line
+    for offset, line in enumerate(text.splitlines(keepends=True)):
+        tokens = count_tokens(line, model)
+        if buffer and buffer_tokens + tokens > max_tokens:
+            chunks.append(CodeChunk(path, start, first_line + offset - 1, "".join(buffer)))
+            buffer, buffer_tokens, start = [], 0, first_line + offset
+        buffer.append(line)
+        buffer_tokens += tokens
+    if buffer:
+        chunks.append(CodeChunk(path, start, start + len(buffer) - 1, "".join(buffer)))
+    return chunks
+
+
+def _numbered(chunk):
+    return "".join(f"{chunk.start_line + i}: {line}" for i, line in enumerate(chunk.text.splitlines(keepends=True)))
+
+
+# Reviews files by splitting them at function/class boundaries and sending the
+# chunks to the model concurrently, then stitches the findings back together
+# per file in line order.
+class ReviewEngine:
+    def __init__(self, agent, max_workers=None, chunk_tokens=None, model=None, findings_cache=None):
+        self.agent = agent
+        self.max_workers = max_workers or REVIEW_MAX_WORKERS
+        self.chunk_tokens = chunk_tokens or REVIEW_CHUNK_TOKENS
+        # A fixed model (argument or REVIEW_MODEL) opts out of routing;
+        # otherwise the router's review tier is used, with its fallbacks.
+        model = model or REVIEW_MODEL
+        self.models = [model] if model else agent.router.route("review")
+        self.model = self.models[0]
+        self._findings_cache = findings_cache
+
+    @property
+    def findings_cache(self):
+        # Per-hunk findings keyed by hunk content; opened on first diff review.
+        if self._findings_cache is None:
+            # Exact matches only: a similar-looking hunk is not the same change.
+            self._findings_cache = ResponseCache(db_path=REVIEW_FINDINGS_CACHE_PATH, ttl=REVIEW_FINDINGS_TTL,
+                                                 max_entries=REVIEW_FINDINGS_MAX_ENTRIES, semantic_threshold=0)
+        return self._findings_cache
+
+    def chunk_messages(self, chunk):
+        prompt = f"File: {chunk.path} (lines {chunk.start_line}-{chunk.end_line})\n\n{_numbered(chunk)}"
+        return [
+            {"role": "system", "content": REVIEW_SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}
+        ]
+
+    def review_chunk(self, chunk, namespace=None):
+        try:
+            review = self.agent.complete(self.models, self.chunk_messages(chunk), namespace=namespace)
+        except Exception as e:
+            logger.error(f"Error reviewing {chunk.path}:{chunk.start_line}: {e}")
+            review = f"Error reviewing this section: {str(e)}"
+        return {"path": chunk.path, "start_line": chunk.start_line, "end_line": chunk.end_line, "review": review}
+
+    def review_chunks(self, chunks, namespace=None):
+        if not chunks:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            results = list(executor.map(lambda chunk: self.review_chunk(chunk, namespace), chunks))
+        return sorted(results, key=lambda r: (r["path"], r["start_line"]))
+
+    def chunk_files(self, root, relative_paths, revision=None):
+        # Reads the working tree, or the files as committed in `revision`.
+        chunks = []
+        for relative_path in relative_paths:
+            if revision:
+                try:
+                    text = read_blob(root, revision, relative_path)
+                except (UnicodeDecodeError, RuntimeError) as e:
+                    logger.warning(f"Skipping {relative_path}: {e}")
+                    continue
+            else:
+                full_path = os.path.join(root, relative_path)
+                if not inside_root(root, full_path):
+                    logger.warning(f"Skipping {relative_path}: symlink or outside the project")
+                    continue
+                try:
+                    with open(full_path, 'r', encoding='utf-8') as f:
+                        text = f.read()
+                except (UnicodeDecodeError, FileNotFoundError, IsADirectoryError) as e:
+                    logger.warning(f"Skipping {relative_path}: {e}")
+                    continue
+            if text.strip():
+                chunks.extend(chunk_source(relative_path, text, self.chunk_tokens, self.model))
+        return chunks
+
+    def review_files(self, root, relative_paths, namespace=None, revision=None):
+        chunks = self.chunk_files(root, relative_paths, revision)
+        logger.info(f"Reviewing {len(relative_paths)} files as {len(chunks)} chunks with {self.max_workers} workers")
+        return self.review_chunks(chunks, namespace)
+
+    def project_files(self, project_name, path=""):
+        # One file or every source file below a directory of the clone,
+        # relative to the clone's root.
+        root = file_operations.get_project_path(project_name)
+        start = os.path.normpath(os.path.join(root, path))
+        if os.path.relpath(start, root).startswith("..") or not inside_root(root, start):
+            raise FileNotFoundError(f"Path is outside project {project_name}: {path}")
+        if os.path.isfile(start):
+            return root, [os.path.relpath(start, root)]
+        if not os.path.isdir(start):
+            raise FileNotFoundError(f"Path not found in project {project_name}: {path}")
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(start):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and inside_root(root, os.path.join(dirpath, d))]
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                if os.path.splitext(filename)[1] in SOURCE_EXTENSIONS and inside_root(root, full_path):
+                    paths.append(os.path.relpath(full_path, root))
+        return root, sorted(paths)
+
+    def review_path(self, project_name, path=""):
+        root, paths = self.project_files(project_name, path)
+        return self.review_files(root, paths, namespace=project_name)
+
+    def review_diff(self, project_name, base, head="HEAD"):
+        # The files as of `head`, not whatever is checked out in the clone.
+        root = file_operations.get_project_path(project_name)
+        head_sha = verify_ref(root, head)
+        paths = changed_files(root, base, head_sha)
+        return self.review_files(root, paths, namespace=project_name, revision=head_sha)
+
+
+    def review_hunk(self, hunk):
+        # Keyed by the whole prompt, so the same hunk body in another file is
+        # reviewed on its own.
+        prompt = f"File: {hunk.path}\n\n```diff\n{hunk.body}```"
+        cached = self.findings_cache.get(self.model, HUNK_SYSTEM_MESSAGE, prompt)
+        metrics.inc("consultai_cache_requests_total", cache="review_findings", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return {"path": hunk.path, "start_line": hunk.start_line, "end_line": hunk.end_line, "review": cached, "cached": True}
+        try:
+            review = self.agent.complete(
+                self.models,
+                [
+                    {"role": "system", "content": HUNK_SYSTEM_MESSAGE},
+                    {"role": "user", "content": prompt}
+                ],
+                cache=False
+            )
+            self.findings_cache.set(self.model, HUNK_SYSTEM_MESSAGE, prompt, review)
+        except Exception as e:
+            logger.error(f"Error reviewing hunk {hunk.path}:{hunk.start_line}: {e}")
+            review = f"Error reviewing this change: {str(e)}"
+        return {"path": hunk.path, "start_line": hunk.start_line, "end_line": hunk.end_line, "review": review, "cached": False}
+
+    def review_changes(self, project_name, base, head="HEAD", context_lines=None):
+        # Reviews only the hunks changed between two revisions. Findings are
+        # cached by hunk content, so re-running after a small follow-up commit
+        # only sends the hunks that actually changed.
+        root = file_operations.get_project_path(project_name)
+        context_lines = REVIEW_DIFF_CONTEXT_LINES if context_lines is None else context_lines
+        hunks = [hunk for hunk in parse_diff(git_diff(root, base, head, context_lines)) if hunk.has_additions()]
+        if not hunks:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(hunks))) as executor:
+            results = list(executor.map(self.review_hunk, hunks))
+        reused = sum(1 for result in results if result["cached"])
+        logger.info(f"Reviewed {len(hunks)} hunks in {base}..{head}, {reused} from cache")
+        return sorted(results, key=lambda r: (r["path"], r["start_line"]))
+
+
+def git_diff(root, base, head="HEAD", context_lines=REVIEW_DIFF_CONTEXT_LINES):
+    revisions = f"{verify_ref(root, base)}..{verify_ref(root, head)}"
+    try:
+        result = subprocess.run(
+            ['git', '-C', root, 'diff', '--no-color', '--no-ext-diff', f"-U{int(context_lines)}", '--end-of-options', revisions],
+            check=True, capture_output=True, text=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to compute diff {base}..{head}: {e.stderr.strip()}")
+    return result.stdout
+
+
+def verify_ref(root, ref):
+    # Refs come from Slack messages: refuse anything git could read as an
+    # option, and resolve the rest to a commit id before using it.
+    if not ref or ref.startswith("-"):
+        raise RuntimeError(f"Invalid revision: {ref!r}")
+    try:
+        result = subprocess.run(
+            ['git', '-C', root, 'rev-parse', '--verify', '--quiet', '--end-of-options', f"{ref}^{{commit}}"],
+            check=True, capture_output=True, text=True
+        )
+    except subprocess.CalledProcessError:
+        raise RuntimeError(f"Unknown revision: {ref}")
+    return result.stdout.strip()
+
+
+def read_blob(root, revision, path):
+    # The contents of `path` as committed in `revision` (a resolved commit id).
+    try:
+        result = subprocess.run(['git', '-C', root, 'cat-file', 'blob', f"{revision}:{path}"], check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to read {path} at {revision}: {e.stderr.decode(errors='replace').strip()}")
+    return result.stdout.decode('utf-8')
+
+
+def changed_files(root, base, head="HEAD"):
+    revisions = f"{verify_ref(root, base)}..{verify_ref(root, head)}"
+    try:
+        result = subprocess.run(
+            ['git', '-C', root, 'diff', '--name-only', '--diff-filter=d', '--end-of-options', revisions],
+            check=True, capture_output=True, text=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to compute diff {base}..{head}: {e.stderr.strip()}")
+    return [line for line in result.stdout.splitlines() if line.strip()]
+
+
+def format_report(results):
+    sections = []
+    current_path = None
+    for result in results:
+        if result["review"].strip().rstrip(".").lower() == NO_ISSUES:
+            continue
+        if result["path"] != current_path:
+            current_path = result["path"]
+            sections.append(f"*{current_path}*")
+        sections.append(f"_Lines {result['start_line']}-{result['end_line']}_\n{result['review'].strip()}")
+    if not sections:
+        return "No issues found."
+    return "\n\n".join(sections)
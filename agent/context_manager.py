@@ -1,54 +1,59 @@
-import json
+import copy
 import os
 import logging
+from agent.context_store import create_store
+from agent.context_schema import compile_template, load_schema
+from agent.metrics import metrics
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class ContextManager:
-    def __init__(self, storage_dir='./contexts', template_file='contexts/templates/context_template.json'):
+    def __init__(self, storage_dir='./contexts', template_file='contexts/templates/context_template.json', context_template=None, shared_contexts=None, store=None, schema=None):
         self.storage_dir = storage_dir
         self.template_file = template_file
         self.current_context = None
         self.current_project = None
+        self.save_listeners = []
+        # Loaded contexts may be shared with other sessions through
+        # shared_contexts; they are copied before the first local change.
+        self.shared_contexts = shared_contexts
+        self.context_is_shared = False
         os.makedirs(storage_dir, exist_ok=True)
-        self.context_template = self.load_template()
-
-    def load_template(self):
+        self.store = store if store is not None else create_store(storage_dir)
+        # The compiled schema is cached per template and shared by every session.
+        if schema is None:
+            schema = compile_template(context_template) if context_template is not None else self.load_schema()
+        self.schema = schema
+        self.context_template = schema.template
+
+    def load_schema(self):
         try:
-            with open(self.template_file, 'r') as f:
-                return json.load(f)
+            return load_schema(self.template_file)
         except FileNotFoundError:
             raise FileNotFoundError(f"Template file not found: {self.template_file}")
 
+    def load_template(self):
+        return self.load_schema().template
+
     def new_context(self, project_name):
-        self.current_context = self._create_context_from_template(self.context_template)
+        self.context_is_shared = False
+        self.current_context = self.schema.new_context()
         self.current_context['project']['name'] = project_name
         self.current_project = project_name
         logger.info(f"New context created for project: {self.current_project}")
 
     def _create_context_from_template(self, template):
-        context = {}
-        for key, value in template.items():
-            if isinstance(value, dict):
-                if 'value' in value:
-                    context[key] = value['value']
-                else:
-                    context[key] = self._create_context_from_template(value)
-            else:
-                context[key] = value
-        return context
+        return compile_template(template).new_context()
 
     def delete_context(self, project_name):
-        file_path = os.path.join(self.storage_dir, f"{project_name}.json")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            if self.current_project == project_name:
-                self.current_context = None
-                self.current_project = None
-        else:
-            raise FileNotFoundError(f"No context found for project: {project_name}")
+        self.store.delete(project_name)
+        if self.shared_contexts is not None:
+            self.shared_contexts.discard(project_name)
+        self._notify_save(project_name)
+        if self.current_project == project_name:
+            self.current_context = None
+            self.current_project = None
+            self.context_is_shared = False
 
     def has_active_context(self):
         return self.current_context is not None and self.current_project is not None
@@ -58,26 +63,69 @@ class ContextManager:
             raise ValueError("No active context to save: current_context is None")
         if not self.current_project:
             raise ValueError("No active context to save: current_project is None")
-        file_path = os.path.join(self.storage_dir, f"{self.current_project}.json")
-        with open(file_path, 'w') as f:
-            json.dump(self.current_context, f, indent=2)
+        with metrics.stage("context_store_write"):
+            self.store.save(self.current_project, self.current_context)
+        if self.shared_contexts is not None:
+            self.shared_contexts.put(self.current_project, self.current_context)
+            self.context_is_shared = True
+        self._notify_save(self.current_project)
+
+    def _notify_save(self, project_name):
+        for listener in self.save_listeners:
+            try:
+                listener(project_name)
+            except Exception as e:
+                logger.error(f"Error in context save listener: {e}")
 
     def load_context(self, project_name):
-        file_path = os.path.join(self.storage_dir, f"{project_name}.json")
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"No context found for project: {project_name}")
-        with open(file_path, 'r') as f:
-            self.current_context = json.load(f)
+        with metrics.stage("context_load"):
+            if self.shared_contexts is not None:
+                self.current_context = self.shared_contexts.get(project_name, self._read_context)
+                self.context_is_shared = True
+            else:
+                self.current_context = self._read_context(project_name)
         self.current_project = project_name
 
+    def _read_context(self, project_name):
+        with metrics.stage("context_store_read"):
+            return self.store.load(project_name)
+
+    def _make_context_private(self):
+        if self.context_is_shared:
+            self.current_context = copy.deepcopy(self.current_context)
+            self.context_is_shared = False
+
     def get_current_context(self):
         return self.current_context
 
     def list_projects(self):
-        return [f.split('.')[0] for f in os.listdir(self.storage_dir) if f.endswith('.json')]
-
-    def set_param(self, param_path, value):
-        keys = param_path.split('.')
+        return self.store.list_projects()
+
+    def set_param(self, param_path, value, persist=False):
+        # Template fields are coerced to their type; raises ValueError if invalid.
+        value = self.schema.coerce(param_path, value)
+        self._make_context_private()
+        self._assign(param_path, value)
+        # Write just this value through to an already saved project.
+        if persist and self.current_project and self.store.exists(self.current_project):
+            self.store.update_param(self.current_project, param_path, value)
+            self._after_persist()
+        return value
+
+    def update_params(self, updates, persist=False):
+        # Validates every value before changing anything.
+        updates = self.schema.validate(updates)
+        self._make_context_private()
+        for param_path, value in updates.items():
+            self._assign(param_path, value)
+        if persist and self.current_project and self.store.exists(self.current_project):
+            with metrics.stage("context_store_write"):
+                self.store.save(self.current_project, self.current_context)
+            self._after_persist()
+        return updates
+
+    def _assign(self, param_path, value):
+        keys = self.schema.split(param_path)
         d = self.current_context
         for key in keys[:-1]:
             if key not in d:
@@ -85,10 +133,16 @@ class ContextManager:
             d = d[key]
         d[keys[-1]] = value
 
+    def _after_persist(self):
+        if self.shared_contexts is not None:
+            self.shared_contexts.put(self.current_project, self.current_context)
+            self.context_is_shared = True
+        self._notify_save(self.current_project)
+
     def get_param(self, param_path=None):
         if not param_path:
             return self.current_context
-        keys = param_path.split('.')
+        keys = self.schema.split(param_path)
         d = self.current_context
         for key in keys:
             if key not in d:
@@ -98,9 +152,13 @@ class ContextManager:
 
     def clear_param(self, param_path=None):
         if not param_path:
-            self.__init__()  # Reset to initial empty state
+            # Reset to initial empty state
+            self.current_context = None
+            self.current_project = None
+            self.context_is_shared = False
             return
-        keys = param_path.split('.')
+        self._make_context_private()
+        keys = self.schema.split(param_path)
         d = self.current_context
         for key in keys[:-1]:
             if key not in d:
@@ -125,18 +183,7 @@ class ContextManager:
     def setup_new_project(self, project_name):
         logger.info(f"Setting up new project: {project_name}")
         self.new_context(project_name)
-        return self._generate_questions(self.context_template)
-
-    def _generate_questions(self, template, prefix=''):
-        questions = []
-        for key, value in template.items():
-            if isinstance(value, dict):
-                if 'value' in value and 'question' in value:
-                    questions.append({
-                        "type": prefix,
-                        "field": key,
-                        "question": value['question']
-                    })
-                else:
-                    questions.extend(self._generate_questions(value, f"{prefix}.{key}" if prefix else key))
-        return questions
+        return self.schema.question_plan()
+
+    def _generate_questions(self, template):
+        return compile_template(template).question_plan()
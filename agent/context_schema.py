@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+FIELD_TYPES = ("text", "list", "integer", "boolean")
+EMPTY_ANSWERS = ("", "none", "n/a", "-")
+# Compiled schemas kept per cache; templates rarely number more than a few.
+SCHEMA_CACHE_SIZE = 32
+
+
+class FieldSpec:
+    __slots__ = ("path", "keys", "default", "question", "type", "choices", "required")
+
+    def __init__(self, path, keys, spec):
+        self.path = path
+        self.keys = keys
+        self.default = spec["value"]
+        self.question = spec.get("question")
+        self.type = spec.get("type") or ("list" if isinstance(self.default, list) else "text")
+        if self.type not in FIELD_TYPES:
+            raise ValueError(f"Unknown type '{self.type}' for template field {path}")
+        self.choices = spec.get("choices")
+        self.required = spec.get("required", False)
+
+    def coerce(self, value):
+        # Turns a free-text answer into the field's type; raises ValueError.
+        if isinstance(value, str):
+            value = value.strip()
+            if value.lower() in EMPTY_ANSWERS:
+                if self.required:
+                    raise ValueError(f"{self.path} is required")
+                return [] if self.type == "list" else None
+        if value is None or value == "":
+            if self.required:
+                raise ValueError(f"{self.path} is required")
+            return None
+        if self.type == "list":
+            items = value if isinstance(value, list) else str(value).split(",")
+            value = [str(item).strip() for item in items if str(item).strip()]
+        elif self.type == "integer":
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{self.path} must be a whole number")
+        elif self.type == "boolean":
+            if isinstance(value, str):
+                if value.lower() not in ("yes", "no", "true", "false"):
+                    raise ValueError(f"{self.path} must be yes or no")
+                value = value.lower() in ("yes", "true")
+            value = bool(value)
+        if self.choices:
+            values = value if isinstance(value, list) else [value]
+            invalid = [v for v in values if v not in self.choices]
+            if invalid:
+                raise ValueError(f"{self.path} must be one of: {', '.join(map(str, self.choices))}")
+        return value
+
+
+# A context template compiled once: every answerable field indexed by its
+# dotted path (with the path pre-split), the defaults serialized so a new
+# context is a single json.loads, and the setup questions in template order.
+# Schemas are immutable after compilation and shared by every session.
+class ContextSchema:
+    def __init__(self, template):
+        self.template = template
+        self.fields = {}
+        self.containers = set()
+        self.questions = []
+        self._compile(template, ())
+        self._defaults = json.dumps(self._build_defaults(template))
+        self._paths = {}
+
+    def _compile(self, template, prefix):
+        for key, value in template.items():
+            keys = prefix + (key,)
+            if not isinstance(value, dict):
+                continue
+            if "value" in value:
+                field = FieldSpec(".".join(keys), keys, value)
+                self.fields[field.path] = field
+                if field.question:
+                    self.questions.append({"type": ".".join(prefix), "field": key, "question": field.question})
+            else:
+                self.containers.add(".".join(keys))
+                self._compile(value, keys)
+
+    def _build_defaults(self, template):
+        context = {}
+        for key, value in template.items():
+            if isinstance(value, dict):
+                context[key] = value["value"] if "value" in value else self._build_defaults(value)
+            else:
+                context[key] = value
+        return context
+
+    def new_context(self):
+        return json.loads(self._defaults)
+
+    def question_plan(self):
+        return list(self.questions)
+
+    def split(self, param_path):
+        field = self.fields.get(param_path)
+        if field is not None:
+            return field.keys
+        keys = self._paths.get(param_path)
+        if keys is None:
+            keys = tuple(param_path.split("."))
+            if len(self._paths) < 1024:
+                self._paths[param_path] = keys
+        return keys
+
+    def coerce(self, param_path, value):
+        field = self.fields.get(param_path)
+        return field.coerce(value) if field is not None else value
+
+    def validate(self, updates):
+        # Coerces every value first and reports all problems at once, so a
+        # bulk update is applied entirely or not at all.
+        coerced, errors = {}, []
+        for param_path, value in updates.items():
+            try:
+                coerced[param_path] = self.coerce(param_path, value)
+            except ValueError as e:
+                errors.append(str(e))
+        if errors:
+            raise ValueError("; ".join(errors))
+        return coerced
+
+
+_compiled = OrderedDict()
+_loaded = OrderedDict()
+_schemas_lock = threading.Lock()
+
+
+def _remember(cache, key, value):
+    # Called with _schemas_lock held; least recently used entries go first.
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > SCHEMA_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def compile_template(template):
+    # Cached by identity: sessions are handed the same template dict. Only
+    # the last SCHEMA_CACHE_SIZE templates are kept.
+    with _schemas_lock:
+        entry = _compiled.get(id(template))
+        if entry is not None and entry[0] is template:
+            _compiled.move_to_end(id(template))
+            return entry[1]
+        return _remember(_compiled, id(template), (template, ContextSchema(template)))[1]
+
+
+def load_schema(template_file):
+    # Cached by path and modification time, so an edited template is picked up.
+    key = (os.path.abspath(template_file), os.stat(template_file).st_mtime)
+    with _schemas_lock:
+        schema = _loaded.get(key)
+        if schema is not None:
+            _loaded.move_to_end(key)
+    if schema is None:
+        with open(template_file, 'r') as f:
+            schema = ContextSchema(json.load(f))
+        with _schemas_lock:
+            schema = _loaded.get(key) or _remember(_loaded, key, schema)
+    return schema
@@ -0,0 +1,247 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_BACKEND = os.environ.get("CONTEXT_STORE", "json")
+DEFAULT_DB_PATH = os.environ.get("CONTEXT_DB_PATH", os.path.join("contexts", "contexts.db"))
+
+
+def _set_path(context, param_path, value):
+    keys = param_path.split('.')
+    d = context
+    for key in keys[:-1]:
+        if key not in d:
+            d[key] = {}
+        d = d[key]
+    d[keys[-1]] = value
+
+
+class ContextStore:
+    def load(self, project_name):
+        raise NotImplementedError
+
+    def save(self, project_name, context):
+        raise NotImplementedError
+
+    def delete(self, project_name):
+        raise NotImplementedError
+
+    def list_projects(self):
+        raise NotImplementedError
+
+    def exists(self, project_name):
+        return project_name in self.list_projects()
+
+    def metadata(self, project_name):
+        raise NotImplementedError
+
+    def update_param(self, project_name, param_path, value):
+        context = self.load(project_name)
+        _set_path(context, param_path, value)
+        self.save(project_name, context)
+
+    def close(self):
+        pass
+
+
+# The original layout: one contexts/<project>.json per project. Writes go to a
+# temp file that is renamed into place, and the project index is kept in
+# memory so listing projects does not read every file. Every write renames a
+# file in the directory, so the index is rebuilt whenever the directory's
+# mtime changes: other processes (run_agent.py --workers) see new projects.
+class JSONContextStore(ContextStore):
+    def __init__(self, storage_dir='./contexts'):
+        self.storage_dir = storage_dir
+        os.makedirs(storage_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_mtime = None
+
+    def _path(self, project_name):
+        return os.path.join(self.storage_dir, f"{project_name}.json")
+
+    def _load_index(self):
+        mtime = os.stat(self.storage_dir).st_mtime_ns
+        if self._index is None or mtime != self._index_mtime:
+            self._index_mtime = mtime
+            self._index = {}
+            for f in os.listdir(self.storage_dir):
+                if f.endswith('.json'):
+                    stat = os.stat(os.path.join(self.storage_dir, f))
+                    self._index[f[:-len('.json')]] = {"updated_at": stat.st_mtime, "size": stat.st_size}
+        return self._index
+
+    def _index_fresh(self):
+        return self._index is not None and os.stat(self.storage_dir).st_mtime_ns == self._index_mtime
+
+    def _after_write(self, was_fresh):
+        # Our own write moved the directory mtime. If the index was current
+        # just before it, adopting the new mtime avoids a full rescan on every
+        # save; otherwise another process wrote too, so rescan.
+        if was_fresh:
+            self._index_mtime = os.stat(self.storage_dir).st_mtime_ns
+        return self._load_index()
+
+    def load(self, project_name):
+        file_path = self._path(project_name)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"No context found for project: {project_name}")
+        with open(file_path, 'r') as f:
+            return json.load(f)
+
+    def save(self, project_name, context):
+        data = json.dumps(context, indent=2)
+        with self._lock:
+            was_fresh = self._index_fresh()
+            fd, tmp_path = tempfile.mkstemp(dir=self.storage_dir, prefix=f".{project_name}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self._path(project_name))
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._after_write(was_fresh)[project_name] = {"updated_at": time.time(), "size": len(data)}
+
+    def delete(self, project_name):
+        with self._lock:
+            file_path = self._path(project_name)
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"No context found for project: {project_name}")
+            was_fresh = self._index_fresh()
+            os.remove(file_path)
+            self._after_write(was_fresh).pop(project_name, None)
+
+    def list_projects(self):
+        with self._lock:
+            return sorted(self._load_index())
+
+    def exists(self, project_name):
+        with self._lock:
+            return project_name in self._load_index()
+
+    def metadata(self, project_name):
+        with self._lock:
+            if project_name not in self._load_index():
+                raise FileNotFoundError(f"No context found for project: {project_name}")
+            return dict(self._load_index()[project_name])
+
+
+# All projects in one SQLite database. Every write is a transaction, the
+# primary key doubles as the project index, and single parameters are updated
+# in place with json_set instead of rewriting the whole context.
+class SQLiteContextStore(ContextStore):
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS projects ("
+            "name TEXT PRIMARY KEY, data TEXT NOT NULL, created_at REAL, updated_at REAL)"
+        )
+        self._db.commit()
+
+    def load(self, project_name):
+        with self._lock:
+            row = self._db.execute("SELECT data FROM projects WHERE name = ?", (project_name,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No context found for project: {project_name}")
+        return json.loads(row[0])
+
+    def save(self, project_name, context):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO projects (name, data, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (project_name, json.dumps(context, separators=(",", ":")), now, now)
+            )
+
+    def delete(self, project_name):
+        with self._lock, self._db:
+            cursor = self._db.execute("DELETE FROM projects WHERE name = ?", (project_name,))
+        if cursor.rowcount == 0:
+            raise FileNotFoundError(f"No context found for project: {project_name}")
+
+    def list_projects(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT name FROM projects ORDER BY name")]
+
+    def exists(self, project_name):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM projects WHERE name = ?", (project_name,)).fetchone() is not None
+
+    def metadata(self, project_name):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT created_at, updated_at, length(data) FROM projects WHERE name = ?", (project_name,)
+            ).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No context found for project: {project_name}")
+        return {"created_at": row[0], "updated_at": row[1], "size": row[2]}
+
+    def update_param(self, project_name, param_path, value):
+        json_path = "$." + ".".join(f'"{key}"' for key in param_path.split('.'))
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE projects SET data = json_set(data, ?, json(?)), updated_at = ? WHERE name = ?",
+                (json_path, json.dumps(value), time.time(), project_name)
+            )
+        if cursor.rowcount == 0:
+            raise FileNotFoundError(f"No context found for project: {project_name}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def create_store(storage_dir='./contexts', backend=None):
+    backend = backend or DEFAULT_STORE_BACKEND
+    if backend == "json":
+        return JSONContextStore(storage_dir)
+    if backend == "sqlite":
+        return SQLiteContextStore(os.environ.get("CONTEXT_DB_PATH", os.path.join(storage_dir, "contexts.db")))
+    raise ValueError(f"Unknown context store backend: {backend}")
+
+
+def migrate_json_to_sqlite(storage_dir, db_path):
+    source = JSONContextStore(storage_dir)
+    target = SQLiteContextStore(db_path)
+    migrated = 0
+    try:
+        for project_name in source.list_projects():
+            target.save(project_name, source.load(project_name))
+            migrated += 1
+            logger.info(f"Migrated context for project: {project_name}")
+    finally:
+        target.close()
+    return migrated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Manage ConsultAIng project context storage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Copy JSON project contexts into a SQLite store")
+    migrate.add_argument("--from", dest="storage_dir", default="./contexts")
+    # The module-level default was read before .env was loaded.
+    migrate.add_argument("--to", dest="db_path", default=os.environ.get("CONTEXT_DB_PATH", DEFAULT_DB_PATH))
+    args = parser.parse_args()
+    count = migrate_json_to_sqlite(args.storage_dir, args.db_path)
+    print(f"Migrated {count} project contexts to {args.db_path}")
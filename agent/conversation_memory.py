@@ -0,0 +1,231 @@
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from agent.prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_RECENT_TURNS = int(os.environ.get("CONVERSATION_RECENT_TURNS", "6"))
+CONVERSATION_MAX_TOKENS = int(os.environ.get("CONVERSATION_MAX_TOKENS", "2000"))
+CONVERSATION_SUMMARY_TOKENS = int(os.environ.get("CONVERSATION_SUMMARY_TOKENS", "400"))
+CONVERSATION_IDLE_TTL = float(os.environ.get("CONVERSATION_IDLE_TTL", "3600"))
+CONVERSATION_MAX_THREADS = int(os.environ.get("CONVERSATION_MAX_THREADS", "1000"))
+COMPRESS_MIN_BYTES = 1024
+
+
+def truncate_tokens(text, max_tokens, keep="head"):
+    if count_tokens(text) <= max_tokens:
+        return text
+    # Cut by characters at ~4 per token, then trim until it fits.
+    size = max_tokens * 4
+    while size > 0:
+        cut = text[:size] if keep == "head" else text[-size:]
+        if count_tokens(cut) <= max_tokens:
+            return cut + " [...]" if keep == "head" else "[...] " + cut
+        size = int(size * 0.9)
+    return ""
+
+
+class Turn:
+    __slots__ = ("role", "tokens", "_data", "_compressed")
+
+    def __init__(self, role, content):
+        self.role = role
+        self.tokens = count_tokens(content)
+        data = content.encode()
+        # Long pastes are kept deflated; most turns are short and stay as-is.
+        self._compressed = len(data) >= COMPRESS_MIN_BYTES
+        self._data = zlib.compress(data) if self._compressed else data
+
+    @property
+    def content(self):
+        return (zlib.decompress(self._data) if self._compressed else self._data).decode()
+
+    def to_message(self):
+        return {"role": self.role, "content": self.content}
+
+
+class ConversationThread:
+    def __init__(self):
+        self.turns = []
+        self.summary = ""
+        self.last_used = time.monotonic()
+        self.compacting = False
+        self.revision = None
+        self.lock = threading.Lock()
+
+    def turn_tokens(self):
+        return sum(turn.tokens for turn in self.turns)
+
+    def snapshot(self):
+        return {"summary": self.summary, "turns": [turn.to_message() for turn in self.turns]}
+
+    def restore(self, snapshot):
+        self.summary = snapshot.get("summary", "")
+        self.turns = [Turn(turn["role"], turn["content"]) for turn in snapshot.get("turns", [])]
+        self.revision = snapshot.get("revision")
+
+
+def default_summarizer(summary, turns):
+    # Used when no model is available: keeps the first line of every turn.
+    lines = [summary] if summary else []
+    for turn in turns:
+        first_line = turn.content.strip().splitlines()[0] if turn.content.strip() else ""
+        lines.append(f"{turn.role}: {first_line[:200]}")
+    return "\n".join(lines)
+
+
+# Per-thread conversation history. The latest turns are kept verbatim; once a
+# thread has more than max_turns turns or max_tokens tokens, the oldest turns
+# are folded into a running summary by summarizer(previous_summary, turns),
+# on a background thread so replies are never held up by it. Threads idle for
+# longer than idle_ttl, and the least recently used beyond max_threads, are
+# dropped. With a shared state store attached, every change is also written
+# there so a thread can continue on another worker process.
+class ConversationMemory:
+    def __init__(self, summarizer=None, max_turns=None, max_tokens=None, summary_tokens=None, idle_ttl=None, max_threads=None, background=True, state=None):
+        self.summarizer = summarizer or default_summarizer
+        self.max_turns = max_turns or CONVERSATION_RECENT_TURNS
+        self.max_tokens = max_tokens or CONVERSATION_MAX_TOKENS
+        self.summary_tokens = summary_tokens or CONVERSATION_SUMMARY_TOKENS
+        self.idle_ttl = CONVERSATION_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.max_threads = max_threads or CONVERSATION_MAX_THREADS
+        self.threads = OrderedDict()
+        self.state = state
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="consultai-memory") if background else None
+        self._lock = threading.Lock()
+
+    def _thread(self, key, create=False):
+        snapshot = self._load(key)
+        with self._lock:
+            self._evict()
+            thread = self.threads.get(key)
+            if thread is None and (create or snapshot is not None):
+                thread = self.threads[key] = ConversationThread()
+            if thread is not None:
+                thread.last_used = time.monotonic()
+                self.threads.move_to_end(key)
+        if thread is not None and snapshot is not None:
+            with thread.lock:
+                if snapshot.get("revision") != thread.revision:
+                    thread.restore(snapshot)
+        return thread
+
+    def _load(self, key):
+        if self.state is None:
+            return None
+        try:
+            return self.state.get("conversations", key)
+        except Exception as e:
+            logger.error(f"Error loading conversation {key}: {e}")
+            return None
+
+    def _save(self, key, thread):
+        # Called with thread.lock held.
+        if self.state is None:
+            return
+        snapshot = thread.snapshot()
+        snapshot["revision"] = thread.revision = f"{os.getpid()}:{time.time_ns()}"
+        try:
+            self.state.set("conversations", key, snapshot, ttl=self.idle_ttl)
+        except Exception as e:
+            logger.error(f"Error saving conversation {key}: {e}")
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.threads:
+            key, thread = next(iter(self.threads.items()))
+            if len(self.threads) <= self.max_threads and now - thread.last_used < self.idle_ttl:
+                break
+            del self.threads[key]
+
+    def history(self, key):
+        # Messages to put between the system prompt and the new user message.
+        thread = self._thread(key)
+        if thread is None:
+            return []
+        with thread.lock:
+            messages = [turn.to_message() for turn in thread.turns]
+            if thread.summary:
+                messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{thread.summary}"})
+        return messages
+
+    def add_exchange(self, key, user_message, assistant_message):
+        thread = self._thread(key, create=True)
+        # A single turn never takes more than half of the thread's budget.
+        limit = max(1, self.max_tokens // 2)
+        with thread.lock:
+            thread.turns.append(Turn("user", truncate_tokens(user_message, limit)))
+            thread.turns.append(Turn("assistant", truncate_tokens(assistant_message, limit)))
+            self._save(key, thread)
+            if thread.compacting or not self._over_limit(thread):
+                return
+            thread.compacting = True
+        if self.executor is not None:
+            self.executor.submit(self._compact, key, thread)
+        else:
+            self._compact(key, thread)
+
+    def _over_limit(self, thread):
+        return len(thread.turns) > self.max_turns or thread.turn_tokens() > self.max_tokens
+
+    def _compact(self, key, thread):
+        try:
+            while True:
+                with thread.lock:
+                    if not self._over_limit(thread) or len(thread.turns) <= 2:
+                        thread.compacting = False
+                        return
+                    # Fold whole exchanges, oldest first, keeping the latest one.
+                    count = 0
+                    tokens = thread.turn_tokens()
+                    while len(thread.turns) - count > 2 and (len(thread.turns) - count > self.max_turns or tokens > self.max_tokens):
+                        tokens -= thread.turns[count].tokens + thread.turns[count + 1].tokens
+                        count += 2
+                    old_turns = thread.turns[:count]
+                    summary = thread.summary
+                try:
+                    summary = self.summarizer(summary, old_turns)
+                except Exception as e:
+                    logger.error(f"Error summarizing conversation, keeping a short digest instead: {e}")
+                    summary = default_summarizer(summary, old_turns)
+                summary = truncate_tokens(summary, self.summary_tokens, keep="tail")
+                with thread.lock:
+                    # New turns may have arrived meanwhile; only drop the folded ones.
+                    thread.turns = thread.turns[len(old_turns):]
+                    thread.summary = summary
+                    self._save(key, thread)
+        except Exception:
+            with thread.lock:
+                thread.compacting = False
+            raise
+
+    def clear(self, key, threads=False):
+        # threads=True also drops the Slack threads kept under "<key>:<thread_ts>".
+        prefix = f"{key}:"
+        with self._lock:
+            self.threads.pop(key, None)
+            if threads:
+                for thread_key in [k for k in self.threads if k.startswith(prefix)]:
+                    del self.threads[thread_key]
+        if self.state is not None:
+            self.state.delete("conversations", key)
+            if threads:
+                self.state.delete_prefix("conversations", prefix)
+
+    def stats(self):
+        with self._lock:
+            threads = list(self.threads.values())
+        return {
+            "threads": len(threads),
+            "turns": sum(len(t.turns) for t in threads),
+            "tokens": sum(t.turn_tokens() for t in threads),
+        }
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,21 +1,38 @@
 # agent/core.py
 
-from openai import OpenAI
-from dotenv import load_dotenv
+import json
 import logging
 import os
+import time
+import openai
+import agent.file_operations as file_operations
+from agent.response_cache import ResponseCache
+from agent.llm_client import LLMClient
+from agent.prompt_builder import PromptBuilder, count_tokens, prune_context, serialize_context
+from agent.model_router import ModelRouter, ROUTER_FALLBACK_RETRIES
+from agent.code_review import ReviewEngine, changed_files, chunk_source, format_report, verify_ref
+from agent.batch import BatchJob
+from agent.code_index import CodeIndexRegistry
+from agent.conversation_memory import ConversationMemory
+from agent.metrics import metrics
+from agent.errors import ERROR_RESPONSE
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 class ConsultAIAgent:
-    def __init__(self):
+    def __init__(self, cache=None):
         logger.info("Initializing ConsultAIAgent")
+        if cache is None and os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true":
+            cache = ResponseCache()
+        self.cache = cache
+        self.prompt_builder = PromptBuilder()
+        self.router = ModelRouter()
+        self.memory = ConversationMemory(summarizer=self._summarize_conversation)
+        self.review_engine = ReviewEngine(self)
+        self.code_index = CodeIndexRegistry() if os.environ.get("CODE_CONTEXT_ENABLED", "true").lower() == "true" else None
         try:
-            self.client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+            self.llm = LLMClient(os.environ["OPENAI_API_KEY"])
+            self.client = self.llm.client
             logger.info("OpenAI client initialized successfully")
         except KeyError:
             logger.error("OPENAI_API_KEY not found in environment variables")
@@ -24,50 +41,203 @@ class ConsultAIAgent:
             logger.error(f"Error initializing OpenAI client: {e}")
             raise
 
-    def process_message(self, message, context=None):
+    def complete(self, model, messages, on_delta=None, namespace=None, cache=True):
+        # For other components such as ReviewEngine: model may be a list of
+        # fallbacks; cache=False is for callers that keep their own cache.
+        if cache:
+            return self._complete(model, messages, on_delta, namespace)
+        return self._request_completion(model, messages, on_delta)
+
+    def _complete(self, model, messages, on_delta=None, namespace=None):
+        # Everything before the last message is the cache's "system" part, so
+        # the key covers the serialized project context as well as the question.
+        # model may be a list of fallbacks from the router; the first one keys
+        # the cache, so answers from a fallback model are not cached.
+        primary = model if isinstance(model, str) else model[0]
+        if self.cache:
+            prefix = json.dumps(messages[:-1], separators=(",", ":"))
+            with metrics.stage("cache_lookup"):
+                cached = self.cache.get(primary, prefix, messages[-1]["content"])
+            metrics.inc("consultai_cache_requests_total", cache="response", result="miss" if cached is None else "hit")
+            if cached is not None:
+                logger.info("Serving response from cache")
+                if on_delta:
+                    on_delta(cached)
+                return cached
+        response, answered_by = self._request_with_fallbacks(model, messages, on_delta)
+        if self.cache and response and answered_by == primary:
+            self.cache.set(primary, prefix, messages[-1]["content"], response, namespace=namespace)
+        return response
+
+    def _request_completion(self, model, messages, on_delta=None):
+        return self._request_with_fallbacks(model, messages, on_delta)[0]
+
+    def _request_with_fallbacks(self, model, messages, on_delta=None):
+        # Given several models, each is tried in turn while the ones before it
+        # are rate limited: skipped when already cooling down after a 429,
+        # otherwise retried only briefly before moving on. Returns the
+        # response and the model that produced it.
+        models = [model] if isinstance(model, str) else list(model)
+        for i, candidate in enumerate(models):
+            last = i == len(models) - 1
+            if not last and self.llm.is_cooling_down(candidate):
+                logger.info(f"{candidate} is rate limited, using {models[i + 1]}")
+                continue
+            started = time.monotonic()
+            try:
+                with metrics.stage("llm_request"):
+                    response = self._request_model(candidate, messages, on_delta, None if last else ROUTER_FALLBACK_RETRIES)
+            except openai.RateLimitError:
+                self.router.record(candidate, time.monotonic() - started, 0, 0, error=True)
+                metrics.inc("consultai_llm_requests_total", model=candidate, status="rate_limited")
+                if last:
+                    raise
+                logger.warning(f"{candidate} is rate limited, falling back to {models[i + 1]}")
+                continue
+            except Exception:
+                self.router.record(candidate, time.monotonic() - started, 0, 0, error=True)
+                metrics.inc("consultai_llm_requests_total", model=candidate, status="error")
+                raise
+            input_tokens = sum(count_tokens(m.get("content") or "", candidate) for m in messages)
+            output_tokens = count_tokens(response or "", candidate)
+            self.router.record(candidate, time.monotonic() - started, input_tokens, output_tokens, fallback=i > 0)
+            metrics.inc("consultai_llm_requests_total", model=candidate, status="ok")
+            metrics.inc("consultai_llm_tokens_total", input_tokens, model=candidate, direction="input")
+            metrics.inc("consultai_llm_tokens_total", output_tokens, model=candidate, direction="output")
+            return response, candidate
+
+    def _request_model(self, model, messages, on_delta=None, max_retries=None):
+        # With on_delta the completion is streamed and every content delta is
+        # handed to the callback as it arrives; the full text is returned either way.
+        if on_delta is None:
+            response = self.llm.chat_completion(model=model, messages=messages, max_retries=max_retries)
+            return response.choices[0].message.content
+        stream = self.llm.chat_completion(model=model, messages=messages, stream=True, max_retries=max_retries)
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+        return "".join(parts)
+
+    def invalidate_cache(self, project_name):
+        if self.cache:
+            self.cache.invalidate(project_name)
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else {}
+
+    def model_stats(self):
+        return self.router.get_stats()
+
+    def process_message(self, message, context=None, on_delta=None, route_key=None, history=None):
         logger.info(f"Processing message: {message[:50]}...")  # Log first 50 chars of message
         try:
-            system_message = "You are a helpful AI assistant for software developers."
-            if context:
-                system_message += f" The current project context is: {context}"
-            response = self.client.chat.completions.create(
-                model=os.environ["OPENAI_MODEL"],
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": message}
-                ]
+            with metrics.stage("prompt_build"):
+                context_tokens = count_tokens(serialize_context(prune_context(context))) if isinstance(context, dict) else 0
+                context_tokens += sum(count_tokens(m["content"]) for m in history or [])
+                models = self.router.route("chat", message, context_tokens, route_key)
+                system_message = self.prompt_builder.build_system_message(
+                    "You are a helpful AI assistant for software developers.", context, models[0]
+                )
+            with metrics.stage("code_retrieval"):
+                code_context = self._retrieve_code(self._project_name(context), message)
+            if code_context:
+                system_message += f"\n\nRelevant code from the project repository:\n{code_context}"
+            # history: earlier turns of this conversation, from ConversationMemory.history().
+            response = self._complete(
+                models,
+                [{"role": "system", "content": system_message}] + (history or []) + [{"role": "user", "content": message}],
+                on_delta=on_delta,
+                namespace=self._project_name(context)
             )
+            self.router.record_outcome(route_key, count_tokens(response or "", models[0]))
             logger.info("Message processed successfully")
-            return response.choices[0].message.content
+            return response
         except Exception as e:
             logger.error(f"Error processing message: {e}")
-            return "I'm sorry, I encountered an error while processing your message."
+            return ERROR_RESPONSE
 
-    def process_command(self, command, args):
+    def remember(self, conversation_key, message, response):
+        self.memory.add_exchange(conversation_key, message, response)
+
+    def conversation_history(self, conversation_key):
+        return self.memory.history(conversation_key)
+
+    def _summarize_conversation(self, summary, turns):
+        transcript = "\n\n".join(f"{turn.role}: {turn.content}" for turn in turns)
+        prompt = f"Current summary:\n{summary or '(none)'}\n\nNew conversation turns:\n{transcript}"
+        return self._request_completion(
+            self.router.route("summarize"),
+            [
+                {"role": "system", "content": "You maintain a running summary of a conversation between a developer and an assistant. "
+                                              "Merge the new turns into the current summary. Keep decisions, requirements, names, "
+                                              "file paths and short code references; drop pleasantries. Reply with the updated summary only."},
+                {"role": "user", "content": prompt}
+            ]
+        )
+
+    def _retrieve_code(self, project_name, message):
+        if not self.code_index or not project_name:
+            return ""
+        try:
+            return self.code_index.retrieve(project_name, message)
+        except Exception as e:
+            logger.error(f"Error retrieving code context: {e}")
+            return ""
+
+    @staticmethod
+    def _project_name(context):
+        if isinstance(context, dict):
+            return (context.get('project') or {}).get('name')
+        return None
+
+    def process_command(self, command, args, on_delta=None):
         logger.info(f"Processing command: {command} with args: {args}")
         if command == 'review':
-            return self.review_code(args['file'])
+            return self.review_code(args['file'], on_delta=on_delta)
+        elif command == 'review_project':
+            return self.review_project(args['project'], args.get('path', ''))
+        elif command == 'review_diff':
+            return self.review_diff(args['project'], args['base'], args.get('head', 'HEAD'))
+        elif command == 'review_changes':
+            return self.review_changes(args['project'], args['base'], args.get('head', 'HEAD'))
+        elif command == 'review_files':
+            return self.review_files(args['root'], args['files'])
         elif command == 'generate':
-            return self.generate_code(args['prompt'])
+            return self.generate_code(args['prompt'], on_delta=on_delta)
         else:
             logger.warning(f"Unknown command: {command}")
             return f"Unknown command: {command}"
 
-    def review_code(self, file_path):
+    def review_code(self, file_path, on_delta=None):
         logger.info(f"Reviewing code from file: {file_path}")
         try:
             with open(f'./temp_repo/{file_path}', 'r') as file:
                 code = file.read()
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
+
+            chunks = chunk_source(file_path, code, self.review_engine.chunk_tokens, self.review_engine.model)
+            if len(chunks) > 1:
+                # Too big for one prompt: review the pieces in parallel.
+                response = format_report(self.review_engine.review_chunks(chunks))
+                if on_delta:
+                    on_delta(response)
+                logger.info("Code review completed successfully")
+                return response
+
+            response = self._complete(
+                self.review_engine.models,
+                [
                     {"role": "system", "content": "You are a code review assistant."},
                     {"role": "user", "content": f"Review this code:\n\n{code}"}
-                ]
+                ],
+                on_delta=on_delta
             )
             logger.info("Code review completed successfully")
-            return response.choices[0].message.content
+            return response
         except FileNotFoundError:
             logger.error(f"File not found: {file_path}")
             return f"Error: File not found: {file_path}"
@@ -75,18 +245,103 @@ class ConsultAIAgent:
             logger.error(f"Error reviewing code: {e}")
             return f"Error reviewing code: {str(e)}"
 
-    def generate_code(self, prompt):
+    def review_project(self, project_name, path=''):
+        logger.info(f"Reviewing '{path or '.'}' of project: {project_name}")
+        try:
+            return format_report(self.review_engine.review_path(project_name, path))
+        except (FileNotFoundError, RuntimeError) as e:
+            logger.error(f"Error reviewing project: {e}")
+            return f"Error reviewing code: {str(e)}"
+
+    def review_diff(self, project_name, base, head='HEAD'):
+        logger.info(f"Reviewing {base}..{head} of project: {project_name}")
+        try:
+            return format_report(self.review_engine.review_diff(project_name, base, head))
+        except (FileNotFoundError, RuntimeError) as e:
+            logger.error(f"Error reviewing diff: {e}")
+            return f"Error reviewing code: {str(e)}"
+
+    def review_changes(self, project_name, base, head='HEAD'):
+        logger.info(f"Reviewing changed hunks in {base}..{head} of project: {project_name}")
+        try:
+            return format_report(self.review_engine.review_changes(project_name, base, head))
+        except (FileNotFoundError, RuntimeError) as e:
+            logger.error(f"Error reviewing changes: {e}")
+            return f"Error reviewing code: {str(e)}"
+
+    def review_files(self, root, paths):
+        # Files outside any project, e.g. uploaded in Slack.
+        logger.info(f"Reviewing {len(paths)} files in {root}")
+        try:
+            return format_report(self.review_engine.review_files(root, paths))
+        except (FileNotFoundError, RuntimeError) as e:
+            logger.error(f"Error reviewing files: {e}")
+            return f"Error reviewing code: {str(e)}"
+
+    def create_batch(self, name=None):
+        return BatchJob(self.client, name)
+
+    def submit_review_batch(self, project_name, path='', base=None, head='HEAD', name=None):
+        # Non-interactive review through the Batch API: same chunks and prompts
+        # as the interactive review, results arrive within the batch window.
+        engine = self.review_engine
+        revision = None
+        if base:
+            root = file_operations.get_project_path(project_name)
+            revision = verify_ref(root, head)
+            paths = changed_files(root, base, revision)
+        else:
+            root, paths = engine.project_files(project_name, path)
+        job = self.create_batch(name or f"review-{project_name}-{int(time.time())}")
+        for chunk in engine.chunk_files(root, paths, revision):
+            job.add(
+                f"{chunk.path}:{chunk.start_line}-{chunk.end_line}",
+                engine.model,
+                engine.chunk_messages(chunk),
+                {"project": project_name, "path": chunk.path, "start_line": chunk.start_line, "end_line": chunk.end_line}
+            )
+        job.submit()
+        return job
+
+    def review_batch_results(self, job):
+        results = []
+        for result in job.results().values():
+            metadata = result["metadata"]
+            review = result["content"] if result["error"] is None else f"Error reviewing this section: {result['error']}"
+            results.append({"path": metadata["path"], "start_line": metadata["start_line"], "end_line": metadata["end_line"], "review": review})
+        return sorted(results, key=lambda r: (r["path"], r["start_line"]))
+
+    def submit_generate_batch(self, requests, name=None):
+        # requests: [{"id": ..., "prompt": ..., **metadata}], e.g. one per Slack
+        # user; the metadata comes back with each result.
+        job = self.create_batch(name or f"generate-{int(time.time())}")
+        for request in requests:
+            metadata = {k: v for k, v in request.items() if k != "prompt"}
+            job.add(
+                str(request["id"]),
+                self.router.model_for("generate"),
+                [
+                    {"role": "system", "content": "You are a code generation assistant."},
+                    {"role": "user", "content": request["prompt"]}
+                ],
+                metadata
+            )
+        job.submit()
+        return job
+
+    def generate_code(self, prompt, on_delta=None):
         logger.info(f"Generating code with prompt: {prompt[:50]}...")  # Log first 50 chars of prompt
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
+            response = self._complete(
+                self.router.route("generate", prompt),
+                [
                     {"role": "system", "content": "You are a code generation assistant."},
                     {"role": "user", "content": prompt}
-                ]
+                ],
+                on_delta=on_delta
             )
             logger.info("Code generation completed successfully")
-            return response.choices[0].message.content
+            return response
         except Exception as e:
             logger.error(f"Error generating code: {e}")
             return f"Error generating code: {str(e)}"
@@ -0,0 +1,3 @@
+# Replies shared by the agent and the chat integrations. Kept free of imports
+# so the bot can compare against them without loading the agent.
+ERROR_RESPONSE = "I'm sorry, I encountered an error while processing your message."
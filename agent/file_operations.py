@@ -1,20 +1,113 @@
+import hashlib
 import os
+import re
 import subprocess
 import logging
 
 logger = logging.getLogger(__name__)
 DEFAULT_PROJECTS_PATH = os.environ["PROJECTS_PATH"] if "PROJECTS_PATH" in os.environ else os.path.join(os.getcwd(), "projects")
+DEFAULT_MIRROR_PATH = os.environ.get("CLONE_MIRROR_PATH")
+DEFAULT_CLONE_DEPTH = int(os.environ["CLONE_DEPTH"]) if os.environ.get("CLONE_DEPTH") else None
+DEFAULT_CLONE_FILTER = os.environ.get("CLONE_FILTER", "blob:none") or None
 
-def clone_repository(remote_url, project_name):
-    clone_path = os.path.join(DEFAULT_PROJECTS_PATH, project_name)
+PROGRESS_SEPARATOR = re.compile(r"[\r\n]+")
+REMOTE_URL = re.compile(r"^(?:(?:https|ssh|git)://[^\s/]+/\S+|[\w.-]+@[\w.-]+:[^\s:]\S*)$")
+
+def get_project_path(project_name):
+    return os.path.join(DEFAULT_PROJECTS_PATH, project_name)
+
+def is_git_repository(path):
+    return os.path.isdir(os.path.join(path, ".git"))
+
+def validate_remote_url(remote_url):
+    # The URL comes from a Slack user: only https, ssh (including the
+    # user@host:path form) and git URLs, never anything git reads as an
+    # option or a transport helper such as ext::.
+    remote_url = (remote_url or "").strip()
+    if remote_url.startswith("-") or not REMOTE_URL.match(remote_url):
+        raise ValueError(f"Unsupported repository URL: {remote_url!r}. Use an https://, ssh:// or git:// URL.")
+    return remote_url
+
+def run_git(args, on_progress=None):
+    # Runs git with --progress output streamed line by line to on_progress.
+    # git redraws progress lines with \r, so both separators end a line.
+    logger.info(f"Running: git {' '.join(args)}")
+    process = subprocess.Popen(['git'] + args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, bufsize=1)
+    tail = []
+    buffer = ""
+    for data in iter(lambda: process.stderr.read(256), ""):
+        buffer += data
+        *lines, buffer = PROGRESS_SEPARATOR.split(buffer)
+        for line in lines:
+            if line.strip():
+                tail = (tail + [line])[-20:]
+                if on_progress:
+                    on_progress(line.strip())
+    if buffer.strip():
+        tail.append(buffer)
+    returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, ['git'] + args, stderr="\n".join(tail))
+
+def update_mirror(remote_url, on_progress=None, mirror_path=None):
+    # Bare mirrors shared by every project cloned from the same remote; new
+    # clones borrow their objects instead of downloading them again.
+    mirror_root = mirror_path or DEFAULT_MIRROR_PATH
+    if not mirror_root:
+        return None
+    remote_url = validate_remote_url(remote_url)
+    mirror = os.path.join(mirror_root, hashlib.sha1(remote_url.encode()).hexdigest() + ".git")
+    if os.path.isdir(mirror):
+        run_git(['-C', mirror, 'remote', 'update', '--prune'], on_progress)
+    else:
+        os.makedirs(mirror_root, exist_ok=True)
+        run_git(['clone', '--mirror', '--progress', '--', remote_url, mirror], on_progress)
+    return mirror
+
+def clone_repository(remote_url, project_name, depth=None, filter_spec=None, sparse_paths=None, on_progress=None):
+    remote_url = validate_remote_url(remote_url)
+    clone_path = get_project_path(project_name)
+    depth = depth if depth is not None else DEFAULT_CLONE_DEPTH
+    filter_spec = filter_spec if filter_spec is not None else DEFAULT_CLONE_FILTER
 
     if os.path.exists(clone_path):
+        if is_git_repository(clone_path):
+            return fetch_repository(project_name, depth=depth, on_progress=on_progress)
         raise FileExistsError(f"Directory {clone_path} already exists.")
 
     try:
-        subprocess.run(['git', 'clone', remote_url, clone_path], check=True)
+        args = ['clone', '--progress']
+        if depth:
+            args += ['--depth', str(depth)]
+        if filter_spec:
+            args += [f'--filter={filter_spec}']
+        if sparse_paths:
+            args += ['--sparse']
+        mirror = update_mirror(remote_url, on_progress)
+        if mirror:
+            # Borrow the mirror's objects for the transfer, then copy them in:
+            # `remote update --prune` drops refs and git may then gc objects
+            # a clone still pointing at the mirror would depend on.
+            args += ['--reference-if-able', mirror, '--dissociate']
+        run_git(args + ['--', remote_url, clone_path], on_progress)
+        if sparse_paths:
+            run_git(['-C', clone_path, 'sparse-checkout', 'set'] + list(sparse_paths), on_progress)
         logger.info(f"Repository cloned successfully to {clone_path}")
         return clone_path
     except subprocess.CalledProcessError as e:
-        logger.error(f"Failed to clone repository: {str(e)}")
-        raise RuntimeError(f"Failed to clone repository: {str(e)}")
+        logger.error(f"Failed to clone repository: {str(e)}: {e.stderr}")
+        raise RuntimeError(f"Failed to clone repository: {e.stderr or str(e)}")
+
+def fetch_repository(project_name, depth=None, on_progress=None):
+    clone_path = get_project_path(project_name)
+    try:
+        args = ['-C', clone_path, 'fetch', '--prune', '--progress']
+        if depth:
+            args += ['--depth', str(depth)]
+        run_git(args, on_progress)
+        run_git(['-C', clone_path, 'merge', '--ff-only', '@{upstream}'], on_progress)
+        logger.info(f"Repository updated successfully in {clone_path}")
+        return clone_path
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to update repository: {str(e)}: {e.stderr}")
+        raise RuntimeError(f"Failed to update repository: {e.stderr or str(e)}")
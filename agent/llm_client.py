@@ -0,0 +1,167 @@
+import logging
+import os
+import random
+import threading
+import time
+import httpx
+import openai
+from openai import OpenAI
+from agent.prompt_builder import count_tokens
+from agent.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "120"))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "5"))
+OPENAI_BACKOFF_BASE = float(os.environ.get("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.environ.get("OPENAI_BACKOFF_MAX", "30"))
+OPENAI_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", "0"))
+OPENAI_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", "0"))
+OPENAI_EXPECTED_OUTPUT_TOKENS = int(os.environ.get("OPENAI_EXPECTED_OUTPUT_TOKENS", "500"))
+OPENAI_QUEUE_TIMEOUT = float(os.environ.get("OPENAI_QUEUE_TIMEOUT", "60"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class RateLimitTimeout(RuntimeError):
+    pass
+
+
+# Refills continuously at rate_per_minute up to one minute's worth. A rate of
+# 0 disables the bucket.
+class TokenBucket:
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = float(rate_per_minute)
+        self.available = float(rate_per_minute)
+        self.updated_at = time.monotonic()
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate_per_minute / 60.0)
+        self.updated_at = now
+
+    def acquire(self, amount=1, timeout=None):
+        if self.rate_per_minute <= 0:
+            return
+        # A request bigger than the whole bucket waits for a full bucket.
+        amount = min(amount, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) * 60.0 / self.rate_per_minute
+                if deadline is not None:
+                    if now + wait > deadline:
+                        raise RateLimitTimeout("Timed out waiting for OpenAI rate limit capacity")
+                self._condition.wait(wait)
+
+    def refund(self, amount):
+        if self.rate_per_minute <= 0 or amount <= 0:
+            return
+        with self._condition:
+            self._refill(time.monotonic())
+            self.available = min(self.capacity, self.available + amount)
+            self._condition.notify_all()
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    # Full jitter exponential backoff, never shorter than the server's Retry-After.
+    delay = random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+# Shared OpenAI client: one pooled HTTP connection pool, client-side
+# requests/tokens per minute limits, and retries with backoff for 429s, 5xx
+# and connection errors. The SDK's own retries are disabled so ours are the
+# only ones that count.
+class LLMClient:
+    def __init__(self, api_key, max_retries=None, requests_per_minute=None, tokens_per_minute=None):
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        )
+        self.client = OpenAI(api_key=api_key, http_client=self.http_client, max_retries=0)
+        self.max_retries = OPENAI_MAX_RETRIES if max_retries is None else max_retries
+        self.request_bucket = TokenBucket(OPENAI_REQUESTS_PER_MINUTE if requests_per_minute is None else requests_per_minute)
+        self.token_bucket = TokenBucket(OPENAI_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute)
+        self._cooldown_until = {}
+        self._lock = threading.Lock()
+
+    def _wait_for_cooldown(self, model):
+        # After a 429 every caller of that model pauses, not just the one that
+        # was rejected. OpenAI limits are per model, so other models carry on.
+        wait = self._cooldown_until.get(model, 0.0) - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _start_cooldown(self, model, seconds):
+        with self._lock:
+            self._cooldown_until[model] = max(self._cooldown_until.get(model, 0.0), time.monotonic() + seconds)
+
+    def is_cooling_down(self, model):
+        return self._cooldown_until.get(model, 0.0) > time.monotonic()
+
+    def estimate_tokens(self, model, messages):
+        return sum(count_tokens(message.get("content") or "", model) for message in messages) + OPENAI_EXPECTED_OUTPUT_TOKENS
+
+    def chat_completion(self, max_retries=None, **kwargs):
+        max_retries = self.max_retries if max_retries is None else max_retries
+        model = kwargs.get("model")
+        estimated = self.estimate_tokens(model, kwargs.get("messages", []))
+        with metrics.stage("rate_limit_wait"):
+            self.request_bucket.acquire(1, timeout=OPENAI_QUEUE_TIMEOUT)
+            self.token_bucket.acquire(estimated, timeout=OPENAI_QUEUE_TIMEOUT)
+        attempt = 0
+        while True:
+            self._wait_for_cooldown(model)
+            try:
+                response = self.client.chat.completions.create(**kwargs)
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    self.token_bucket.refund(estimated - usage.total_tokens)
+                return response
+            except RETRYABLE_ERRORS as e:
+                if attempt >= max_retries:
+                    logger.error(f"OpenAI request failed after {attempt + 1} attempts: {e}")
+                    raise
+                retry_after = retry_after_seconds(e)
+                delay = backoff_delay(attempt, retry_after)
+                if isinstance(e, openai.RateLimitError):
+                    self._start_cooldown(model, delay)
+                logger.warning(f"OpenAI request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                metrics.inc("consultai_llm_retries_total", model=model, error=type(e).__name__)
+                time.sleep(delay)
+                attempt += 1
+
+    def close(self):
+        self.http_client.close()
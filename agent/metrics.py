@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self.values[key] = value
+
+    def samples(self):
+        if self.callback is not None:
+            # Callback gauges are read at scrape time: {label values: value}.
+            try:
+                for key, value in self.callback().items():
+                    self.set(value, **dict(zip(self.labels, key if isinstance(key, tuple) else (key,))))
+            except Exception as e:
+                logger.error(f"Error reading gauge {self.name}: {e}")
+        return super().samples()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # Per-bucket counts, then sum and count.
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key, [("le", _format_value(bound))], cumulative))
+                samples.append((f"{self.name}_bucket", key, [("le", "+Inf")], count))
+                samples.append((f"{self.name}_sum", key, None, total))
+                samples.append((f"{self.name}_count", key, None, count))
+        return samples
+
+
+class _NoopStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.span = None
+
+    def __enter__(self):
+        if self.registry.tracer is not None:
+            self.span = self.registry.tracer.start_as_current_span(f"consultai.{self.name}", attributes=self.labels)
+            self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.registry.enabled:
+            self.registry.stage_seconds.observe(time.perf_counter() - self.started, stage=self.name)
+            if exc_type is not None:
+                self.registry.errors.inc(stage=self.name, error=exc_type.__name__)
+        if self.span is not None:
+            self.span.__exit__(exc_type, exc_val, exc_tb)
+        return False
+
+
+# Process-wide metrics for the message hot path. Everything is a no-op until
+# configure() turns it on (METRICS_ENABLED), so instrumented code pays one
+# attribute check when metrics are off. render() produces the Prometheus text
+# format served by MetricsServer; with OTEL_TRACING_ENABLED and the
+# opentelemetry package installed every stage() is also a span.
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = False
+        self.tracer = None
+        self.metrics = {}
+        self.stage_seconds = self.histogram("consultai_stage_duration_seconds", "Time spent per processing stage", ("stage",))
+        self.errors = self.counter("consultai_errors_total", "Errors raised per processing stage", ("stage", "error"))
+        self.events = self.counter("consultai_slack_events_total", "Slack events received", ("event",))
+        self.tokens = self.counter("consultai_llm_tokens_total", "Tokens sent to and received from the model", ("model", "direction"))
+        self.llm_requests = self.counter("consultai_llm_requests_total", "Completed model requests", ("model", "status"))
+        self.llm_retries = self.counter("consultai_llm_retries_total", "Retried model requests", ("model", "error"))
+        self.cache_requests = self.counter("consultai_cache_requests_total", "Cache lookups", ("cache", "result"))
+
+    def configure(self, enabled=None, tracing=None):
+        self.enabled = os.environ.get("METRICS_ENABLED", "false").lower() == "true" if enabled is None else enabled
+        tracing = os.environ.get("OTEL_TRACING_ENABLED", "false").lower() == "true" if tracing is None else tracing
+        self.tracer = None
+        if tracing:
+            # Imported only when asked for; opentelemetry is slow to import.
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                logger.warning("OTEL_TRACING_ENABLED is set but opentelemetry is not installed")
+            else:
+                self.tracer = trace.get_tracer("consultai")
+        return self
+
+    def counter(self, name, documentation, labels=()):
+        return self.metrics.setdefault(name, Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), callback=None):
+        return self.metrics.setdefault(name, Gauge(name, documentation, labels, callback))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, documentation, labels, buckets))
+
+    def stage(self, name, **labels):
+        if not self.enabled and self.tracer is None:
+            return _NOOP_STAGE
+        return _Stage(self, name, labels)
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            self.metrics[name].observe(value, **labels)
+
+    def inc(self, name, amount=1, **labels):
+        if self.enabled:
+            self.metrics[name].inc(amount, **labels)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labels, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = metrics
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Serves GET /metrics on METRICS_HOST:METRICS_PORT from a daemon thread.
+class MetricsServer:
+    def __init__(self, registry=None, host=None, port=None):
+        self.registry = registry or metrics
+        self.host = host or os.environ.get("METRICS_HOST", "127.0.0.1")
+        self.port = int(os.environ.get("METRICS_PORT", "9464")) if port is None else port
+        self._server = None
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(MetricsHandler):
+            pass
+
+        Handler.registry = registry
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="consultai-metrics", daemon=True).start()
+        logger.info(f"Serving metrics on http://{self.host}:{self._server.server_address[1]}/metrics")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
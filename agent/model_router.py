@@ -0,0 +1,126 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from agent.prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+MODEL_TIER_FAST = os.environ.get("MODEL_TIER_FAST", "gpt-4o-mini")
+MODEL_TIER_STRONG = os.environ.get("MODEL_TIER_STRONG") or os.environ.get("OPENAI_MODEL", "gpt-4o")
+ROUTER_SHORT_MESSAGE_TOKENS = int(os.environ.get("ROUTER_SHORT_MESSAGE_TOKENS", "150"))
+ROUTER_LARGE_CONTEXT_TOKENS = int(os.environ.get("ROUTER_LARGE_CONTEXT_TOKENS", "1500"))
+ROUTER_HARD_OUTPUT_TOKENS = int(os.environ.get("ROUTER_HARD_OUTPUT_TOKENS", "600"))
+ROUTER_REVIEW_TIER = os.environ.get("ROUTER_REVIEW_TIER", FAST_TIER)
+ROUTER_GENERATE_TIER = os.environ.get("ROUTER_GENERATE_TIER", STRONG_TIER)
+ROUTER_FALLBACK_RETRIES = int(os.environ.get("ROUTER_FALLBACK_RETRIES", "1"))
+ROUTER_MAX_TRACKED_KEYS = 1000
+
+# Questions that usually need reasoning rather than a quick lookup.
+HARD_REQUEST = re.compile(r"```|\b(why|design|architect\w*|refactor|debug|optimi[sz]e|trade-?offs?|explain how|race|deadlock)\b", re.IGNORECASE)
+
+# USD per million input/output tokens, used only for the cost estimate in get_stats().
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+
+class TierStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.fallbacks = 0
+        self.total_latency = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+    def to_dict(self):
+        completed = self.requests - self.errors
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "fallbacks": self.fallbacks,
+            "avg_latency": self.total_latency / completed if completed else 0.0,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "estimated_cost": round(self.cost, 6),
+        }
+
+
+# Picks a model tier per request from its kind (chat, review, generate), its
+# size, the size of the project context and how hard earlier requests from the
+# same conversation turned out to be. route() returns the models to try in
+# order; the next one is used when the first is rate limited.
+class ModelRouter:
+    def __init__(self, tiers=None):
+        self.tiers = tiers or {FAST_TIER: MODEL_TIER_FAST, STRONG_TIER: MODEL_TIER_STRONG}
+        self.stats = {tier: TierStats() for tier in self.tiers}
+        self.difficulty = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tier_of(self, model):
+        for tier, tier_model in self.tiers.items():
+            if tier_model == model:
+                return tier
+        return None
+
+    def classify(self, kind, text="", context_tokens=0, key=None):
+        if kind == "review":
+            return ROUTER_REVIEW_TIER
+        if kind == "generate":
+            return ROUTER_GENERATE_TIER
+        if kind == "summarize":
+            return FAST_TIER
+        if key is not None and self.difficulty.get(key, 0.0) >= 0.5:
+            return STRONG_TIER
+        if context_tokens > ROUTER_LARGE_CONTEXT_TOKENS:
+            return STRONG_TIER
+        if count_tokens(text) > ROUTER_SHORT_MESSAGE_TOKENS or HARD_REQUEST.search(text):
+            return STRONG_TIER
+        return FAST_TIER
+
+    def route(self, kind, text="", context_tokens=0, key=None):
+        tier = self.classify(kind, text, context_tokens, key)
+        primary = self.tiers[tier]
+        fallbacks = [model for other, model in self.tiers.items() if other != tier and model != primary]
+        return [primary] + fallbacks
+
+    def model_for(self, kind):
+        return self.route(kind)[0]
+
+    def record(self, model, latency, input_tokens, output_tokens, error=False, fallback=False):
+        tier = self.tier_of(model)
+        if tier is None:
+            return
+        input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        with self._lock:
+            stats = self.stats[tier]
+            stats.requests += 1
+            stats.errors += 1 if error else 0
+            stats.fallbacks += 1 if fallback else 0
+            if not error:
+                stats.total_latency += latency
+                stats.input_tokens += input_tokens
+                stats.output_tokens += output_tokens
+                stats.cost += (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def record_outcome(self, key, output_tokens):
+        # Exponential moving average of "this answer was long", per conversation.
+        if key is None:
+            return
+        hard = 1.0 if output_tokens > ROUTER_HARD_OUTPUT_TOKENS else 0.0
+        with self._lock:
+            self.difficulty[key] = 0.5 * self.difficulty.get(key, 0.0) + 0.5 * hard
+            self.difficulty.move_to_end(key)
+            while len(self.difficulty) > ROUTER_MAX_TRACKED_KEYS:
+                self.difficulty.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return {tier: {"model": self.tiers[tier], **stats.to_dict()} for tier, stats in self.stats.items()}
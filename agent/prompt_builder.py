@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+# Per model overrides, e.g. "gpt-4o-mini=1000,gpt-4o=4000"
+CONTEXT_BUDGETS = os.environ.get("CONTEXT_TOKEN_BUDGETS", "")
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def _encoder_for(model):
+    if tiktoken is None:
+        return None
+    with _encoders_lock:
+        if model not in _encoders:
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoders[model] = tiktoken.get_encoding("o200k_base")
+        return _encoders[model]
+
+
+def count_tokens(text, model=None):
+    encoder = _encoder_for(model or "gpt-4o-mini")
+    if encoder is None:
+        # Without tiktoken fall back to the usual ~4 characters per token.
+        return len(text) // 4 + 1
+    return len(encoder.encode(text))
+
+
+def prune_context(value):
+    # Drops unanswered template fields (None, "", [] and {}) recursively.
+    if isinstance(value, dict):
+        pruned = {}
+        for key, item in value.items():
+            item = prune_context(item)
+            if item not in (None, "", [], {}):
+                pruned[key] = item
+        return pruned
+    if isinstance(value, list):
+        return [item for item in (prune_context(i) for i in value) if item not in (None, "", [], {})]
+    return value
+
+
+def serialize_context(context):
+    return json.dumps(context, separators=(",", ":"), ensure_ascii=False)
+
+
+def _flatten(value, prefix=()):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, prefix + (key,))
+    else:
+        yield prefix, value
+
+
+def _unflatten(leaves):
+    context = {}
+    for path, value in leaves:
+        d = context
+        for key in path[:-1]:
+            d = d.setdefault(key, {})
+        d[path[-1]] = value
+    return context
+
+
+def parse_budgets(spec):
+    budgets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, budget = item.split("=", 1)
+            budgets[model.strip()] = int(budget)
+    return budgets
+
+
+class PromptBuilder:
+    def __init__(self, budgets=None, default_budget=None):
+        self.budgets = budgets if budgets is not None else parse_budgets(CONTEXT_BUDGETS)
+        self.default_budget = default_budget or DEFAULT_CONTEXT_BUDGET
+
+    def budget_for(self, model):
+        return self.budgets.get(model, self.default_budget)
+
+    def fit_context(self, context, model=None):
+        pruned = prune_context(context)
+        if not pruned:
+            return ""
+        serialized = serialize_context(pruned)
+        budget = self.budget_for(model)
+        if count_tokens(serialized, model) <= budget:
+            return serialized
+        # Over budget: keep leaves in template order (project basics first)
+        # until the budget is used up, skipping any single oversized value.
+        kept, used = [], 2
+        for path, value in _flatten(pruned):
+            cost = count_tokens(serialize_context({".".join(path): value}), model)
+            if used + cost > budget:
+                continue
+            kept.append((path, value))
+            used += cost
+        logger.info(f"Project context trimmed to {len(kept)} fields to fit {budget} tokens for {model}")
+        return serialize_context(_unflatten(kept)) if kept else ""
+
+    def build_system_message(self, base_message, context, model=None):
+        if not context:
+            return base_message
+        if not isinstance(context, dict):
+            context = {"context": context}
+        serialized = self.fit_context(context, model)
+        if not serialized:
+            return base_message
+        return f"{base_message} The current project context is: {serialized}"
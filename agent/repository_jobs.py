@@ -0,0 +1,115 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import agent.file_operations as file_operations
+
+logger = logging.getLogger(__name__)
+
+CLONE_MAX_WORKERS = int(os.environ.get("CLONE_MAX_WORKERS", "2"))
+PROGRESS_INTERVAL = float(os.environ.get("CLONE_PROGRESS_INTERVAL", "2.0"))
+# Finished jobs are kept this long so their outcome can still be looked up.
+CLONE_JOB_TTL = float(os.environ.get("CLONE_JOB_TTL", "3600"))
+
+
+class RepositoryJob:
+    def __init__(self, job_id, project_name, remote_url):
+        self.id = job_id
+        self.project_name = project_name
+        self.remote_url = remote_url
+        self.status = "queued"
+        self.progress = None
+        self.path = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    def is_active(self):
+        return self.status in ("queued", "running")
+
+
+# Runs clones and fetches on a small background pool so the Slack handler
+# thread returns immediately. Only one job per project runs at a time:
+# submit() checks for an active job and registers the new one under a single
+# lock. Finished jobs are dropped after job_ttl seconds.
+class RepositoryJobManager:
+    def __init__(self, max_workers=None, job_ttl=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or CLONE_MAX_WORKERS, thread_name_prefix="consultai-git")
+        self.job_ttl = CLONE_JOB_TTL if job_ttl is None else job_ttl
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, project_name, remote_url, on_progress=None, on_done=None, on_created=None, **clone_options):
+        # Returns (job, created). If the project already has an active job,
+        # that job is returned with created=False and nothing new starts.
+        # on_created(job) runs before a new job starts, e.g. to post the
+        # message its progress is written to.
+        with self._lock:
+            self._prune()
+            active = self._active_job(project_name)
+            if active:
+                return active, False
+            job = RepositoryJob(next(self._ids), project_name, remote_url)
+            self.jobs[job.id] = job
+        try:
+            if on_created:
+                on_created(job)
+            job.future = self.executor.submit(self._run, job, on_progress, on_done, clone_options)
+        except BaseException as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = time.time()
+            raise
+        return job, True
+
+    def active_job(self, project_name):
+        with self._lock:
+            self._prune()
+            return self._active_job(project_name)
+
+    def _active_job(self, project_name):
+        for job in self.jobs.values():
+            if job.project_name == project_name and job.is_active():
+                return job
+        return None
+
+    def _prune(self):
+        # Called with _lock held.
+        cutoff = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at is not None and job.finished_at <= cutoff]:
+            del self.jobs[job_id]
+
+    def _run(self, job, on_progress, on_done, clone_options):
+        job.status = "running"
+        job.started_at = time.time()
+        last_report = [0.0]
+
+        def report(line):
+            job.progress = line
+            now = time.monotonic()
+            # git prints many progress lines per second; pass on a few.
+            if on_progress and now - last_report[0] >= PROGRESS_INTERVAL:
+                last_report[0] = now
+                on_progress(job, line)
+
+        try:
+            job.path = file_operations.clone_repository(job.remote_url, job.project_name, on_progress=report, **clone_options)
+            job.status = "succeeded"
+        except (ValueError, FileExistsError, RuntimeError, OSError) as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Repository job {job.id} for {job.project_name} failed: {e}")
+        job.finished_at = time.time()
+        if on_done:
+            try:
+                on_done(job)
+            except Exception as e:
+                logger.error(f"Error in repository job callback: {e}")
+        return job
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", os.path.join(os.getcwd(), "cache", "responses.db"))
+DEFAULT_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "86400"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+DEFAULT_SEMANTIC_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0"))
+EMBEDDING_DIMENSIONS = 256
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def embed(text, dimensions=EMBEDDING_DIMENSIONS):
+    # Local hashed bag-of-words embedding: cheap, dependency free and good
+    # enough to catch rephrasings of the same question.
+    vector = [0.0] * dimensions
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[index] += sign
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm:
+        vector = [v / norm for v in vector]
+    return vector
+
+
+def cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+class CacheEntry:
+    __slots__ = ("key", "scope", "namespace", "response", "expires_at", "embedding")
+
+    def __init__(self, key, scope, namespace, response, expires_at, embedding=None):
+        self.key = key
+        self.scope = scope
+        self.namespace = namespace
+        self.response = response
+        self.expires_at = expires_at
+        self.embedding = embedding
+
+
+# Two tier cache for completions. The exact tier is keyed on a hash of
+# (model, system message, user message); the optional semantic tier matches
+# user messages by embedding similarity within the same (model, system message)
+# scope. The SQLite file is the shared store for every process using it; each
+# process keeps its recently used entries in an in-memory LRU in front of it.
+# A memory hit is confirmed against the table, so an entry invalidated or
+# evicted by another process is not served, and eviction trims the table by
+# last access across all processes.
+class ResponseCache:
+    def __init__(self, db_path=None, ttl=None, max_entries=None, semantic_threshold=None):
+        self.db_path = db_path or DEFAULT_CACHE_PATH
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self.max_entries = max_entries or DEFAULT_MAX_ENTRIES
+        self.semantic_threshold = DEFAULT_SEMANTIC_THRESHOLD if semantic_threshold is None else semantic_threshold
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, scope TEXT, namespace TEXT, response TEXT, "
+            "expires_at REAL, last_access REAL, embedding TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_namespace ON responses (namespace)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._db.commit()
+        self._load()
+
+    @property
+    def semantic_enabled(self):
+        return self.semantic_threshold > 0
+
+    @staticmethod
+    def make_key(model, system_message, user_message):
+        payload = json.dumps([model, system_message, user_message], separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def make_scope(model, system_message):
+        return hashlib.sha256(json.dumps([model, system_message]).encode()).hexdigest()
+
+    def _load(self):
+        now = time.time()
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        rows = self._db.execute(
+            "SELECT key, scope, namespace, response, expires_at, embedding FROM responses "
+            "ORDER BY last_access DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for row in reversed(rows):
+            entry = self._entry(row)
+            self.entries[entry.key] = entry
+        self._db.commit()
+        logger.info(f"Loaded {len(self.entries)} cached responses from {self.db_path}")
+
+    @staticmethod
+    def _entry(row):
+        key, scope, namespace, response, expires_at, embedding = row
+        return CacheEntry(key, scope, namespace, response, expires_at, json.loads(embedding) if embedding else None)
+
+    def get(self, model, system_message, user_message):
+        key = self.make_key(model, system_message, user_message)
+        now = time.time()
+        with self._lock:
+            entry = self._confirm(self.entries.get(key), now)
+            if entry is None:
+                # Possibly written by another process since we last looked.
+                row = self._db.execute(
+                    "SELECT key, scope, namespace, response, expires_at, embedding FROM responses "
+                    "WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    entry = self._confirm(self._remember(self._entry(row)), now)
+            if entry is None and self.semantic_enabled:
+                scope = self.make_scope(model, system_message)
+                entry = self._confirm(self._find_similar(scope, user_message, now), now)
+                if entry is not None:
+                    self.semantic_hits += 1
+            elif entry is not None:
+                self.hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry.key)
+            return entry.response
+
+    def _confirm(self, entry, now):
+        # Touches the entry's row; an expired entry, or one whose row another
+        # process has invalidated or evicted, is dropped and not served.
+        if entry is None:
+            return None
+        if entry.expires_at > now:
+            cursor = self._db.execute("UPDATE responses SET last_access = ? WHERE key = ? AND expires_at > ?", (now, entry.key, now))
+            self._db.commit()
+            if cursor.rowcount:
+                return entry
+        self._remove(entry)
+        return None
+
+    def _find_similar(self, scope, user_message, now):
+        query = embed(user_message)
+        best, best_score = None, self.semantic_threshold
+        for entry in self.entries.values():
+            if entry.scope != scope or entry.embedding is None or entry.expires_at <= now:
+                continue
+            score = cosine(query, entry.embedding)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def set(self, model, system_message, user_message, response, namespace=None):
+        key = self.make_key(model, system_message, user_message)
+        now = time.time()
+        embedding = embed(user_message) if self.semantic_enabled else None
+        entry = CacheEntry(key, self.make_scope(model, system_message), namespace, response, now + self.ttl, embedding)
+        with self._lock:
+            self._remember(entry)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, entry.scope, namespace, response, entry.expires_at, now, json.dumps(embedding) if embedding else None)
+            )
+            # Least recently used across every process sharing the file.
+            cursor = self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
+            self.evictions += max(cursor.rowcount, 0)
+            self._db.commit()
+
+    def _remember(self, entry):
+        # Dropping an entry from memory leaves its row for the other processes.
+        self.entries[entry.key] = entry
+        self.entries.move_to_end(entry.key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def _remove(self, entry):
+        self.entries.pop(entry.key, None)
+        self._db.execute("DELETE FROM responses WHERE key = ?", (entry.key,))
+        self._db.commit()
+
+    def invalidate(self, namespace):
+        with self._lock:
+            stale = [key for key, entry in self.entries.items() if entry.namespace == namespace]
+            for key in stale:
+                del self.entries[key]
+            self._db.execute("DELETE FROM responses WHERE namespace = ?", (namespace,))
+            self._db.commit()
+        logger.info(f"Invalidated {len(stale)} cached responses for project: {namespace}")
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from agent.context_manager import ContextManager
+from agent.context_store import create_store
+from agent.shared_state import create_state_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "500"))
+SESSION_STATE_TTL = float(os.environ.get("SESSION_STATE_TTL", "604800"))
+SESSION_LEASE_TTL = float(os.environ.get("SESSION_LEASE_TTL", "600"))
+SESSION_CLAIM_TIMEOUT = float(os.environ.get("SESSION_CLAIM_TIMEOUT", "120"))
+
+
+# Project contexts loaded from disk, shared read-only by every session that
+# works on the same project. Sessions copy a context before changing it.
+class SharedContextCache:
+    def __init__(self):
+        self.contexts = {}
+        self._lock = threading.Lock()
+
+    def get(self, project_name, loader):
+        with self._lock:
+            if project_name not in self.contexts:
+                self.contexts[project_name] = loader(project_name)
+            return self.contexts[project_name]
+
+    def put(self, project_name, context):
+        with self._lock:
+            self.contexts[project_name] = context
+
+    def discard(self, project_name):
+        with self._lock:
+            self.contexts.pop(project_name, None)
+
+
+class Session:
+    def __init__(self, key, user_id, channel_id, context_manager):
+        self.key = key
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.context_manager = context_manager
+        self.setup_state = None
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+        # Set when its project was saved while the session was busy; the
+        # context is reloaded the next time the session is checked out.
+        self.stale = False
+        # Bookkeeping for the shared state store (multi-worker mode).
+        self.revision = None
+        self.persisted = None
+        self.project_version = None
+
+
+class SessionRegistry:
+    def __init__(self, max_sessions=None, storage_dir='./contexts', template_file='contexts/templates/context_template.json', state=None):
+        self.max_sessions = max_sessions or DEFAULT_MAX_SESSIONS
+        # With a shared state backend (STATE_BACKEND=sqlite/redis) sessions are
+        # persisted after every event and can be picked up by any worker.
+        self.state = state if state is not None else create_state_store()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.storage_dir = storage_dir
+        self.template_file = template_file
+        self.shared_contexts = SharedContextCache()
+        self.store = create_store(storage_dir)
+        self.save_listeners = []
+        self.sessions = OrderedDict()
+        self._lock = threading.Lock()
+        # Owns the template loaded once for every session and answers
+        # project listings without touching any session's state.
+        self.projects = ContextManager(storage_dir, template_file, store=self.store)
+        self.context_template = self.projects.context_template
+        self.schema = self.projects.schema
+
+    @staticmethod
+    def make_key(user_id, channel_id):
+        return f"{channel_id}:{user_id}"
+
+    def get(self, user_id, channel_id):
+        key = self.make_key(user_id, channel_id)
+        with self._lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = Session(key, user_id, channel_id, self._create_context_manager())
+                self.sessions[key] = session
+                self._evict()
+            else:
+                self.sessions.move_to_end(key)
+            session.last_used = time.monotonic()
+            return session
+
+    @contextmanager
+    def checkout(self, user_id, channel_id):
+        # Yields the session with its lock held. Eviction skips locked
+        # sessions, so once the lock is taken the session is checked to still
+        # be the registered one; if it was evicted in between, look it up again.
+        while True:
+            session = self.get(user_id, channel_id)
+            session.lock.acquire()
+            with self._lock:
+                if self.sessions.get(session.key) is session:
+                    break
+            session.lock.release()
+        try:
+            if session.stale:
+                session.stale = False
+                self._reload_shared(session, session.context_manager.current_project)
+            yield session
+        finally:
+            session.lock.release()
+
+    def _create_context_manager(self):
+        context_manager = ContextManager(
+            self.storage_dir,
+            self.template_file,
+            context_template=self.context_template,
+            schema=self.schema,
+            shared_contexts=self.shared_contexts,
+            store=self.store
+        )
+        context_manager.save_listeners.append(self._on_context_saved)
+        return context_manager
+
+    def _evict(self):
+        # Least recently used first; sessions busy handling a message and the
+        # session just created are never evicted.
+        for key in list(self.sessions)[:-1]:
+            if len(self.sessions) <= self.max_sessions:
+                return
+            session = self.sessions[key]
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                del self.sessions[key]
+                logger.info(f"Evicted idle session {key}")
+            finally:
+                session.lock.release()
+
+    @contextmanager
+    def claim(self, session):
+        # Holds the session's lease while one event is handled, so no other
+        # worker handles the same user and channel at the same time, and
+        # brings the session up to date with what other workers wrote.
+        if not self.state.shared:
+            yield session
+            return
+        lease = f"session:{session.key}"
+        deadline = time.monotonic() + SESSION_CLAIM_TIMEOUT
+        while not self.state.acquire_lease(lease, self.worker_id, SESSION_LEASE_TTL):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Session {session.key} is busy in another worker")
+            time.sleep(0.05)
+        try:
+            self.refresh(session)
+            try:
+                yield session
+            finally:
+                self.persist(session)
+        finally:
+            self.state.release_lease(lease, self.worker_id)
+
+    def _record(self, session):
+        context_manager = session.context_manager
+        project = context_manager.current_project
+        saved = project is not None and self.store.exists(project)
+        # Unsaved contexts (a setup in progress) travel with the session.
+        draft = None if saved else context_manager.current_context
+        return {"setup_state": session.setup_state, "project": project, "draft": draft}
+
+    def persist(self, session):
+        try:
+            record = self._record(session)
+            encoded = json.dumps(record, sort_keys=True)
+            if encoded == session.persisted:
+                return
+            record["revision"] = f"{self.worker_id}:{time.time_ns()}"
+            self.state.set("sessions", session.key, record, ttl=SESSION_STATE_TTL)
+            session.persisted = encoded
+            session.revision = record["revision"]
+        except Exception as e:
+            logger.error(f"Error persisting session {session.key}: {e}")
+
+    def refresh(self, session):
+        record = self.state.get("sessions", session.key)
+        if record is not None and record.get("revision") != session.revision:
+            self._apply(session, record)
+            return
+        project = session.context_manager.current_project
+        if project and session.context_manager.context_is_shared:
+            version = self.state.get("project_versions", project)
+            if version != session.project_version:
+                # Saved by another worker since this one loaded it.
+                self.shared_contexts.discard(project)
+                self._load_project(session, project)
+
+    def _apply(self, session, record):
+        context_manager = session.context_manager
+        session.setup_state = record.get("setup_state")
+        project = record.get("project")
+        if record.get("draft") is not None:
+            context_manager.current_context = record["draft"]
+            context_manager.current_project = project
+            context_manager.context_is_shared = False
+        elif project:
+            self._load_project(session, project)
+        else:
+            context_manager.clear_param()
+        session.revision = record.get("revision")
+        session.persisted = json.dumps({k: v for k, v in record.items() if k != "revision"}, sort_keys=True)
+
+    def _load_project(self, session, project):
+        session.project_version = self.state.get("project_versions", project)
+        try:
+            session.context_manager.load_context(project)
+        except FileNotFoundError:
+            session.context_manager.clear_param()
+
+    def _on_context_saved(self, project_name):
+        if self.state.shared:
+            self.state.set("project_versions", project_name, f"{self.worker_id}:{time.time_ns()}")
+        # Point sessions that are only reading this project at the new version.
+        # Busy sessions are not waited for (two sessions saving the same
+        # project would deadlock); they reload on their next checkout.
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            if session.context_manager.current_project != project_name:
+                continue
+            if not session.lock.acquire(blocking=False):
+                session.stale = True
+                continue
+            try:
+                self._reload_shared(session, project_name)
+            finally:
+                session.lock.release()
+        for listener in self.save_listeners:
+            listener(project_name)
+
+    def _reload_shared(self, session, project_name):
+        # Called with session.lock held.
+        context_manager = session.context_manager
+        if project_name and context_manager.current_project == project_name and context_manager.context_is_shared:
+            try:
+                context_manager.load_context(project_name)
+            except FileNotFoundError:
+                context_manager.clear_param()
+
+    def list_projects(self):
+        return self.projects.list_projects()
+
+    def __len__(self):
+        return len(self.sessions)
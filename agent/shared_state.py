@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH") or os.path.join(os.getcwd(), "cache", "state.db")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+STATE_KEY_PREFIX = os.environ.get("STATE_KEY_PREFIX", "consultai")
+
+# Characters with a meaning in Redis MATCH patterns.
+GLOB_SPECIAL = re.compile(r"([*?\[\]\\])")
+
+
+# Small key/value interface for state that several bot processes must agree
+# on: session records, event dedup keys and leases. Values are JSON; every
+# entry may expire. add_if_absent and acquire_lease are atomic, so they can be
+# used to claim work across processes.
+class StateStore:
+    shared = False
+
+    def get(self, namespace, key, default=None):
+        raise NotImplementedError
+
+    def set(self, namespace, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def delete_prefix(self, namespace, prefix):
+        # Deletes every key of the namespace that starts with prefix.
+        raise NotImplementedError
+
+    def add_if_absent(self, namespace, keys, value=True, ttl=None):
+        # Adds all keys if none of them exists yet; returns whether it did.
+        raise NotImplementedError
+
+    def acquire_lease(self, name, owner, ttl):
+        raise NotImplementedError
+
+    def release_lease(self, name, owner):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def _live(self, item, now):
+        entry = self.entries.get(item)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self.entries[item]
+            return None
+        return entry
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entry = self._live((namespace, key), time.time())
+        return json.loads(entry[0]) if entry else default
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self.entries[(namespace, key)] = (json.dumps(value), time.time() + ttl if ttl else None)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self.entries.pop((namespace, key), None)
+
+    def delete_prefix(self, namespace, prefix):
+        with self._lock:
+            for item in [item for item in self.entries if item[0] == namespace and item[1].startswith(prefix)]:
+                del self.entries[item]
+
+    def add_if_absent(self, namespace, keys, value=True, ttl=None):
+        keys = [keys] if isinstance(keys, str) else keys
+        now = time.time()
+        with self._lock:
+            if any(self._live((namespace, key), now) for key in keys):
+                return False
+            for key in keys:
+                self.entries[(namespace, key)] = (json.dumps(value), now + ttl if ttl else None)
+            return True
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        with self._lock:
+            entry = self._live(("lease", name), now)
+            if entry and json.loads(entry[0]) != owner:
+                return False
+            self.entries[("lease", name)] = (json.dumps(owner), now + ttl)
+            return True
+
+    def release_lease(self, name, owner):
+        with self._lock:
+            entry = self._live(("lease", name), time.time())
+            if entry and json.loads(entry[0]) == owner:
+                del self.entries[("lease", name)]
+
+
+# One table in a local SQLite file (WAL mode), shared by every worker process
+# on the host. Atomic operations run inside BEGIN IMMEDIATE transactions.
+class SQLiteStateStore(StateStore):
+    shared = True
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or STATE_DB_PATH
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT, key TEXT, value TEXT, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),))
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _transaction(self, func):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(time.time())
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    self._db.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),))
+                self._db.execute("COMMIT")
+                return result
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _read(self, namespace, key, now):
+        row = self._db.execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, now)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _write(self, namespace, key, value, ttl, now):
+        self._db.execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), now + ttl if ttl else None)
+        )
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            value = self._read(namespace, key, time.time())
+        return default if value is None else json.loads(value)
+
+    def set(self, namespace, key, value, ttl=None):
+        self._transaction(lambda now: self._write(namespace, key, value, ttl, now))
+
+    def delete(self, namespace, key):
+        self._transaction(lambda now: self._db.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key)))
+
+    def delete_prefix(self, namespace, prefix):
+        self._transaction(lambda now: self._db.execute(
+            "DELETE FROM state WHERE namespace = ? AND substr(key, 1, ?) = ?", (namespace, len(prefix), prefix)
+        ))
+
+    def add_if_absent(self, namespace, keys, value=True, ttl=None):
+        keys = [keys] if isinstance(keys, str) else keys
+
+        def add(now):
+            if any(self._read(namespace, key, now) is not None for key in keys):
+                return False
+            for key in keys:
+                self._write(namespace, key, value, ttl, now)
+            return True
+        return self._transaction(add)
+
+    def acquire_lease(self, name, owner, ttl):
+        def acquire(now):
+            current = self._read("lease", name, now)
+            if current is not None and json.loads(current) != owner:
+                return False
+            self._write("lease", name, owner, ttl, now)
+            return True
+        return self._transaction(acquire)
+
+    def release_lease(self, name, owner):
+        def release(now):
+            current = self._read("lease", name, now)
+            if current is not None and json.loads(current) == owner:
+                self._db.execute("DELETE FROM state WHERE namespace = 'lease' AND key = ?", (name,))
+        self._transaction(release)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Redis (or any server speaking its protocol) for workers on several hosts.
+# Needs the optional `redis` package.
+class RedisStateStore(StateStore):
+    shared = True
+
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    ACQUIRE_SCRIPT = (
+        "local current = redis.call('get', KEYS[1]) "
+        "if current == false or current == ARGV[1] then redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2]) return 1 end "
+        "return 0"
+    )
+
+    def __init__(self, url=None, prefix=None):
+        if redis is None:
+            raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url or REDIS_URL)
+        self.prefix = prefix or STATE_KEY_PREFIX
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace, key, default=None):
+        value = self.client.get(self._key(namespace, key))
+        return default if value is None else json.loads(value)
+
+    def set(self, namespace, key, value, ttl=None):
+        self.client.set(self._key(namespace, key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+    def delete_prefix(self, namespace, prefix):
+        pattern = GLOB_SPECIAL.sub(r"\\\1", self._key(namespace, prefix)) + "*"
+        keys = list(self.client.scan_iter(match=pattern, count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def add_if_absent(self, namespace, keys, value=True, ttl=None):
+        keys = [keys] if isinstance(keys, str) else keys
+        encoded = json.dumps(value)
+        # MSETNX is all-or-nothing; expiry is set right after.
+        if not self.client.msetnx({self._key(namespace, key): encoded for key in keys}):
+            return False
+        if ttl:
+            pipeline = self.client.pipeline()
+            for key in keys:
+                pipeline.pexpire(self._key(namespace, key), int(ttl * 1000))
+            pipeline.execute()
+        return True
+
+    def acquire_lease(self, name, owner, ttl):
+        return bool(self.client.eval(self.ACQUIRE_SCRIPT, 1, self._key("lease", name), json.dumps(owner), int(ttl * 1000)))
+
+    def release_lease(self, name, owner):
+        self.client.eval(self.RELEASE_SCRIPT, 1, self._key("lease", name), json.dumps(owner))
+
+    def close(self):
+        self.client.close()
+
+
+def create_state_store(backend=None):
+    backend = (backend or STATE_BACKEND).lower()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend == "redis":
+        return RedisStateStore()
+    if backend != "memory":
+        raise ValueError(f"Unknown STATE_BACKEND: {backend}")
+    return MemoryStateStore()
@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+TEMPLATE_FILE = os.path.join(ROOT, "contexts", "templates", "context_template.json")
+MARKER = re.compile(r"bench-\d+-\d+")
+DONE = "[bench-done]"
+PROJECT = "bench"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test SlackBot against local Slack and OpenAI stand-ins")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated numbers of simultaneous users")
+    parser.add_argument("--requests", type=int, default=100, help="Messages sent per concurrency level")
+    parser.add_argument("--channels", type=int, default=0, help="Channels shared by the users (default: one per user)")
+    parser.add_argument("--openai-latency", type=float, default=0.05, help="Seconds before the fake model answers")
+    parser.add_argument("--chunk-delay", type=float, default=0.005, help="Seconds between streamed chunks")
+    parser.add_argument("--response-words", type=int, default=60)
+    parser.add_argument("--slack-latency", type=float, default=0.0, help="Seconds added to every Slack Web API call")
+    parser.add_argument("--workers", type=int, help="Dispatcher concurrency (MAX_CONCURRENT_REQUESTS)")
+    parser.add_argument("--no-stream", action="store_true", help="Reply with one message instead of streaming")
+    parser.add_argument("--tracemalloc", action="store_true", help="Track Python allocations (slows the run down)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for each reply")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--max-p95", type=float, help="Exit with status 1 if any level's p95 latency exceeds this")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    # Module-level settings are read at import time, so this runs before the
+    # bot and agent modules are imported.
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ["SLACK_BOT_TOKEN"] = "xoxb-bench"
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    os.environ["CODE_CONTEXT_ENABLED"] = "false"
+    os.environ["STREAM_RESPONSES"] = "false" if args.no_stream else "true"
+    os.environ.setdefault("STREAM_FLUSH_INTERVAL", "0.25")
+    if args.workers:
+        os.environ["MAX_CONCURRENT_REQUESTS"] = str(args.workers)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_responder(words):
+    def responder(model, messages):
+        match = MARKER.search(messages[-1]["content"])
+        marker = match.group(0) if match else "bench-unknown"
+        return f"{marker} " + " ".join(f"word{i}" for i in range(words)) + f" {DONE}"
+    return responder
+
+
+# One concurrency level: `concurrency` simulated users, each sending its share
+# of the messages one after another and waiting for the bot's final reply
+# before sending the next.
+class LoadRun:
+    def __init__(self, args, concurrency, storage_dir):
+        self.args = args
+        self.concurrency = concurrency
+        self.channels = args.channels or concurrency
+        self.storage_dir = storage_dir
+        self.records = {}
+        self.lock = threading.Lock()
+
+    def on_slack_message(self, method, payload, received_at):
+        match = MARKER.search(payload.get("text") or "")
+        if not match:
+            return
+        record = self.records.get(match.group(0))
+        if record is None:
+            return
+        with self.lock:
+            if record["first"] is None:
+                record["first"] = received_at
+            if DONE in payload["text"] and record["done"] is None:
+                record["done"] = received_at
+                record["event"].set()
+
+    def build_bot(self, slack):
+        from slack_bolt import App
+        from slack_sdk import WebClient
+        from agent.core import ConsultAIAgent
+        from agent.session_manager import SessionRegistry
+        from chat_integration.slack_bot import SlackBot
+        from tests.fakes.slack_server import FakeSocketModeHandler
+
+        app = App(client=WebClient(token=os.environ["SLACK_BOT_TOKEN"], base_url=slack.base_url))
+        sessions = SessionRegistry(storage_dir=self.storage_dir, template_file=TEMPLATE_FILE)
+        if PROJECT not in sessions.list_projects():
+            sessions.projects.new_context(PROJECT)
+            sessions.projects.save_context()
+        transport = FakeSocketModeHandler(app)
+        bot = SlackBot(app=app, agent=ConsultAIAgent(), sessions=sessions, socket_mode_handler=transport)
+        for user in range(self.concurrency):
+            session = bot.sessions.get(f"UBENCH{user}", f"CBENCH{user % self.channels}")
+            session.context_manager.load_context(PROJECT)
+        return bot, transport
+
+    def user_loop(self, transport, user, count):
+        for i in range(count):
+            marker = f"bench-{user}-{i}"
+            record = {"sent": time.perf_counter(), "first": None, "done": None, "event": threading.Event()}
+            self.records[marker] = record
+            record["ack"] = transport.send_event({
+                "type": "app_mention",
+                "user": f"UBENCH{user}",
+                "channel": f"CBENCH{user % self.channels}",
+                "text": f"<@UBENCHBOT> {marker} how should I structure the service layer?",
+            })
+            if not record["event"].wait(self.args.timeout):
+                record["timed_out"] = True
+
+    def run(self):
+        from tests.fakes.openai_server import FakeOpenAIServer
+        from tests.fakes.slack_server import FakeSlackServer
+
+        openai_server = FakeOpenAIServer(
+            responder=make_responder(self.args.response_words),
+            latency=self.args.openai_latency,
+            chunk_delay=self.args.chunk_delay,
+        )
+        with openai_server, FakeSlackServer(on_message=self.on_slack_message, latency=self.args.slack_latency) as slack:
+            os.environ["OPENAI_BASE_URL"] = openai_server.base_url
+            bot, transport = self.build_bot(slack)
+            bot.start()
+            try:
+                if self.args.tracemalloc:
+                    tracemalloc.start()
+                shares = [self.args.requests // self.concurrency + (1 if u < self.args.requests % self.concurrency else 0) for u in range(self.concurrency)]
+                threads = [threading.Thread(target=self.user_loop, args=(transport, u, n)) for u, n in enumerate(shares)]
+                started = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1] if self.args.tracemalloc else None
+                if self.args.tracemalloc:
+                    tracemalloc.stop()
+            finally:
+                bot.stop(timeout=self.args.timeout)
+        return self.summarize(elapsed, peak)
+
+    def summarize(self, elapsed, peak):
+        completed = [r for r in self.records.values() if r["done"] is not None]
+        latencies = [r["done"] - r["sent"] for r in completed]
+        first = [r["first"] - r["sent"] for r in completed if r["first"] is not None]
+        acks = [r["ack"] for r in self.records.values() if "ack" in r]
+        return {
+            "concurrency": self.concurrency,
+            "channels": self.channels,
+            "sent": len(self.records),
+            "completed": len(completed),
+            "timed_out": sum(1 for r in self.records.values() if r.get("timed_out")),
+            "elapsed_s": elapsed,
+            "throughput_rps": len(completed) / elapsed if elapsed else 0.0,
+            "latency_p50_s": percentile(latencies, 50),
+            "latency_p95_s": percentile(latencies, 95),
+            "latency_p99_s": percentile(latencies, 99),
+            "first_text_p50_s": percentile(first, 50),
+            "ack_p50_s": percentile(acks, 50),
+            "ack_p99_s": percentile(acks, 99),
+            "tracemalloc_peak_mb": peak / 1e6 if peak is not None else None,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        }
+
+
+def format_row(result):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f}"
+
+    peak = result["tracemalloc_peak_mb"]
+    return (
+        f"{result['concurrency']:>5} {result['completed']:>5}/{result['sent']:<5} {result['throughput_rps']:>8.1f} "
+        f"{ms(result['latency_p50_s']):>8} {ms(result['latency_p95_s']):>8} {ms(result['latency_p99_s']):>8} "
+        f"{ms(result['first_text_p50_s']):>8} {ms(result['ack_p50_s']):>7} "
+        f"{'-' if peak is None else f'{peak:.1f}':>8} {result['max_rss_mb']:>8.1f}"
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Settings from .env (MAX_CONCURRENT_REQUESTS, SCHEDULER_*...) apply to the
+    # run; the ones configure_environment sets win over them.
+    load_dotenv(os.path.join(ROOT, ".env"))
+    configure_environment(args)
+    import logging
+    logging.disable(logging.WARNING)
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    results = []
+    print(f"{'users':>5} {'done':>11} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'first ms':>8} {'ack ms':>7} {'heap MB':>8} {'rss MB':>8}")
+    with tempfile.TemporaryDirectory(prefix="consultai-bench-") as storage_dir:
+        for concurrency in levels:
+            result = LoadRun(args, concurrency, storage_dir).run()
+            results.append(result)
+            print(format_row(result), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+    failed = [r for r in results if r["timed_out"] or (args.max_p95 is not None and (r["latency_p95_s"] or 0) > args.max_p95)]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from agent.metrics import metrics
+from agent.shared_state import SQLiteStateStore
+
+logger = logging.getLogger(__name__)
+
+EVENT_DEDUP_WINDOW = float(os.environ.get("EVENT_DEDUP_WINDOW", "600"))
+EVENT_DEDUP_MAX_ENTRIES = int(os.environ.get("EVENT_DEDUP_MAX_ENTRIES", "10000"))
+EVENT_DEDUP_PATH = os.environ.get("EVENT_DEDUP_PATH", "")
+
+metrics.counter("consultai_slack_duplicate_events_total", "Slack events dropped as duplicates", ("event",))
+
+
+def event_keys(event, body=None):
+    # A message can arrive as both app_mention and message (different
+    # event_ids, same client_msg_id and ts), and a slow ack makes Slack
+    # redeliver with the same event_id. Any shared key marks a duplicate.
+    keys = []
+    if body and body.get("event_id"):
+        keys.append(f"event:{body['event_id']}")
+    if event.get("client_msg_id"):
+        keys.append(f"msg:{event['client_msg_id']}")
+    if event.get("channel") and event.get("ts"):
+        keys.append(f"ts:{event['channel']}:{event['ts']}")
+    return keys
+
+
+# Remembers recently seen event keys for `window` seconds. The in-memory set
+# is bounded by max_entries (oldest dropped first). With a shared state store,
+# or a SQLite file at db_path, keys are also claimed there so a restarted bot,
+# or another worker, does not process a redelivery again.
+class EventDeduplicator:
+    def __init__(self, window=None, max_entries=None, db_path=None, state=None):
+        self.window = EVENT_DEDUP_WINDOW if window is None else window
+        self.max_entries = max_entries or EVENT_DEDUP_MAX_ENTRIES
+        self.db_path = EVENT_DEDUP_PATH if db_path is None else db_path
+        self.seen = OrderedDict()
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._owns_state = state is None and bool(self.db_path)
+        self.state = SQLiteStateStore(self.db_path) if self._owns_state else state
+
+    def _purge(self, now):
+        while self.seen:
+            key, expires_at = next(iter(self.seen.items()))
+            if expires_at > now and len(self.seen) <= self.max_entries:
+                break
+            del self.seen[key]
+
+    def is_duplicate(self, keys):
+        # Records the keys and reports whether any of them was already seen.
+        if not keys:
+            return False
+        now = time.time()
+        expires_at = now + self.window
+        with self._lock:
+            self._purge(now)
+            duplicate = any(key in self.seen for key in keys)
+            if not duplicate and self.state is not None:
+                try:
+                    duplicate = not self.state.add_if_absent("events", keys, ttl=self.window)
+                except Exception as e:
+                    logger.error(f"Error checking event deduplication store: {e}")
+            for key in keys:
+                self.seen[key] = expires_at
+                self.seen.move_to_end(key)
+            if duplicate:
+                self.duplicates += 1
+            return duplicate
+
+    def is_duplicate_event(self, event, body=None):
+        duplicate = self.is_duplicate(event_keys(event, body))
+        if duplicate:
+            metrics.inc("consultai_slack_duplicate_events_total", event=event.get("type", ""))
+        return duplicate
+
+    def close(self):
+        if self._owns_state and self.state is not None:
+            self.state.close()
+            self.state = None
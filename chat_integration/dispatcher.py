@@ -0,0 +1,376 @@
+import asyncio
+import functools
+import inspect
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "16"))
+DEFAULT_MAX_QUEUE_SIZE = int(os.environ.get("MAX_QUEUED_EVENTS_PER_CHANNEL", "50"))
+DEFAULT_MAX_QUEUE_DEPTH = int(os.environ.get("SCHEDULER_MAX_QUEUE_DEPTH", "200"))
+DEFAULT_SHUTDOWN_TIMEOUT = float(os.environ.get("SHUTDOWN_TIMEOUT", "30"))
+# Share of the workers that review and bulk jobs may occupy at once, so
+# there is always room left for interactive messages.
+SCHEDULER_REVIEW_SHARE = float(os.environ.get("SCHEDULER_REVIEW_SHARE", "0.5"))
+SCHEDULER_BULK_SHARE = float(os.environ.get("SCHEDULER_BULK_SHARE", "0.25"))
+# Jobs waiting longer than this go to the front of the line (still within
+# their class's share), so sustained chat traffic cannot starve reviews.
+SCHEDULER_AGING_SECONDS = float(os.environ.get("SCHEDULER_AGING_SECONDS", "60"))
+# Fair-queueing weights as "ID=weight,..." for Slack user or channel ids; a
+# weight of 2 gets twice the share of a busy dispatcher. Unlisted ids get 1.
+SCHEDULER_WEIGHTS = os.environ.get("SCHEDULER_WEIGHTS", "")
+
+INTERACTIVE = 0
+REVIEW = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", REVIEW: "review", BULK: "bulk"}
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+def parse_weights(spec):
+    weights = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, value = item.partition("=")
+        weight = float(value)
+        if not name.strip() or weight <= 0:
+            raise ValueError(f"Invalid scheduler weight: {item!r}")
+        weights[name.strip()] = weight
+    return weights
+
+
+class _Job:
+    __slots__ = ("key", "func", "args", "kwargs", "future", "priority", "tag", "seq", "enqueued_at")
+
+    def __init__(self, key, func, args, kwargs, future, priority, seq):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.priority = priority
+        self.seq = seq
+        self.tag = 0.0
+        self.enqueued_at = time.monotonic()
+
+
+# A fixed set of daemon worker threads. ThreadPoolExecutor's workers are
+# joined at interpreter exit, so a job still running after stop()'s deadline
+# would keep the process alive; these are abandoned instead.
+class _WorkerPool(Executor):
+    def __init__(self, max_workers, thread_name_prefix):
+        self._work = queue.SimpleQueue()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{thread_name_prefix}_{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._work.put((future, fn, args, kwargs))
+        return future
+
+    def _worker(self):
+        while True:
+            item = self._work.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        if cancel_futures:
+            while True:
+                try:
+                    item = self._work.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        for _ in self._threads:
+            self._work.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+# Runs Slack event work off the listener threads. Jobs sharing a key (a user in
+# a channel) run one at a time in submission order; different keys run
+# concurrently up to max_concurrency. When workers are busy the next job is
+# picked by priority class (interactive > review > bulk) and, within a class,
+# by self-clocked fair queueing over the keys, so one key submitting many jobs
+# only gets its weighted share. Scheduling happens on a private asyncio loop:
+# coroutine functions are awaited directly, plain callables run on a bounded
+# worker pool.
+class EventDispatcher:
+    def __init__(self, max_concurrency=None, max_queue_size=None, max_queue_depth=None):
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.max_queue_size = max_queue_size or DEFAULT_MAX_QUEUE_SIZE
+        self.max_queue_depth = max_queue_depth or DEFAULT_MAX_QUEUE_DEPTH
+        self.class_limits = {
+            INTERACTIVE: self.max_concurrency,
+            REVIEW: max(1, int(self.max_concurrency * SCHEDULER_REVIEW_SHARE)),
+            BULK: max(1, int(self.max_concurrency * SCHEDULER_BULK_SHARE)),
+        }
+        self.loop = None
+        self._thread = None
+        self._executor = None
+        self._notifier = None
+        self._flows = {}
+        self._running_keys = set()
+        self._running = {priority: 0 for priority in PRIORITY_NAMES}
+        self._virtual_time = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._last_tags = {}
+        self._queued = 0
+        # Jobs handed to the loop by submit() that _enqueue has not seen yet;
+        # the dispatcher is not idle while there are any.
+        self._submitting = 0
+        self._submitting_lock = threading.Lock()
+        self._seq = itertools.count()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._accepting = False
+
+    def start(self):
+        if self._thread is not None:
+            return
+        logger.info(f"Starting event dispatcher with {self.max_concurrency} workers")
+        self.loop = asyncio.new_event_loop()
+        self._executor = _WorkerPool(max_workers=self.max_concurrency, thread_name_prefix="consultai-worker")
+        # Queue position replies must not wait for a busy worker.
+        self._notifier = _WorkerPool(max_workers=2, thread_name_prefix="consultai-notify")
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="consultai-dispatcher", daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._accepting = True
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+        # Anything still running past the drain deadline is abandoned and
+        # anything still queued is cancelled, so no caller waits forever.
+        for flow in self._flows.values():
+            for job in flow:
+                job.future.cancel()
+        self._flows.clear()
+        self._queued = 0
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def is_accepting(self):
+        return self._accepting
+
+    def submit(self, key, func, *args, priority=INTERACTIVE, weight=1.0, on_queued=None, **kwargs):
+        # on_queued(position) is called from a worker thread when the job has
+        # to wait; cancelling the returned future drops a job still queued.
+        if not self._accepting:
+            raise RuntimeError("Dispatcher is not accepting new work")
+        with self._submitting_lock:
+            self._submitting += 1
+        self._idle.clear()
+        future = Future()
+        job = _Job(key, func, args, kwargs, future, priority, next(self._seq))
+        future.add_done_callback(functools.partial(self._on_done, job))
+        try:
+            self.loop.call_soon_threadsafe(self._enqueue, job, weight, on_queued)
+        except RuntimeError:
+            # The loop was closed by stop() in the meantime.
+            with self._submitting_lock:
+                self._submitting -= 1
+            raise
+        return future
+
+    def _on_done(self, job, future):
+        if future.cancelled() and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._discard, job)
+
+    def pending(self, key=None):
+        # Jobs waiting for a worker; running jobs are not counted.
+        if key is not None:
+            flow = self._flows.get(key)
+            return len(flow) if flow else 0
+        return self._queued
+
+    def cancel(self, key):
+        # Cancels the jobs of `key` that have not started; returns how many.
+        if self._thread is None:
+            return 0
+        result = Future()
+        self.loop.call_soon_threadsafe(lambda: result.set_result(self._cancel_queued(key)))
+        return result.result()
+
+    def _cancel_queued(self, key):
+        cancelled = sum(1 for job in list(self._flows.get(key, ())) if job.future.cancel())
+        for job in list(self._flows.get(key, ())):
+            self._discard(job)
+        return cancelled
+
+    def _enqueue(self, job, weight, on_queued):
+        with self._submitting_lock:
+            self._submitting -= 1
+        if job.future.cancelled():
+            self._check_idle()
+            return
+        flow = self._flows.get(job.key)
+        if self._queued >= self.max_queue_depth or (flow is not None and len(flow) >= self.max_queue_size):
+            logger.warning(f"Queue for {job.key} is full, rejecting event")
+            job.future.set_exception(QueueFullError(f"Too many pending events for {job.key}"))
+            self._check_idle()
+            return
+        if flow is None:
+            flow = self._flows[job.key] = deque()
+        # Finish tag of self-clocked fair queueing: a key's jobs are spaced
+        # 1/weight apart from the class's virtual time or its previous job.
+        last_tag = self._last_tags.get((job.key, job.priority), 0.0)
+        job.tag = max(self._virtual_time[job.priority], last_tag) + 1.0 / weight
+        self._last_tags[(job.key, job.priority)] = job.tag
+        flow.append(job)
+        self._queued += 1
+        self._schedule()
+        # Only worth telling the user when they wait for capacity, not just
+        # for their own previous message.
+        saturated = sum(self._running.values()) >= self.max_concurrency or self._running[job.priority] >= self.class_limits[job.priority]
+        if on_queued is not None and saturated and not job.future.running() and not job.future.done():
+            self._notifier.submit(self._notify_queued, on_queued, self._position(job))
+
+    def _notify_queued(self, on_queued, position):
+        try:
+            on_queued(position)
+        except Exception as e:
+            logger.error(f"Error reporting queue position: {e}")
+
+    def _sort_key(self, job, now):
+        if now - job.enqueued_at >= SCHEDULER_AGING_SECONDS:
+            return (-1, job.enqueued_at, job.seq)
+        return (job.priority, job.tag, job.seq)
+
+    def _position(self, job):
+        # 1-based place in line: everything that would be picked before it,
+        # counting the earlier jobs of its own key.
+        now = time.monotonic()
+        own = self._sort_key(job, now)
+        ahead = 0
+        for key, flow in self._flows.items():
+            for other in flow:
+                if other is job:
+                    continue
+                if (key == job.key and other.seq < job.seq) or self._sort_key(other, now) < own:
+                    ahead += 1
+        return ahead + 1
+
+    def _discard(self, job):
+        flow = self._flows.get(job.key)
+        if flow is not None and job in flow:
+            flow.remove(job)
+            self._queued -= 1
+            if not flow:
+                self._drop_flow(job.key)
+        self._check_idle()
+
+    def _drop_flow(self, key):
+        del self._flows[key]
+        for priority in PRIORITY_NAMES:
+            self._last_tags.pop((key, priority), None)
+
+    def _next_job(self):
+        now = time.monotonic()
+        best = None
+        for key, flow in self._flows.items():
+            if key in self._running_keys or not flow:
+                continue
+            job = flow[0]
+            if self._running[job.priority] >= self.class_limits[job.priority]:
+                continue
+            if best is None or self._sort_key(job, now) < self._sort_key(best, now):
+                best = job
+        return best
+
+    def _schedule(self):
+        while sum(self._running.values()) < self.max_concurrency:
+            job = self._next_job()
+            if job is None:
+                return
+            flow = self._flows[job.key]
+            flow.popleft()
+            self._queued -= 1
+            self._virtual_time[job.priority] = max(self._virtual_time[job.priority], job.tag)
+            if not job.future.set_running_or_notify_cancel():
+                if not flow:
+                    self._drop_flow(job.key)
+                continue
+            self._running_keys.add(job.key)
+            self._running[job.priority] += 1
+            self.loop.create_task(self._run(job))
+
+    async def _run(self, job):
+        try:
+            if inspect.iscoroutinefunction(job.func):
+                result = await job.func(*job.args, **job.kwargs)
+            else:
+                result = await self.loop.run_in_executor(self._executor, functools.partial(job.func, *job.args, **job.kwargs))
+            job.future.set_result(result)
+        except asyncio.CancelledError:
+            job.future.set_exception(RuntimeError("Dispatcher stopped before the job finished"))
+            raise
+        except Exception as e:
+            logger.error(f"Error handling {PRIORITY_NAMES[job.priority]} event for {job.key}: {e}")
+            job.future.set_exception(e)
+        finally:
+            self._running_keys.discard(job.key)
+            self._running[job.priority] -= 1
+            flow = self._flows.get(job.key)
+            if flow is not None and not flow:
+                self._drop_flow(job.key)
+            self._schedule()
+            self._check_idle()
+
+    def drain(self, timeout=None):
+        # Stop taking new work and wait for queued and in-flight jobs to finish.
+        # Returns False if the deadline passed with work still outstanding.
+        self._accepting = False
+        if self._thread is None:
+            return True
+        timeout = DEFAULT_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        logger.info(f"Draining event dispatcher (deadline {timeout}s)")
+        self.loop.call_soon_threadsafe(self._check_idle)
+        drained = self._idle.wait(timeout)
+        if not drained:
+            logger.warning(f"Dispatcher drain deadline reached with {self.pending()} queued events")
+        return drained
+
+    def _check_idle(self):
+        with self._submitting_lock:
+            if not self._flows and not self._running_keys and not self._submitting:
+                self._idle.set()
+
+    def stop(self, timeout=None):
+        if self._thread is None:
+            return
+        self.drain(timeout)
+        logger.info("Stopping event dispatcher")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._notifier.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
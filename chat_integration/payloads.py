@@ -0,0 +1,158 @@
+import itertools
+import logging
+import os
+import re
+import urllib.error
+import urllib.request
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+# Slack cuts messages off at 40k characters and folds anything past ~4k
+# behind "Show more", so long results go out in parts or as a snippet.
+SLACK_MESSAGE_LIMIT = int(os.environ.get("SLACK_MESSAGE_LIMIT", "3500"))
+SLACK_SNIPPET_THRESHOLD = int(os.environ.get("SLACK_SNIPPET_THRESHOLD", "12000"))
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR") or os.path.join(os.getcwd(), "cache", "uploads")
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(2 * 1024 * 1024)))
+UPLOAD_TIMEOUT = float(os.environ.get("UPLOAD_TIMEOUT", "30"))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+FENCE = "```"
+UNSAFE_FILENAME = re.compile(r"[^\w.-]+")
+
+
+class UploadError(Exception):
+    pass
+
+
+def split_message(text, limit=None):
+    # Splits on line boundaries (hard-splitting longer lines) so every part
+    # fits in `limit` characters. A code block cut in two is closed at the
+    # end of one part and reopened at the start of the next.
+    limit = limit or SLACK_MESSAGE_LIMIT
+    if len(text) <= limit:
+        return [text]
+    budget = max(1, limit - 2 * (len(FENCE) + 1))
+    pieces = []
+    for line in text.splitlines(keepends=True):
+        pieces.extend(line[i:i + budget] for i in range(0, len(line), budget))
+    parts, current, in_fence = [], "", False
+    for piece in pieces:
+        if current and len(current) + len(piece) > budget:
+            if in_fence:
+                current = current.rstrip("\n") + "\n" + FENCE
+            parts.append(current)
+            current = FENCE + "\n" if in_fence else ""
+        current += piece
+        if piece.lstrip().startswith(FENCE):
+            in_fence = not in_fence
+    if current.strip():
+        parts.append(current)
+    return parts
+
+
+def _post(say, text, prefix, thread_ts, message):
+    if message is not None:
+        message.finish(text)
+        return message.ts
+    return say(f"{prefix}{text}", thread_ts=thread_ts)["ts"]
+
+
+def _reply_parts(say, parts, thread_ts):
+    for part in parts:
+        say(part, thread_ts=thread_ts)
+
+
+def _first_marker(count):
+    return f"\n_(1/{count}, continued in thread)_"
+
+
+def _split_numbered(text, limit):
+    # The part markers take room from every part, and their length depends on
+    # the number of parts: split again until the count fits in the room left.
+    count = 1
+    while True:
+        parts = split_message(text, max(1, limit - len(_first_marker(count))))
+        if len(str(len(parts))) <= len(str(count)):
+            return parts
+        count = len(parts)
+
+
+# Sends a result that may not fit in one Slack message: up to
+# SLACK_MESSAGE_LIMIT characters as one message, up to SLACK_SNIPPET_THRESHOLD
+# as numbered parts with the rest in the thread, and anything longer as an
+# uploaded snippet. `message` is a StreamingMessage already showing the start
+# of the result; it gets the first part instead of a new message.
+def send_long_text(say, text, prefix="", thread_ts=None, message=None, filename="response.md", title=None):
+    if len(prefix) + len(text) <= SLACK_MESSAGE_LIMIT:
+        _post(say, text, prefix, thread_ts, message)
+        return
+    if len(text) > SLACK_SNIPPET_THRESHOLD:
+        ts = _post(say, f"The result is too long for a message, so it is attached as `{filename}`.", prefix, thread_ts, message)
+        try:
+            say.client.files_upload_v2(channel=say.channel, thread_ts=thread_ts or ts, content=text, filename=filename, title=title or filename)
+            return
+        except SlackApiError as e:
+            logger.error(f"Error uploading {filename}, sending it as messages instead: {e}")
+            _reply_parts(say, split_message(text), thread_ts or ts)
+            return
+    parts = _split_numbered(text, SLACK_MESSAGE_LIMIT - len(prefix))
+    ts = _post(say, f"{parts[0]}{_first_marker(len(parts))}", prefix, thread_ts, message)
+    _reply_parts(say, [f"{part}\n_({number}/{len(parts)})_" for number, part in enumerate(parts[1:], start=2)], thread_ts or ts)
+
+
+def safe_filename(name):
+    name = UNSAFE_FILENAME.sub("_", os.path.basename(name or "")).strip("._")
+    return name or "upload.txt"
+
+
+def download_file(token, file_info, directory, max_bytes=None):
+    # Streams a file shared in Slack to `directory` in UPLOAD_CHUNK_BYTES
+    # pieces, so an upload is never held in memory whole; returns its path.
+    max_bytes = max_bytes or UPLOAD_MAX_BYTES
+    name = safe_filename(file_info.get("name") or file_info.get("id"))
+    if file_info.get("size", 0) > max_bytes:
+        raise UploadError(f"{name} is larger than {max_bytes // 1024} KB")
+    url = file_info.get("url_private_download") or file_info.get("url_private")
+    if not url or file_info.get("mode") in ("external", "tombstone"):
+        raise UploadError(f"{name} cannot be downloaded")
+    os.makedirs(directory, exist_ok=True)
+    path, fd = _create_exclusive(directory, name, file_info.get("id"))
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+    size = 0
+    downloaded = False
+    try:
+        with os.fdopen(fd, "wb") as f, urllib.request.urlopen(request, timeout=UPLOAD_TIMEOUT) as response:
+            # Without the files:read scope Slack answers with its login page.
+            if response.headers.get_content_type() == "text/html" and file_info.get("mimetype") != "text/html":
+                raise UploadError(f"{name} could not be downloaded; is the files:read scope granted?")
+            while True:
+                chunk = response.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if size == 0 and b"\0" in chunk[:1024]:
+                    raise UploadError(f"{name} is not a text file")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(f"{name} is larger than {max_bytes // 1024} KB")
+                f.write(chunk)
+        downloaded = True
+        return path
+    except (urllib.error.URLError, OSError) as e:
+        raise UploadError(f"{name} could not be downloaded: {e}")
+    finally:
+        if not downloaded and os.path.exists(path):
+            os.remove(path)
+
+
+def _create_exclusive(directory, name, file_id):
+    # Files with the same name are kept apart by the Slack file id (and a
+    # counter after that); O_EXCL makes sure no download overwrites another.
+    file_id = safe_filename(file_id)
+    for attempt in itertools.count():
+        candidate = name if attempt == 0 else f"{file_id}_{name}" if attempt == 1 else f"{file_id}_{attempt}_{name}"
+        path = os.path.join(directory, candidate)
+        try:
+            return path, os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            continue
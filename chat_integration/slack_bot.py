@@ -1,90 +1,231 @@
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from agent.core import ConsultAIAgent
-from dotenv import load_dotenv
 import os
 import logging
-from agent.context_manager import ContextManager
+import shutil
+import uuid
+from agent.session_manager import SessionRegistry
+from agent.repository_jobs import RepositoryJobManager
 import threading
+import time
 import agent.file_operations as file_operations
+from agent.metrics import metrics, MetricsServer
+from agent.errors import ERROR_RESPONSE
+from chat_integration.dispatcher import BULK, INTERACTIVE, REVIEW, SCHEDULER_WEIGHTS, EventDispatcher, QueueFullError, parse_weights
+from chat_integration.streaming import StreamingMessage
+from chat_integration.deduplication import EventDeduplicator
+from chat_integration.payloads import UPLOAD_DIR, UploadError, download_file, send_long_text
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 class SlackBot:
-    def __init__(self):
-        self.app = App(token=os.environ["SLACK_BOT_TOKEN"])
-        self.agent = ConsultAIAgent()
-        self.context_manager = ContextManager()
+    def __init__(self, app=None, agent=None, sessions=None, socket_mode_handler=None):
+        # The optional arguments let benchmarks and tests swap in local
+        # stand-ins for Slack, OpenAI and the Socket Mode connection.
+        started = time.perf_counter()
+        self.startup_timings = {}
+        metrics.configure()
+        self.app = app if app is not None else App(token=os.environ["SLACK_BOT_TOKEN"])
+        # The agent (and the OpenAI client it imports) is built on first use,
+        # or in the background once the socket is up; see agent.
+        self._agent = agent
+        self._agent_lock = threading.Lock()
+        self.sessions = sessions if sessions is not None else SessionRegistry()
+        self.sessions.save_listeners.append(self._invalidate_agent_cache)
         self.socket_mode_handler = None
-        self.setup_states = {}
+        self._socket_mode_transport = socket_mode_handler
+        self.dispatcher = EventDispatcher()
+        self.scheduler_weights = parse_weights(SCHEDULER_WEIGHTS)
+        self.repository_jobs = RepositoryJobManager()
+        # Worker processes sharing a state backend also share dedup keys and
+        # conversation history, so any worker can pick up any thread.
+        self.shared_state = self.sessions.state if self.sessions.state.shared else None
+        self.deduplicator = EventDeduplicator(state=self.shared_state)
+        if self._agent is not None:
+            self._attach_agent(self._agent)
+        self.stream_responses = os.environ.get("STREAM_RESPONSES", "true").lower() == "true"
+        self.metrics_server = None
+        metrics.gauge("consultai_dispatcher_queue_depth", "Events waiting in the dispatcher queue", callback=lambda: {(): self.dispatcher.pending()})
+        metrics.gauge("consultai_sessions", "Active user sessions", callback=lambda: {(): len(self.sessions.sessions)})
         self.running = False
+        self._stop_requested = threading.Event()
+        self._stopped = threading.Event()
         self.setup_event_handlers()
+        self.startup_timings["bot_init"] = time.perf_counter() - started
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            with self._agent_lock:
+                if self._agent is None:
+                    started = time.perf_counter()
+                    from agent.core import ConsultAIAgent
+                    self._agent = self._attach_agent(ConsultAIAgent())
+                    self.startup_timings["agent_init"] = time.perf_counter() - started
+                    logger.info(f"Agent ready in {self.startup_timings['agent_init']:.2f}s")
+        return self._agent
+
+    def _attach_agent(self, agent):
+        if self.shared_state is not None:
+            agent.memory.state = self.shared_state
+        return agent
+
+    def _invalidate_agent_cache(self, project_name):
+        # Nothing is cached before the agent exists.
+        if self._agent is not None:
+            self._agent.invalidate_cache(project_name)
+
+    def _warm_up(self):
+        try:
+            self.agent
+        except Exception as e:
+            logger.error(f"Error initializing the agent: {e}")
 
     def setup_event_handlers(self):
+        # Events are acked by Bolt as soon as these handlers return; the work
+        # itself runs on the dispatcher, so long completions never make Slack
+        # redeliver. Redeliveries and mention/message pairs are dropped here.
         @self.app.event("app_mention")
-        def handle_mention(event, say):
+        def handle_mention(event, body, say):
             logger.info(f"Received mention: {event}")
-            user_id = event["user"]
+            metrics.inc("consultai_slack_events_total", event="app_mention")
+            if self.deduplicator.is_duplicate_event(event, body):
+                logger.info(f"Ignoring duplicate event {body.get('event_id')}")
+                return
             text = event['text'].split('>', 1)[1].strip()
-            self.handle_user_input(user_id, text, say)
+            self.dispatch_user_event(event, text, say)
 
         @self.app.action("start_setup")
         def handle_start_setup(ack, body, say):
             logger.info("Starting setup process")
             ack()
+            metrics.inc("consultai_slack_events_total", event="start_setup")
             user_id = body["user"]["id"]
-            say("Great! Let's set up a new project.")
-            self.start_new_project_setup(user_id, say)
+            self.dispatch(user_id, body.get("channel", {}).get("id"), say, self.handle_start_setup, say)
 
         @self.app.action("select_project")
         def handle_project_selection(ack, body, say):
             logger.info("Handling project selection")
             ack()
+            metrics.inc("consultai_slack_events_total", event="select_project")
+            user_id = body["user"]["id"]
             selected_project = body["actions"][0]["selected_option"]["value"]
-            self.context_manager.load_context(selected_project)
-            say(f"Project '{selected_project}' has been loaded. You can now start working with this context.")
-            say(f"To delete the current context, say cancel")
+            self.dispatch(user_id, body.get("channel", {}).get("id"), say, self.handle_project_selection, selected_project, say)
 
         @self.app.event("message")
-        def handle_message(event, say):
+        def handle_message(event, body, say):
             logger.info(f"Received message: {event}")
+            metrics.inc("consultai_slack_events_total", event="message")
             if event.get("channel_type") == "im":
-                user_id = event["user"]
-                text = event["text"]
-                self.handle_user_input(user_id, text, say)
+                if self.deduplicator.is_duplicate_event(event, body):
+                    logger.info(f"Ignoring duplicate event {body.get('event_id')}")
+                    return
+                self.dispatch_user_event(event, event["text"], say)
+
+    def dispatch_user_event(self, event, text, say):
+        user_id = event["user"]
+        channel_id = event.get("channel")
+        thread_ts = event.get("thread_ts")
+        if event.get("files"):
+            priority = REVIEW if len(event["files"]) == 1 else BULK
+            self.dispatch(user_id, channel_id, say, self.handle_file_upload, event["files"], say, thread_ts, priority=priority)
+        elif text.lower() == "cancel queued":
+            # Handled right here: queued behind the user's own work it would
+            # only run once there is nothing left to cancel.
+            cancelled = self.dispatcher.cancel(self.sessions.make_key(user_id, channel_id))
+            say(f"Cancelled {cancelled} queued request{'s' if cancelled != 1 else ''}." if cancelled else "You have no queued requests.")
+        else:
+            self.dispatch(user_id, channel_id, say, self.handle_user_input, text, say, thread_ts, priority=self.classify_request(text))
+
+    @staticmethod
+    def review_target(text):
+        # "review <target>" -> target; None for anything else.
+        command, _, target = text.strip().partition(" ")
+        if command.lower() != "review":
+            return None
+        return target.strip() or None
+
+    @classmethod
+    def classify_request(cls, text):
+        # Reviews of a single file outrank directory, range and project
+        # reviews; everything else is interactive.
+        target = cls.review_target(text)
+        if target is None:
+            return INTERACTIVE
+        return REVIEW if ".." not in target and os.path.splitext(target)[1] else BULK
+
+    def dispatch(self, user_id, channel_id, say, func, *args, priority=INTERACTIVE):
+        # Hand the work to the dispatcher so a slow completion for one user
+        # never holds up Bolt's listener threads or other users.
+        if not self.running or not self.dispatcher.is_accepting():
+            logger.info("Bot is shutting down, not accepting new events")
+            say("I'm restarting right now. Please try again in a moment.")
+            return None
+        future = self.dispatcher.submit(
+            self.sessions.make_key(user_id, channel_id), self.run_in_session, user_id, channel_id, func, *args,
+            priority=priority,
+            weight=self.scheduler_weights.get(user_id) or self.scheduler_weights.get(channel_id) or 1.0,
+            on_queued=lambda position: say(f"I'm busy right now, your request is queued at position {position}. Say `cancel queued` to drop it."),
+            submitted_at=time.perf_counter()
+        )
+        future.add_done_callback(lambda f: self._report_dispatch_error(f, say))
+        return future
+
+    def run_in_session(self, user_id, channel_id, func, *args, submitted_at=None):
+        if submitted_at is not None:
+            metrics.observe("consultai_stage_duration_seconds", time.perf_counter() - submitted_at, stage="queue_wait")
+        with metrics.stage("handle_event"):
+            with self.sessions.checkout(user_id, channel_id) as session, self.sessions.claim(session):
+                return func(session, *args)
+
+    def _report_dispatch_error(self, future, say):
+        if future.cancelled() or future.exception() is None:
+            return
+        if isinstance(future.exception(), QueueFullError):
+            say("I'm handling too many requests right now. Please try again in a moment.")
+        else:
+            say("I'm sorry, I encountered an error while processing your message.")
 
-    def start_new_project_setup(self, user_id, say):
-        questions = self.context_manager.setup_new_project("")  # Temporary empty name
+    def handle_start_setup(self, session, say):
+        say("Great! Let's set up a new project.")
+        self.start_new_project_setup(session, say)
+
+    def handle_project_selection(self, session, selected_project, say):
+        session.context_manager.load_context(selected_project)
+        self.agent.memory.clear(session.key, threads=True)
+        say(f"Project '{selected_project}' has been loaded. You can now start working with this context.")
+        say(f"To delete the current context, say cancel")
+
+    def start_new_project_setup(self, session, say):
+        questions = session.context_manager.setup_new_project("")  # Temporary empty name
         if questions:
-            self.setup_states[user_id] = {
+            session.setup_state = {
                 "step": "setup",
                 "questions": questions,
                 "current_question": 0
             }
-            self.ask_next_question(user_id, say)
+            self.ask_next_question(session, say)
         else:
             say("There was an error setting up the project. Please try again.")
 
-    def handle_user_input(self, user_id, text, say):
+    def handle_user_input(self, session, text, say, thread_ts=None):
         if text.lower() == "cancel":
-            self.handle_context_delete(user_id, say)
+            self.handle_context_delete(session, say)
         elif text.lower() == "clone repository":
-            self.start_repository_clone(user_id, say)
-        elif user_id in self.setup_states:
-            self.handle_setup_response(user_id, text, say)
-        elif not self.context_manager.current_project:
+            self.start_repository_clone(session, say)
+        elif session.setup_state is not None:
+            self.handle_setup_response(session, text, say)
+        elif self.review_target(text) and session.context_manager.current_project:
+            self.start_review(session, self.review_target(text), say)
+        elif not session.context_manager.current_project:
             say("Hello! It looks like we haven't set up a project context yet.")
-            self.start_project_selection(user_id, say)
+            self.start_project_selection(session, say)
         else:
-            self.process_and_respond(text, user_id, say)
+            self.process_and_respond(text, session, say, thread_ts)
     
-    def handle_context_delete(self, user_id, say):
-        if user_id in self.setup_states or self.context_manager.current_project:
-            context_info = self.context_manager.get_current_context() if self.context_manager.current_project else self.setup_states[user_id]
+    def handle_context_delete(self, session, say):
+        if session.setup_state is not None or session.context_manager.current_project:
+            context_info = session.context_manager.get_current_context() if session.context_manager.current_project else session.setup_state
             
             confirmation_message = (
                 "You're about to delete the following context:\n"
@@ -93,16 +234,16 @@ class SlackBot:
             )
             say(confirmation_message)
             
-            self.setup_states[user_id] = {"step": "confirm_delete", "context_info": context_info}
+            session.setup_state = {"step": "confirm_delete", "context_info": context_info}
         else:
             say("There's no active context or setup process to cancel.")
 
-    def start_project_selection(self, user_id, say):
+    def start_project_selection(self, session, say):
         logger.info("Starting project selection")
-        projects = self.context_manager.list_projects()
+        projects = self.sessions.list_projects()
         if not projects:
             say("No existing projects found. Let's create a new one.")
-            self.setup_states[user_id] = {"step": "project_name"}
+            session.setup_state = {"step": "project_name"}
             say("What's the name of your new project?")
             return
 
@@ -137,31 +278,31 @@ class SlackBot:
         ]
         say(blocks=blocks)
 
-    def cancel_setup_process(self, user_id, say):
-        if user_id in self.setup_states:
-            del self.setup_states[user_id]
+    def cancel_setup_process(self, session, say):
+        if session.setup_state is not None:
+            session.setup_state = None
             say("Setup process cancelled. You can start over anytime.")
         else:
             say("There's no active setup process to cancel.")
 
-    def handle_setup_response(self, user_id, text, say):
-        logger.info(f"Handling setup response for user {user_id}")
+    def handle_setup_response(self, session, text, say):
+        logger.info(f"Handling setup response for user {session.user_id}")
         if text.lower() == "cancel":
-            self.cancel_setup_process(user_id, say)
+            self.cancel_setup_process(session, say)
         else:
-            state = self.setup_states[user_id]
+            state = session.setup_state
             if state["step"] == "confirm_delete":
                 if text.lower() == "yes":
-                    if self.context_manager.current_project:
-                        project_name = self.context_manager.current_project
-                        self.context_manager.delete_context(project_name)
+                    if session.context_manager.current_project:
+                        project_name = session.context_manager.current_project
+                        session.context_manager.delete_context(project_name)
                         say(f"Context for project '{project_name}' has been deleted.")
                     else:
                         say("Setup process cancelled and temporary context deleted.")
-                    del self.setup_states[user_id]
+                    session.setup_state = None
                 elif text.lower() == "no":
                     say("Deletion cancelled. Your context remains unchanged.")
-                    del self.setup_states[user_id]
+                    session.setup_state = None
                 else:
                     say("Please respond with 'Yes' or 'No'.")
                 return
@@ -169,52 +310,60 @@ class SlackBot:
                 question = state["questions"][state["current_question"]]
                 param_path = f"{question['type']}.{question['field']}" if question['type'] else question['field']
                 
+                try:
+                    value = session.context_manager.set_param(param_path, text)
+                except ValueError as e:
+                    say(f"{e}. {question['question']}")
+                    return
                 if param_path == "project.name":
-                    self.context_manager.current_project = text
-                
-                self.context_manager.set_param(param_path, text)
+                    session.context_manager.current_project = value
                 state["current_question"] += 1
                 
                 if state["current_question"] < len(state["questions"]):
-                    self.ask_next_question(user_id, say)
+                    self.ask_next_question(session, say)
                 else:
-                    self.finish_setup(user_id, say)
+                    self.finish_setup(session, say)
             elif state["step"] == "set_remote_url":
-                self.context_manager.set_param('version_control.remote_url', text)
-                del self.setup_states[user_id]
-                say(f"Remote URL set to: {text}")
-                self.perform_repository_clone(say)
+                try:
+                    remote_url = file_operations.validate_remote_url(text)
+                except ValueError as e:
+                    say(f"{e} Please provide the repository URL:")
+                    return
+                session.context_manager.set_param('version_control.remote_url', remote_url, persist=True)
+                session.setup_state = None
+                say(f"Remote URL set to: {remote_url}")
+                self.perform_repository_clone(session.context_manager.current_project, remote_url, say)
 
-    def ask_next_question(self, user_id, say):
-        state = self.setup_states[user_id]
+    def ask_next_question(self, session, say):
+        state = session.setup_state
         question = state["questions"][state["current_question"]]
         say(question["question"])
 
-    def finish_setup(self, user_id, say):
-        logger.info(f"Finishing setup for user {user_id}")
+    def finish_setup(self, session, say):
+        logger.info(f"Finishing setup for user {session.user_id}")
         try:
-            self.context_manager.save_context()
-            project_name = self.context_manager.current_project
-            del self.setup_states[user_id]
+            session.context_manager.save_context()
+            project_name = session.context_manager.current_project
+            session.setup_state = None
             say(f"Great! Your project '{project_name}' context has been set up and saved. You can now start working with this context.")
             say("To delete the current context, type 'cancel'.")
         except ValueError as e:
             logger.error(f"Error saving context: {str(e)}")
             say(f"There was an error saving your project context: {str(e)}. Please try setting up the project again.")
-            del self.setup_states[user_id]
+            session.setup_state = None
     
-    def start_repository_clone(self, user_id, say):
+    def start_repository_clone(self, session, say):
         # Log the start of the repository clone process
-        logger.info(f"Starting repository clone process for user {user_id}")
+        logger.info(f"Starting repository clone process for user {session.user_id}")
 
         # Check if there's an active project context
-        if not self.context_manager.has_active_context():
+        if not session.context_manager.has_active_context():
             logger.warning("No active project context found")
             say("No active project context. Please set up or select a project first.")
             return
 
         # Retrieve the remote URL from the context
-        remote_url = self.context_manager.get_param('version_control.remote_url')
+        remote_url = session.context_manager.get_param('version_control.remote_url')
         logger.info(f"Retrieved remote URL: {remote_url}")
 
         if not remote_url:
@@ -222,46 +371,145 @@ class SlackBot:
             logger.info("Remote URL not set, prompting user for input")
             say("Remote URL is not set. Please provide the repository URL:")
             # Set up the state to handle the user's response
-            self.setup_states[user_id] = {"step": "set_remote_url"}
+            session.setup_state = {"step": "set_remote_url"}
         else:
             # If remote URL is set, proceed with the repository clone
             logger.info("Remote URL is set, proceeding with repository clone")
-            self.perform_repository_clone(self.context_manager.current_project, remote_url, say)
+            self.perform_repository_clone(session.context_manager.current_project, remote_url, say)
             # Log the completion of the function
-            logger.info("Repository clone process completed")
+            logger.info("Repository clone job submitted")
     
     def perform_repository_clone(self, project_name, remote_url, say):
-        try:
-            result = file_operations.clone_repository(project_name, remote_url)
-            say(f"Repository cloned successfully. {result}")
-        except (ValueError, FileExistsError, RuntimeError) as e:
-            say(f"Error cloning repository: {str(e)}")
+        # The clone runs in the background; progress is written into a single
+        # message that is edited in place until the job finishes.
+        message = None
+
+        def on_created(job):
+            nonlocal message
+            message = StreamingMessage(say, placeholder=f"Cloning {remote_url}...").start()
 
+        def on_progress(job, line):
+            message.set_text(f"Cloning {remote_url}...\n`{line}`")
+
+        def on_done(job):
+            if job.status == "succeeded":
+                message.finish(f"Repository cloned successfully. {job.path}")
+                if self.agent.code_index:
+                    self.agent.code_index.refresh(project_name)
+            else:
+                message.finish(f"Error cloning repository: {job.error}")
+
+        job, created = self.repository_jobs.submit(project_name, remote_url, on_progress=on_progress, on_done=on_done, on_created=on_created)
+        if not created:
+            say(f"A clone of '{project_name}' is already in progress: {job.progress or job.status}")
+
+    def start_review(self, session, target, say):
+        # "review <path>" reviews a file or directory of the cloned project,
+        # "review <base>..<head>" reviews only the hunks changed in that range.
+        project_name = session.context_manager.current_project
+        logger.info(f"Starting review of {target} in project {project_name}")
+        say(f"Reviewing `{target}` in project '{project_name}', this may take a while...")
+        if ".." in target and not os.path.exists(os.path.join(file_operations.get_project_path(project_name), target)):
+            base, head = target.split("..", 1)
+            response = self.agent.process_command('review_changes', {'project': project_name, 'base': base, 'head': head or 'HEAD'})
+        else:
+            response = self.agent.process_command('review_project', {'project': project_name, 'path': target})
+        send_long_text(say, response, prefix=f"<@{session.user_id}> ", filename="review.md", title=f"Review of {target}")
 
-    def process_and_respond(self, text, user, say):
+    def handle_file_upload(self, session, files, say, thread_ts=None):
+        # Code shared as Slack files is downloaded to a scratch directory,
+        # reviewed like files of a project and deleted again.
+        directory = os.path.join(UPLOAD_DIR, uuid.uuid4().hex)
+        try:
+            names = []
+            for file_info in files:
+                try:
+                    names.append(os.path.basename(download_file(self.app.client.token, file_info, directory)))
+                except UploadError as e:
+                    logger.warning(f"Skipping uploaded file: {e}")
+                    say(f"I couldn't read an uploaded file: {e}", thread_ts=thread_ts)
+            if not names:
+                return
+            say(f"Reviewing {', '.join(f'`{name}`' for name in names)}, this may take a while...", thread_ts=thread_ts)
+            response = self.agent.process_command('review_files', {'root': directory, 'files': names})
+            send_long_text(say, response, prefix=f"<@{session.user_id}> ", thread_ts=thread_ts, filename="review.md", title=f"Review of {', '.join(names)}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def process_and_respond(self, text, session, say, thread_ts=None):
+        user = session.user_id
         logger.info(f"Processing message from user {user}: {text}")
-        current_context = self.context_manager.get_current_context()
-        response = self.agent.process_message(text, current_context)
-        logger.info(f"Sending response: {response[:50]}...")
-        say(f"<@{user}> {response}")
+        current_context = session.context_manager.get_current_context()
+        # Each Slack thread has its own history; top-level messages share the session's.
+        conversation_key = f"{session.key}:{thread_ts}" if thread_ts else session.key
+        history = self.agent.conversation_history(conversation_key)
+        if self.stream_responses:
+            message = StreamingMessage(say, prefix=f"<@{user}> ", thread_ts=thread_ts).start()
+            response = self.agent.process_message(text, current_context, on_delta=message.append, route_key=session.key, history=history)
+            logger.info(f"Sending response: {response[:50]}...")
+            with metrics.stage("respond"):
+                send_long_text(say, response, prefix=f"<@{user}> ", thread_ts=thread_ts, message=message)
+        else:
+            response = self.agent.process_message(text, current_context, route_key=session.key, history=history)
+            logger.info(f"Sending response: {response[:50]}...")
+            with metrics.stage("respond"):
+                send_long_text(say, response, prefix=f"<@{user}> ", thread_ts=thread_ts)
+        if response != ERROR_RESPONSE:
+            self.agent.remember(conversation_key, text, response)
 
     def start(self):
         logger.info("Starting the bot...")
         self.running = True
-        self.socket_mode_handler = SocketModeHandler(self.app, os.environ["SLACK_APP_TOKEN"])
-        logger.info("Bot started. To terminate the bot press ctrl+c") 
-        self.socket_mode_handler.start()
+        self.dispatcher.start()
+        if metrics.enabled and self.metrics_server is None:
+            self.metrics_server = MetricsServer().start()
+        self._stop_requested.clear()
+        self._stopped.clear()
+        self.socket_mode_handler = self._socket_mode_transport if self._socket_mode_transport is not None else SocketModeHandler(self.app, os.environ["SLACK_APP_TOKEN"])
+        # connect() returns once the websocket is up; the handler's own
+        # threads keep receiving events while run() blocks on an event.
+        connect_started = time.perf_counter()
+        self.socket_mode_handler.connect()
+        self.startup_timings["socket_connect"] = time.perf_counter() - connect_started
+        logger.info("Bot started. To terminate the bot press ctrl+c")
+        logger.info("Startup: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.startup_timings.items()))
+        # Events that arrive before this finishes wait for it in agent.
+        if self._agent is None:
+            threading.Thread(target=self._warm_up, name="consultai-warm-up", daemon=True).start()
 
-    def stop(self):
+    def request_stop(self):
+        # Safe to call from a signal handler: only wakes up run().
+        self._stop_requested.set()
+
+    def stop(self, timeout=None):
+        if not self.running:
+            return
         logger.info("Stopping the bot...")
         self.running = False
+        self._stop_requested.set()
+        # Drain in-flight work before closing the socket so pending replies
+        # still go out; the Web API used by say() does not need the socket.
+        self.dispatcher.stop(timeout)
+        self.repository_jobs.shutdown()
+        self.deduplicator.close()
+        if self._agent is not None:
+            self._agent.memory.close()
+            if self._agent.code_index:
+                self._agent.code_index.close()
         if self.socket_mode_handler:
             self.socket_mode_handler.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self._stopped.set()
         logger.info("Bot stopped.")
 
     def is_running(self):
         return self.running
 
+    def wait(self, timeout=None):
+        return self._stopped.wait(timeout)
+
     def __enter__(self):
         self.start()
         return self
@@ -271,8 +519,10 @@ class SlackBot:
     
     def run(self):
         self.start()
-        while self.is_running():
-            pass
+        try:
+            self._stop_requested.wait()
+        finally:
+            self.stop()
 
 # def start_bot():
 #     bot = SlackBot()
@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+import time
+from slack_sdk.errors import SlackApiError
+from chat_integration.payloads import SLACK_MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+STREAM_FLUSH_CHARS = int(os.environ.get("STREAM_FLUSH_CHARS", "200"))
+STREAM_FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", "1.0"))
+
+
+# Posts a placeholder message and keeps editing it with chat.update while an
+# LLM response streams in. Deltas are coalesced so that we update at most once
+# per flush interval and only after enough new text has arrived, which keeps us
+# well inside chat.update's rate limit.
+class StreamingMessage:
+    def __init__(self, say, prefix="", placeholder="_Thinking..._", flush_chars=None, flush_interval=None, thread_ts=None):
+        self.say = say
+        self.client = say.client
+        self.prefix = prefix
+        self.placeholder = placeholder
+        self.flush_chars = STREAM_FLUSH_CHARS if flush_chars is None else flush_chars
+        self.flush_interval = STREAM_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.thread_ts = thread_ts
+        self.channel = None
+        self.ts = None
+        self.text = ""
+        self._flushed_length = 0
+        self._last_flush = 0.0
+        self._backoff_until = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        response = self.say(f"{self.prefix}{self.placeholder}", thread_ts=self.thread_ts)
+        self.channel = response["channel"]
+        self.ts = response["ts"]
+        self._last_flush = time.monotonic()
+        return self
+
+    def append(self, delta):
+        with self._lock:
+            self.text += delta
+            now = time.monotonic()
+            if len(self.text) - self._flushed_length < self.flush_chars:
+                return
+            if now - self._last_flush < self.flush_interval or now < self._backoff_until:
+                return
+            self._update(self.text + " ...", now)
+
+    def set_text(self, text):
+        # Replaces the whole message, e.g. with a new progress line.
+        with self._lock:
+            self.text = text
+            now = time.monotonic()
+            if now - self._last_flush < self.flush_interval or now < self._backoff_until:
+                return
+            self._update(self.text, now)
+
+    def finish(self, text=None):
+        with self._lock:
+            if text is not None:
+                self.text = text
+            # The final update must land, so wait out any rate limit backoff.
+            for _ in range(3):
+                wait = self._backoff_until - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                if self._update(self.text, time.monotonic()):
+                    return
+
+    def _update(self, text, now):
+        # Long responses are previewed here and sent in full by send_long_text.
+        if len(self.prefix) + len(text) > SLACK_MESSAGE_LIMIT:
+            text = text[:max(0, SLACK_MESSAGE_LIMIT - len(self.prefix) - 4)] + " ..."
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, text=f"{self.prefix}{text}")
+            self._flushed_length = len(self.text)
+            self._last_flush = now
+            return True
+        except SlackApiError as e:
+            if e.response.status_code == 429:
+                retry_after = int(e.response.headers.get("Retry-After", 1))
+                logger.warning(f"chat.update rate limited, backing off {retry_after}s")
+                self._backoff_until = now + retry_after
+            else:
+                logger.error(f"Error updating streamed message: {e}")
+            return False
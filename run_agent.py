@@ -1,32 +1,140 @@
 import sys
 import os
 import signal
+import argparse
+import logging
+import multiprocessing
+import time
 
 # Add the project root directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from chat_integration.slack_bot import SlackBot
+from dotenv import load_dotenv
+
+# Loaded before the bot modules are imported: they read their settings from
+# the environment at import time.
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+BOT_WORKERS = int(os.environ.get("BOT_WORKERS", "1"))
+WORKER_RESTART_DELAY = float(os.environ.get("WORKER_RESTART_DELAY", "5"))
+WORKER_STOP_TIMEOUT = float(os.environ.get("WORKER_STOP_TIMEOUT", "60"))
+
+bot = None
 
 def signal_handler(signum, frame):
     print("\nReceived signal to exit. Shutting down gracefully...")
     if bot:
-        bot.stop()
-    sys.exit(0)
+        bot.request_stop()
+    else:
+        sys.exit(0)
 
-if __name__ == "__main__":
-    bot = None
-    
-    # Set up signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+def run_bot():
+    global bot
+    started = time.perf_counter()
+    from chat_integration.slack_bot import SlackBot
+    imports = time.perf_counter() - started
 
     try:
         bot = SlackBot()
+        bot.startup_timings = {"imports": imports, **bot.startup_timings}
         bot.run()
     except Exception as e:
         print(f"An error occurred: {e}")
-    # finally:
-    #     if bot:
-    #         bot.stop()
-    #     print("Bot has been shut down.")
-    #     sys.exit(0)
+
+def run_worker(index):
+    # Each worker opens its own Socket Mode connection; Slack spreads events
+    # across all open connections of the app. Ctrl+C reaches the whole process
+    # group, so workers leave SIGINT to the supervisor and stop on its SIGTERM.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal_handler)
+    if "METRICS_PORT" in os.environ or index:
+        os.environ["METRICS_PORT"] = str(int(os.environ.get("METRICS_PORT", "9464")) + index)
+    run_bot()
+
+# Runs several bot processes sharing session state through STATE_BACKEND.
+# Workers that exit unexpectedly are restarted; SIGHUP restarts them one at a
+# time, so at least the others keep serving Slack during a deploy.
+class WorkerSupervisor:
+    def __init__(self, workers):
+        self.workers = workers
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = {}
+        self.stopping = False
+        self.reload_requested = False
+
+    def start_worker(self, index):
+        process = self.context.Process(target=run_worker, args=(index,), name=f"consultai-worker-{index}")
+        process.start()
+        self.processes[index] = process
+        print(f"Started worker {index} (pid {process.pid})")
+
+    def stop_worker(self, index):
+        process = self.processes[index]
+        if process.is_alive():
+            process.terminate()
+            process.join(WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                print(f"Worker {index} did not stop in time, killing it")
+                process.kill()
+                process.join()
+
+    def request_stop(self, signum, frame):
+        print("\nReceived signal to exit. Stopping workers...")
+        self.stopping = True
+
+    def request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def rolling_restart(self):
+        print("Restarting workers one at a time...")
+        for index in sorted(self.processes):
+            if self.stopping:
+                return
+            self.stop_worker(index)
+            self.start_worker(index)
+            # Give the new worker time to connect before stopping the next one.
+            time.sleep(WORKER_RESTART_DELAY)
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGHUP, self.request_reload)
+        for index in range(self.workers):
+            self.start_worker(index)
+        try:
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.rolling_restart()
+                for index, process in list(self.processes.items()):
+                    if not process.is_alive() and not self.stopping:
+                        print(f"Worker {index} exited with code {process.exitcode}, restarting")
+                        time.sleep(WORKER_RESTART_DELAY)
+                        self.start_worker(index)
+                time.sleep(1)
+        finally:
+            for process in self.processes.values():
+                if process.is_alive():
+                    process.terminate()
+            for index in self.processes:
+                self.stop_worker(index)
+        print("All workers stopped.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the ConsultAI Slack bot")
+    parser.add_argument("--workers", type=int, default=BOT_WORKERS, help="number of bot processes (needs STATE_BACKEND=sqlite or redis)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.workers > 1:
+        # Workers must share sessions and dedup keys; a local SQLite file is
+        # enough when they all run on this host.
+        if os.environ.get("STATE_BACKEND", "memory").lower() == "memory":
+            os.environ["STATE_BACKEND"] = "sqlite"
+        WorkerSupervisor(args.workers).run()
+    else:
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+        run_bot()
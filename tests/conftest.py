@@ -0,0 +1,69 @@
+import os
+import shutil
+import time
+import pytest
+from slack_bolt import App
+from slack_sdk import WebClient
+from tests.fakes.openai_server import FakeOpenAIServer
+from tests.fakes.slack_server import FakeSlackServer, FakeSocketModeHandler
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "contexts", "templates")
+PROJECT = "demo"
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.02)
+    raise AssertionError("Timed out waiting for the bot")
+
+
+@pytest.fixture
+def openai_server(monkeypatch):
+    # The agent reads these when it is built, so every test gets a fresh one
+    # talking to the fake, without the response cache or code retrieval.
+    with FakeOpenAIServer() as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "false")
+        monkeypatch.setenv("CODE_CONTEXT_ENABLED", "false")
+        yield server
+
+
+@pytest.fixture
+def slack_server():
+    with FakeSlackServer() as server:
+        yield server
+
+
+@pytest.fixture
+def agent(openai_server):
+    from agent.core import ConsultAIAgent
+    return ConsultAIAgent()
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    from agent.session_manager import SessionRegistry
+    storage_dir = tmp_path / "contexts"
+    shutil.copytree(TEMPLATES_DIR, storage_dir / "templates")
+    registry = SessionRegistry(storage_dir=str(storage_dir), template_file=str(storage_dir / "templates" / "context_template.json"))
+    registry.projects.new_context(PROJECT)
+    registry.projects.save_context()
+    return registry
+
+
+@pytest.fixture
+def bot(slack_server, agent, sessions):
+    from chat_integration.slack_bot import SlackBot
+    app = App(client=WebClient(token="xoxb-test", base_url=slack_server.base_url))
+    transport = FakeSocketModeHandler(app)
+    bot = SlackBot(app=app, agent=agent, sessions=sessions, socket_mode_handler=transport)
+    bot.stream_responses = False
+    bot.sessions.get("U1", "C1").context_manager.load_context(PROJECT)
+    bot.start()
+    yield bot
+    bot.stop(10)
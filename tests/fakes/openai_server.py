@@ -0,0 +1,258 @@
+import itertools
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def echo_responder(model, messages):
+    return f"Echo from {model}: {messages[-1]['content'][:200]}"
+
+
+# Local stand-in for the parts of the OpenAI API ConsultAIng uses: chat
+# completions (plain and streamed), file upload/download and batches. Point
+# the SDK at it with base_url=server.base_url or OPENAI_BASE_URL. Batches end
+# as `batch_outcome`: "completed", "failed" (no output at all) or "expired"
+# (the first `batch_expire_after` requests answered, the rest in the error file).
+class FakeOpenAIServer:
+    def __init__(self, responder=None, latency=0.0, chunk_delay=0.0, chunk_words=3, batch_delay=0.0, fail_first=0, port=0,
+                 batch_outcome="completed", batch_expire_after=0):
+        self.responder = responder or echo_responder
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunk_words = chunk_words
+        self.batch_delay = batch_delay
+        self.fail_first = fail_first
+        self.port = port
+        self.batch_outcome = batch_outcome
+        self.batch_expire_after = batch_expire_after
+        self.files = {}
+        self.batches = {}
+        self.requests = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        server = self
+
+        class Handler(FakeOpenAIHandler):
+            fake = server
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def next_id(self, prefix):
+        return f"{prefix}-{next(self._ids)}"
+
+    def should_fail(self):
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return True
+            return False
+
+    def complete(self, model, messages):
+        text = self.responder(model, messages)
+        prompt_tokens = sum(len((m.get("content") or "").split()) for m in messages)
+        return {
+            "id": self.next_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text.split()), "total_tokens": prompt_tokens + len(text.split())},
+        }
+
+    def batch_state(self, batch_id):
+        batch = self.batches[batch_id]
+        if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.batch_delay:
+            self._run_batch(batch)
+        return batch
+
+    def _run_batch(self, batch):
+        requests = [json.loads(line) for line in self.files[batch["input_file_id"]]["content"].decode().splitlines() if line.strip()]
+        if self.batch_outcome == "failed":
+            batch.update({
+                "status": "failed",
+                "failed_at": int(time.time()),
+                "errors": {"object": "list", "data": [{"code": "invalid_request", "message": "The batch input file is invalid.", "line": 1}]},
+                "request_counts": {"total": len(requests), "completed": 0, "failed": 0},
+            })
+            return
+        answered = requests if self.batch_outcome == "completed" else requests[:self.batch_expire_after]
+        lines, errors = [], []
+        for request in answered:
+            body = self.complete(request["body"]["model"], request["body"]["messages"])
+            lines.append(json.dumps({
+                "id": self.next_id("batch_req"),
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": self.next_id("req"), "body": body},
+                "error": None,
+            }))
+        for request in requests[len(answered):]:
+            errors.append(json.dumps({
+                "id": self.next_id("batch_req"),
+                "custom_id": request["custom_id"],
+                "response": None,
+                "error": {"code": "batch_expired", "message": "This request could not be executed before the completion window expired."},
+            }))
+        batch.update({
+            "status": self.batch_outcome,
+            "output_file_id": self.add_file("batch_output.jsonl", "batch_output", ("\n".join(lines) + "\n").encode()) if lines else None,
+            "error_file_id": self.add_file("batch_errors.jsonl", "batch_output", ("\n".join(errors) + "\n").encode()) if errors else None,
+            f"{self.batch_outcome}_at": int(time.time()),
+            "request_counts": {"total": len(requests), "completed": len(lines), "failed": len(errors)},
+        })
+
+    def add_file(self, filename, purpose, content):
+        file_id = self.next_id("file")
+        self.files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "content": content,
+        }
+        return file_id
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = self._body()
+        self.fake.requests.append((self.path, time.time()))
+        if self.path == "/v1/chat/completions":
+            self._chat_completion(json.loads(body))
+        elif self.path == "/v1/files":
+            self._upload_file(body)
+        elif self.path == "/v1/batches":
+            self._create_batch(json.loads(body))
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+        if match and match.group(1) in self.fake.batches:
+            batch = self.fake.batch_state(match.group(1))
+            return self._json(200, batch)
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+        if match and match.group(1) in self.fake.files:
+            content = self.fake.files[match.group(1)]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _chat_completion(self, request):
+        if self.fake.should_fail():
+            return self._json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, {"retry-after-ms": "50"})
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        completion = self.fake.complete(request["model"], request["messages"])
+        if not request.get("stream"):
+            return self._json(200, completion)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = completion["choices"][0]["message"]["content"].split(" ")
+        size = self.fake.chunk_words
+        for i in range(0, len(words), size):
+            piece = " ".join(words[i:i + size]) + (" " if i + size < len(words) else "")
+            chunk = {
+                "id": completion["id"],
+                "object": "chat.completion.chunk",
+                "created": completion["created"],
+                "model": completion["model"],
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            if self.fake.chunk_delay:
+                time.sleep(self.fake.chunk_delay)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _upload_file(self, body):
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = BytesParser(policy=HTTP).parsebytes(header + body)
+        fields = {}
+        filename = "upload"
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                filename = part.get_filename()
+            fields[name] = part.get_payload(decode=True)
+        file_id = self.fake.add_file(filename, fields.get("purpose", b"batch").decode(), fields.get("file", b""))
+        record = {k: v for k, v in self.fake.files[file_id].items() if k != "content"}
+        self._json(200, record)
+
+    def _create_batch(self, request):
+        batch_id = self.fake.next_id("batch")
+        self.fake.batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"],
+            "completion_window": request["completion_window"],
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "metadata": request.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        self._json(200, self.fake.batches[batch_id])
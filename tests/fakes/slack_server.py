@@ -0,0 +1,179 @@
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+from slack_sdk.socket_mode.request import SocketModeRequest
+from slack_bolt.adapter.socket_mode.internals import run_bolt_app
+
+BOT_USER_ID = "UBENCHBOT"
+TEAM_ID = "TBENCH"
+
+
+# Local stand-in for the Slack Web API methods the bot calls (auth.test,
+# chat.postMessage, chat.update and the files_upload_v2 calls). Every write is
+# kept in `messages` and passed to on_message(method, payload, received_at) so
+# a driver can tell when a reply has arrived. Point a WebClient at it with
+# base_url=server.base_url. add_file() serves content the way Slack serves
+# shared files and returns the file object to put in an event.
+class FakeSlackServer:
+    def __init__(self, on_message=None, latency=0.0, port=0):
+        self.on_message = on_message
+        self.latency = latency
+        self.port = port
+        self.messages = []
+        self.files = {}
+        self.uploads = {}
+        self._ts = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/"
+
+    def start(self):
+        server = self
+
+        class Handler(FakeSlackHandler):
+            fake = server
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def add_file(self, name, content, mimetype="text/plain"):
+        file_id = f"F{uuid.uuid4().hex[:10].upper()}"
+        self.files[file_id] = content.encode() if isinstance(content, str) else content
+        url = f"http://127.0.0.1:{self._server.server_address[1]}/files/{file_id}/{name}"
+        return {"id": file_id, "name": name, "size": len(self.files[file_id]), "mimetype": mimetype, "mode": "hosted", "url_private": url, "url_private_download": url}
+
+    def next_ts(self):
+        return f"{int(time.time())}.{next(self._ts):06d}"
+
+    def record(self, method, payload):
+        received_at = time.perf_counter()
+        with self._lock:
+            self.messages.append((method, payload, received_at))
+        if self.on_message:
+            self.on_message(method, payload, received_at)
+
+
+class FakeSlackHandler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _payload(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode() if length else ""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(body or "{}")
+        return dict(parse_qsl(body))
+
+    def _json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = self.path.split("/")
+        content = self.fake.files.get(parts[2]) if len(parts) > 2 and parts[1] == "files" else None
+        if content is None or not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        if self.path.startswith("/upload/"):
+            length = int(self.headers.get("Content-Length", 0))
+            self.fake.uploads[self.path.rsplit("/", 1)[-1]] = self.rfile.read(length)
+            return self._json({"ok": True})
+        payload = self._payload()
+        method = self.path.rsplit("/", 1)[-1]
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        if method == "auth.test":
+            return self._json({"ok": True, "url": "https://bench.slack.com/", "team": "bench", "user": "consultai", "team_id": TEAM_ID, "user_id": BOT_USER_ID, "bot_id": "BBENCH", "is_enterprise_install": False})
+        if method == "chat.postMessage":
+            ts = self.fake.next_ts()
+            self.fake.record(method, payload)
+            return self._json({"ok": True, "channel": payload.get("channel"), "ts": ts, "message": {"text": payload.get("text"), "ts": ts}})
+        if method == "files.getUploadURLExternal":
+            file_id = f"F{uuid.uuid4().hex[:10].upper()}"
+            return self._json({"ok": True, "file_id": file_id, "upload_url": f"http://127.0.0.1:{self.fake._server.server_address[1]}/upload/{file_id}"})
+        if method == "files.completeUploadExternal":
+            self.fake.record(method, payload)
+            files = json.loads(payload.get("files", "[]"))
+            return self._json({"ok": True, "files": [{"id": f["id"], "title": f.get("title")} for f in files]})
+        if method == "chat.update":
+            self.fake.record(method, payload)
+            return self._json({"ok": True, "channel": payload.get("channel"), "ts": payload.get("ts"), "text": payload.get("text")})
+        self._json({"ok": False, "error": "unknown_method"})
+
+
+# Stands in for SocketModeHandler: instead of a websocket, send_event() wraps
+# an event in a Socket Mode envelope and runs it through the Bolt app the same
+# way the real handler does, returning the time Bolt took to ack it.
+class FakeSocketModeHandler:
+    def __init__(self, app):
+        self.app = app
+        self.connected = False
+        self.acks = []
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def close(self):
+        self.connected = False
+
+    def send_event(self, event):
+        event = dict(event)
+        event.setdefault("ts", f"{time.time():.6f}")
+        event.setdefault("event_ts", event["ts"])
+        payload = {
+            "type": "event_callback",
+            "team_id": TEAM_ID,
+            "api_app_id": "ABENCH",
+            "event": event,
+            "event_id": f"Ev{uuid.uuid4().hex[:12].upper()}",
+            "event_time": int(time.time()),
+            "authorizations": [{"team_id": TEAM_ID, "user_id": BOT_USER_ID, "is_bot": True}],
+        }
+        request = SocketModeRequest(type="events_api", envelope_id=str(uuid.uuid4()), payload=payload)
+        started = time.perf_counter()
+        response = run_bolt_app(self.app, request)
+        ack = time.perf_counter() - started
+        self.acks.append(ack)
+        if response.status != 200:
+            raise RuntimeError(f"Bolt rejected event ({response.status}): {response.body}")
+        return ack
@@ -0,0 +1,45 @@
+from agent.errors import ERROR_RESPONSE
+from agent.response_cache import ResponseCache
+
+
+def test_process_message_answers_with_the_model_reply(agent, openai_server):
+    response = agent.process_message("How do I run the tests?", {"project": {"name": "demo"}})
+    assert response.startswith("Echo from ")
+    assert response.endswith("How do I run the tests?")
+
+
+def test_process_message_streams_deltas(agent, openai_server):
+    openai_server.responder = lambda model, messages: "one two three four five six seven"
+    deltas = []
+    response = agent.process_message("count", on_delta=deltas.append)
+    assert "".join(deltas) == response == "one two three four five six seven"
+
+
+def test_rate_limited_request_is_retried(agent, openai_server):
+    openai_server.fail_first = 1
+    assert agent.process_message("retry me").endswith("retry me")
+
+
+def test_history_is_sent_with_the_question(agent, openai_server):
+    seen = []
+    openai_server.responder = lambda model, messages: seen.append(messages) or "ok"
+    agent.remember("C1:U1", "What is the project?", "A Slack bot.")
+    agent.process_message("And its language?", history=agent.conversation_history("C1:U1"))
+    assert [m["content"] for m in seen[-1][1:]] == ["What is the project?", "A Slack bot.", "And its language?"]
+
+
+def test_errors_become_the_error_response(agent, openai_server):
+    openai_server.stop()
+    agent.client.max_retries = 0
+    assert agent.process_message("anyone there?") == ERROR_RESPONSE
+
+
+def test_fallback_answers_are_not_cached(agent, openai_server, tmp_path, monkeypatch):
+    agent.cache = ResponseCache(db_path=str(tmp_path / "responses.db"))
+    messages = [{"role": "system", "content": "You help."}, {"role": "user", "content": "cache me"}]
+    monkeypatch.setattr(agent.llm, "is_cooling_down", lambda model: model == "primary-model")
+    assert agent.complete(["primary-model", "fallback-model"], messages).startswith("Echo from fallback-model")
+    assert agent.cache.stats()["entries"] == 0
+    monkeypatch.setattr(agent.llm, "is_cooling_down", lambda model: False)
+    assert agent.complete(["primary-model", "fallback-model"], messages).startswith("Echo from primary-model")
+    assert agent.cache.stats()["entries"] == 1
@@ -0,0 +1,121 @@
+import json
+import subprocess
+import openai
+import pytest
+import agent.file_operations as file_operations
+from agent.batch import BatchJob
+
+
+@pytest.fixture
+def client(openai_server):
+    return openai.OpenAI(api_key="sk-test", base_url=openai_server.base_url, max_retries=0)
+
+
+def make_job(client, count, **kwargs):
+    job = BatchJob(client, "test-batch", **kwargs)
+    for i in range(count):
+        job.add(f"req-{i}", "gpt-4o-mini", [{"role": "user", "content": f"question {i}"}], {"index": i})
+    return job
+
+
+def submitted_lines(openai_server, batch_id):
+    batch = openai_server.batches[batch_id]
+    return [json.loads(line) for line in openai_server.files[batch["input_file_id"]]["content"].decode().splitlines()]
+
+
+def test_submit_poll_and_collect(client, openai_server):
+    openai_server.batch_delay = 1
+    job = make_job(client, 3)
+    job.submit()
+    assert job.refresh() == "in_progress"
+    assert job.wait(poll_interval=0.05, timeout=10) == "completed"
+    results = job.results()
+    assert set(results) == {"req-0", "req-1", "req-2"}
+    for custom_id, result in results.items():
+        assert result["error"] is None
+        assert result["content"].endswith(f"question {result['metadata']['index']}")
+
+
+def test_failed_batch_reports_every_request(client, openai_server):
+    openai_server.batch_outcome = "failed"
+    job = make_job(client, 2)
+    job.submit()
+    assert job.wait(poll_interval=0.01, timeout=10) == "failed"
+    results = job.results()
+    assert all(result["content"] is None and result["error"] == "No result (batch failed)" for result in results.values())
+
+
+def test_expired_batch_keeps_the_answered_requests(client, openai_server):
+    openai_server.batch_outcome = "expired"
+    openai_server.batch_expire_after = 1
+    job = make_job(client, 3)
+    job.submit()
+    assert job.wait(poll_interval=0.01, timeout=10) == "expired"
+    results = job.results()
+    assert results["req-0"]["error"] is None and results["req-0"]["content"]
+    assert results["req-1"]["error"]["code"] == "batch_expired"
+    assert results["req-2"]["content"] is None
+
+
+def test_large_job_is_split_by_request_count(client, openai_server):
+    job = make_job(client, 5, max_requests=2)
+    batch_ids = job.submit()
+    assert [len(submitted_lines(openai_server, batch_id)) for batch_id in batch_ids] == [2, 2, 1]
+    assert [openai_server.batches[batch_id]["metadata"]["part"] for batch_id in batch_ids] == ["1/3", "2/3", "3/3"]
+    assert job.wait(poll_interval=0.01, timeout=10) == "completed"
+    assert all(result["error"] is None for result in job.results().values())
+
+
+def test_large_job_is_split_by_file_size(client, openai_server):
+    line_size = len(make_job(client, 1).to_jsonl().encode())
+    job = make_job(client, 4, max_bytes=line_size * 2 + 10)
+    batch_ids = job.submit()
+    assert len(batch_ids) == 2
+    assert all(openai_server.files[openai_server.batches[batch_id]["input_file_id"]]["bytes"] <= line_size * 2 + 10 for batch_id in batch_ids)
+
+
+def test_request_larger_than_a_batch_is_rejected(client):
+    job = make_job(client, 1, max_bytes=10)
+    with pytest.raises(ValueError):
+        job.submit()
+
+
+def test_one_failed_part_fails_the_job(client, openai_server):
+    job = make_job(client, 4, max_requests=2)
+    first, second = job.submit()
+    openai_server.batch_state(first)
+    openai_server.batch_outcome = "failed"
+    assert job.wait(poll_interval=0.01, timeout=10) == "failed"
+    results = job.results()
+    assert results["req-0"]["error"] is None
+    assert results["req-2"]["error"] == "No result (batch failed)"
+
+
+def test_saved_job_is_collected_by_another_process(client, openai_server, tmp_path):
+    job = make_job(client, 3, max_requests=2)
+    job.submit()
+    loaded = BatchJob.load(client, job.save(str(tmp_path)))
+    assert loaded.batch_ids == job.batch_ids
+    assert loaded.wait(poll_interval=0.01, timeout=10) == "completed"
+    assert {custom_id: result["content"] is not None for custom_id, result in loaded.results().items()} == {"req-0": True, "req-1": True, "req-2": True}
+
+
+def test_diff_batch_reads_files_at_head(agent, openai_server, tmp_path, monkeypatch):
+    root = tmp_path / "clone"
+    root.mkdir()
+
+    def git(*args):
+        subprocess.run(["git", "-C", str(root), "-c", "user.name=test", "-c", "user.email=test@example.com", *args], check=True, capture_output=True)
+
+    git("init", "-q", "-b", "main")
+    (root / "app.py").write_text("def old():\n    pass\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+    git("checkout", "-q", "-b", "feature")
+    (root / "app.py").write_text("def committed_on_feature():\n    pass\n")
+    git("commit", "-q", "-am", "feature")
+    git("checkout", "-q", "main")
+    monkeypatch.setattr(file_operations, "get_project_path", lambda name: str(root))
+    job = agent.submit_review_batch("demo", base="main", head="feature")
+    prompts = [line["body"]["messages"][-1]["content"] for batch_id in job.batch_ids for line in submitted_lines(openai_server, batch_id)]
+    assert len(prompts) == 1 and "committed_on_feature" in prompts[0]
@@ -0,0 +1,103 @@
+import os
+import subprocess
+import threading
+import time
+import pytest
+from agent.code_index import CodeIndex
+
+
+def git(root, *args):
+    subprocess.run(["git", "-C", str(root), "-c", "user.name=test", "-c", "user.email=test@example.com", *args], check=True, capture_output=True)
+
+
+@pytest.fixture
+def clone(tmp_path):
+    root = tmp_path / "clone"
+    root.mkdir()
+    git(root, "init", "-q")
+    (root / "storage.py").write_text("def load_context(name):\n    return read_json(name)\n")
+    git(root, "add", ".")
+    git(root, "commit", "-q", "-m", "initial")
+    return root
+
+
+def make_index(clone, tmp_path):
+    return CodeIndex("demo", root=str(clone), index_dir=str(tmp_path / "index"), use_embeddings=False)
+
+
+def test_symlinks_are_not_indexed(clone, tmp_path):
+    secret = tmp_path / "secret.env"
+    secret.write_text("OPENAI_API_KEY = sk_secret_value\n")
+    os.symlink(secret, clone / "leak.py")
+    git(clone, "add", ".")
+    git(clone, "commit", "-q", "-m", "link")
+    index = make_index(clone, tmp_path)
+    index.update()
+    assert set(index.files) == {"storage.py"}
+    assert index.search("sk_secret_value") == []
+
+
+def test_search_is_not_blocked_by_an_update(clone, tmp_path, monkeypatch):
+    index = make_index(clone, tmp_path)
+    index.update()
+    (clone / "network.py").write_text("def open_socket(host):\n    return connect(host)\n")
+    git(clone, "add", ".")
+    git(clone, "commit", "-q", "-m", "network")
+    chunking, release = threading.Event(), threading.Event()
+    chunk_file = index._chunk_file
+
+    def slow_chunk_file(path):
+        chunking.set()
+        release.wait(5)
+        return chunk_file(path)
+
+    monkeypatch.setattr(index, "_chunk_file", slow_chunk_file)
+    updater = threading.Thread(target=index.update)
+    updater.start()
+    assert chunking.wait(5)
+    began = time.monotonic()
+    assert [chunk.path for chunk in index.search("load context")] == ["storage.py"]
+    assert time.monotonic() - began < 1
+    release.set()
+    updater.join(5)
+    assert [chunk.path for chunk in index.search("open socket")] == ["network.py"]
+
+
+def test_update_only_reindexes_changed_files(clone, tmp_path):
+    (clone / "network.py").write_text("def open_socket(host):\n    return connect(host)\n")
+    git(clone, "add", ".")
+    git(clone, "commit", "-q", "-m", "network")
+    index = make_index(clone, tmp_path)
+    assert index.update() == 2
+    assert index.update() == 0
+    (clone / "network.py").write_text("def close_socket(sock):\n    sock.shutdown()\n")
+    git(clone, "commit", "-q", "-am", "close")
+    assert index.update() == 1
+    assert not any("open_socket" in chunk.text for chunk in index.search("open socket"))
+    assert [chunk.path for chunk in index.search("close socket")] == ["network.py"]
+    git(clone, "rm", "-q", "network.py")
+    git(clone, "commit", "-q", "-m", "remove")
+    assert index.update() == 0
+    assert set(index.files) == {"storage.py"}
+
+
+def test_bm25_ranks_rarer_and_more_frequent_terms_higher(clone, tmp_path):
+    (clone / "cache.py").write_text("def evict_entry(cache):\n    cache.evict_entry()\n    cache.evict_entry()\n")
+    (clone / "store.py").write_text("def save_entry(store):\n    store.write_entry()\n")
+    (clone / "log.py").write_text("def log_entry(entry):\n    print(entry)\n")
+    git(clone, "add", ".")
+    git(clone, "commit", "-q", "-m", "more")
+    index = make_index(clone, tmp_path)
+    index.update()
+    assert [chunk.path for chunk in index.search("evict entry", k=2)] == ["cache.py", "log.py"]
+
+
+def test_saved_index_is_loaded_by_another_process(clone, tmp_path):
+    index = make_index(clone, tmp_path)
+    index.update()
+    index.save()
+    loaded = make_index(clone, tmp_path)
+    assert loaded.load()
+    assert loaded.revision == index.revision
+    assert not loaded.is_stale()
+    assert [chunk.path for chunk in loaded.search("load context")] == ["storage.py"]
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import agent.file_operations as file_operations
+from agent.code_review import ReviewEngine
+
+
+def test_symlinks_are_never_reviewed(tmp_path, monkeypatch):
+    secret = tmp_path / "secret.env"
+    secret.write_text("OPENAI_API_KEY=sk-secret\n")
+    root = tmp_path / "clone"
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "app.py").write_text("print('hi')\n")
+    os.symlink(secret, root / "leak.py")
+    os.symlink(tmp_path, root / "outside")
+    monkeypatch.setattr(file_operations, "get_project_path", lambda name: str(root))
+    engine = ReviewEngine(agent=None, model="review-model")
+    _, paths = engine.project_files("demo")
+    assert paths == [os.path.join("pkg", "app.py")]
+    chunks = engine.chunk_files(str(root), ["leak.py", os.path.join("outside", "secret.env"), os.path.join("pkg", "app.py")])
+    assert [chunk.path for chunk in chunks] == [os.path.join("pkg", "app.py")]
+
+
+class RecordingAgent:
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, models, messages, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        return "No issues."
+
+
+def git(root, *args):
+    subprocess.run(["git", "-C", str(root), "-c", "user.name=test", "-c", "user.email=test@example.com", *args], check=True, capture_output=True)
+
+
+def test_diff_review_reads_files_at_head(tmp_path, monkeypatch):
+    root = tmp_path / "clone"
+    root.mkdir()
+    git(root, "init", "-q", "-b", "main")
+    (root / "app.py").write_text("def old():\n    pass\n")
+    git(root, "add", ".")
+    git(root, "commit", "-q", "-m", "base")
+    git(root, "checkout", "-q", "-b", "feature")
+    (root / "app.py").write_text("def committed_on_feature():\n    pass\n")
+    git(root, "commit", "-q", "-am", "feature")
+    git(root, "checkout", "-q", "main")
+    (root / "app.py").write_text("def uncommitted_edit():\n    pass\n")
+    monkeypatch.setattr(file_operations, "get_project_path", lambda name: str(root))
+    agent = RecordingAgent()
+    ReviewEngine(agent=agent, model="review-model").review_diff("demo", "main", "feature")
+    assert len(agent.prompts) == 1
+    assert "committed_on_feature" in agent.prompts[0]
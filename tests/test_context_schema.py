@@ -0,0 +1,26 @@
+import pytest
+import agent.context_schema as context_schema
+from agent.context_schema import compile_template
+
+TEMPLATE = {"project": {
+    "name": {"value": None, "question": "Name?", "required": True},
+    "languages": {"value": [], "question": "Languages?"},
+}}
+
+
+@pytest.mark.parametrize("answer", ["", "none", "None", "n/a", "-"])
+def test_required_field_rejects_empty_answers(answer):
+    with pytest.raises(ValueError):
+        compile_template(TEMPLATE).coerce("project.name", answer)
+
+
+def test_optional_field_accepts_empty_answers():
+    assert compile_template(TEMPLATE).coerce("project.languages", "none") == []
+
+
+def test_compiled_templates_are_bounded():
+    templates = [{"field": {"value": i}} for i in range(context_schema.SCHEMA_CACHE_SIZE * 2)]
+    for template in templates:
+        compile_template(template)
+    assert len(context_schema._compiled) <= context_schema.SCHEMA_CACHE_SIZE
+    assert compile_template(templates[-1]) is compile_template(templates[-1])
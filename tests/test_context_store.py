@@ -0,0 +1,77 @@
+import os
+import pytest
+from agent.context_store import JSONContextStore, SQLiteContextStore, migrate_json_to_sqlite
+
+
+def test_saves_do_not_rescan_the_directory(tmp_path, monkeypatch):
+    store = JSONContextStore(str(tmp_path))
+    store.save("alpha", {"project": {"name": "alpha"}})
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: listed.append(path) or listdir(path))
+    for i in range(5):
+        store.save("alpha", {"project": {"name": "alpha"}, "round": i})
+    store.save("beta", {"project": {"name": "beta"}})
+    assert store.list_projects() == ["alpha", "beta"]
+    assert listed == []
+
+
+def test_writes_by_another_process_are_seen(tmp_path):
+    store, other = JSONContextStore(str(tmp_path)), JSONContextStore(str(tmp_path))
+    store.save("alpha", {})
+    other.save("beta", {})
+    store.save("gamma", {})
+    assert store.list_projects() == ["alpha", "beta", "gamma"]
+    other.delete("alpha")
+    assert not store.exists("alpha")
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    store = JSONContextStore(str(tmp_path)) if request.param == "json" else SQLiteContextStore(str(tmp_path / "contexts.db"))
+    yield store
+    store.close()
+
+
+def test_save_load_and_delete(store):
+    store.save("demo", {"project": {"name": "demo"}})
+    assert store.load("demo") == {"project": {"name": "demo"}}
+    assert store.list_projects() == ["demo"]
+    assert store.metadata("demo")["size"] > 0
+    store.delete("demo")
+    assert not store.exists("demo")
+    with pytest.raises(FileNotFoundError):
+        store.load("demo")
+
+
+def test_update_param_changes_one_value(store):
+    store.save("demo", {"project": {"name": "demo", "language": "Python"}, "team": {}})
+    store.update_param("demo", "team.size", 3)
+    store.update_param("demo", "project.language", "Go")
+    assert store.load("demo") == {"project": {"name": "demo", "language": "Go"}, "team": {"size": 3}}
+
+
+def test_failed_json_save_keeps_the_previous_context(tmp_path, monkeypatch):
+    store = JSONContextStore(str(tmp_path))
+    store.save("demo", {"version": 1})
+
+    def crash(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", crash)
+    with pytest.raises(OSError):
+        store.save("demo", {"version": 2})
+    assert store.load("demo") == {"version": 1}
+    assert sorted(os.listdir(tmp_path)) == ["demo.json"]
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    source = JSONContextStore(str(tmp_path / "contexts"))
+    source.save("alpha", {"project": {"name": "alpha"}})
+    source.save("beta", {"project": {"name": "beta"}})
+    db_path = str(tmp_path / "contexts.db")
+    assert migrate_json_to_sqlite(str(tmp_path / "contexts"), db_path) == 2
+    target = SQLiteContextStore(db_path)
+    assert target.list_projects() == ["alpha", "beta"]
+    assert target.load("beta") == {"project": {"name": "beta"}}
+    target.close()
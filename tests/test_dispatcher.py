@@ -0,0 +1,98 @@
+import threading
+import time
+import pytest
+from chat_integration.dispatcher import BULK, INTERACTIVE, EventDispatcher, parse_weights
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = EventDispatcher(max_concurrency=1)
+    dispatcher.start()
+    yield dispatcher
+    dispatcher.stop(5)
+
+
+def hold(dispatcher):
+    # Occupies the only worker until the returned event is set.
+    release = threading.Event()
+    started = threading.Event()
+    dispatcher.submit("blocker", lambda: (started.set(), release.wait(5)))
+    started.wait(5)
+    return release
+
+
+def test_jobs_of_one_key_run_in_order(dispatcher):
+    order = []
+    futures = [dispatcher.submit("C1:U1", order.append, i) for i in range(10)]
+    for future in futures:
+        future.result(5)
+    assert order == list(range(10))
+
+
+def test_weighted_key_gets_a_larger_share(dispatcher):
+    order = []
+    release = hold(dispatcher)
+    futures = [dispatcher.submit("heavy", order.append, "heavy", weight=2.0) for _ in range(4)]
+    futures += [dispatcher.submit("light", order.append, "light") for _ in range(2)]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order[:4].count("heavy") == 3
+
+
+def test_interactive_jobs_run_before_bulk_jobs(dispatcher):
+    order = []
+    release = hold(dispatcher)
+    futures = [dispatcher.submit("bulk", order.append, "bulk", priority=BULK)]
+    futures.append(dispatcher.submit("chat", order.append, "chat", priority=INTERACTIVE))
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["chat", "bulk"]
+
+
+def test_cancel_drops_queued_jobs(dispatcher):
+    release = hold(dispatcher)
+    futures = [dispatcher.submit("C1:U1", lambda: None) for _ in range(3)]
+    assert dispatcher.cancel("C1:U1") == 3
+    release.set()
+    assert all(future.cancelled() for future in futures)
+    assert dispatcher.drain(5)
+
+
+def test_parse_weights():
+    assert parse_weights("U1=2, C9=0.5,") == {"U1": 2.0, "C9": 0.5}
+    assert parse_weights("") == {}
+    with pytest.raises(ValueError):
+        parse_weights("U1=0")
+
+
+def test_drain_waits_for_jobs_not_yet_enqueued(dispatcher):
+    # An idle check scheduled ahead of the job's enqueue must not report the
+    # dispatcher idle while the job is still on its way to the queue.
+    gate = threading.Event()
+    dispatcher.loop.call_soon_threadsafe(gate.wait, 5)
+    dispatcher.loop.call_soon_threadsafe(dispatcher._check_idle)
+    future = dispatcher.submit("C1:U1", time.sleep, 0.2)
+    gate.set()
+    assert dispatcher.drain(5)
+    assert future.done()
+
+
+def test_stop_abandons_jobs_past_the_deadline():
+    dispatcher = EventDispatcher(max_concurrency=1)
+    dispatcher.start()
+    release = threading.Event()
+    started = threading.Event()
+    running = dispatcher.submit("slow", lambda: (started.set(), release.wait(10)))
+    started.wait(5)
+    queued = dispatcher.submit("waiting", lambda: None)
+    began = time.monotonic()
+    dispatcher.stop(0.2)
+    assert time.monotonic() - began < 2
+    with pytest.raises(RuntimeError):
+        running.result(1)
+    assert queued.cancelled()
+    # The worker still blocked in the job does not hold up interpreter exit.
+    assert all(thread.daemon for thread in threading.enumerate() if thread.name.startswith("consultai-worker"))
+    release.set()
@@ -0,0 +1,56 @@
+import time
+import httpx
+import openai
+import pytest
+import agent.llm_client as llm_client
+from agent.llm_client import RateLimitTimeout, TokenBucket, backoff_delay, retry_after_seconds
+
+
+def rate_limit_error(headers):
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "http://localhost/v1/chat/completions"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_disabled_bucket_never_waits():
+    bucket = TokenBucket(0)
+    bucket.acquire(10 ** 6, timeout=0)
+
+
+def test_bucket_waits_for_refill():
+    bucket = TokenBucket(6000)
+    bucket.acquire(6000)
+    began = time.monotonic()
+    bucket.acquire(10, timeout=2)
+    assert 0.05 <= time.monotonic() - began < 1
+
+
+def test_bucket_gives_up_at_the_timeout():
+    bucket = TokenBucket(60)
+    bucket.acquire(60)
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(1, timeout=0.05)
+
+
+def test_refund_returns_unused_capacity():
+    bucket = TokenBucket(60)
+    bucket.acquire(60)
+    bucket.refund(30)
+    bucket.acquire(30, timeout=0)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"Retry-After": "2"}, 2.0),
+    ({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}, None),
+    ({}, None),
+])
+def test_retry_after_is_read_from_the_response(headers, expected):
+    assert retry_after_seconds(rate_limit_error(headers)) == expected
+
+
+def test_backoff_is_capped_but_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(llm_client, "OPENAI_BACKOFF_BASE", 0.5)
+    monkeypatch.setattr(llm_client, "OPENAI_BACKOFF_MAX", 4.0)
+    assert all(0 <= backoff_delay(attempt) <= 4.0 for attempt in range(20))
+    assert all(backoff_delay(attempt) <= 0.5 * 2 ** attempt for attempt in range(3))
+    assert backoff_delay(0, retry_after=10.0) == 10.0
@@ -0,0 +1,50 @@
+import os
+import pytest
+import chat_integration.payloads as payloads
+from chat_integration.payloads import UploadError, download_file, send_long_text, split_message
+
+
+class FakeSay:
+    def __init__(self):
+        self.sent = []
+
+    def __call__(self, text, thread_ts=None):
+        self.sent.append((text, thread_ts))
+        return {"ts": f"1700000000.{len(self.sent):06d}"}
+
+
+def test_split_message_keeps_code_blocks_balanced():
+    text = "intro\n```python\n" + "\n".join(f"x = {i}  # line" for i in range(200)) + "\n```\nend"
+    parts = split_message(text, 300)
+    assert len(parts) > 1
+    assert all(len(part) <= 300 for part in parts)
+    assert all(part.count("```") % 2 == 0 for part in parts)
+
+
+@pytest.mark.parametrize("lines", [20, 120])
+def test_numbered_parts_fit_the_limit(monkeypatch, lines):
+    monkeypatch.setattr(payloads, "SLACK_MESSAGE_LIMIT", 200)
+    monkeypatch.setattr(payloads, "SLACK_SNIPPET_THRESHOLD", 10 ** 6)
+    say = FakeSay()
+    prefix = "<@U0123456789> "
+    send_long_text(say, "\n".join(f"line {i} " + "z" * 30 for i in range(lines)), prefix=prefix)
+    assert len(say.sent) > 1
+    assert all(len(text) <= 200 for text, _ in say.sent)
+    assert say.sent[0][0].startswith(prefix)
+    assert say.sent[-1][0].endswith(f"_({len(say.sent)}/{len(say.sent)})_")
+
+
+def test_downloads_with_the_same_name_do_not_overwrite_each_other(slack_server, tmp_path):
+    first = slack_server.add_file("main.py", "print('first')\n")
+    second = slack_server.add_file("main.py", "print('second')\n")
+    paths = [download_file("xoxb-test", file_info, str(tmp_path)) for file_info in (first, second, first)]
+    assert len(set(paths)) == 3
+    assert os.path.basename(paths[0]) == "main.py"
+    assert [open(path).read() for path in paths] == ["print('first')\n", "print('second')\n", "print('first')\n"]
+
+
+def test_failed_download_leaves_nothing_behind(slack_server, tmp_path):
+    file_info = slack_server.add_file("blob.py", b"\0\1\2")
+    with pytest.raises(UploadError):
+        download_file("xoxb-test", file_info, str(tmp_path))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,32 @@
+import json
+from agent.prompt_builder import PromptBuilder, count_tokens, parse_budgets
+
+
+def test_unanswered_fields_are_dropped():
+    context = {"project": {"name": "demo", "language": ""}, "team": {"size": None, "members": []}}
+    assert json.loads(PromptBuilder(default_budget=1000).fit_context(context)) == {"project": {"name": "demo"}}
+
+
+def test_context_within_budget_is_kept_whole():
+    context = {"project": {"name": "demo", "description": "A Slack bot"}}
+    assert json.loads(PromptBuilder(default_budget=1000).fit_context(context)) == context
+
+
+def test_over_budget_context_keeps_leading_fields_and_skips_oversized_ones():
+    context = {
+        "project": {"name": "demo", "notes": "word " * 400},
+        "stack": {"language": "Python", "framework": "Slack Bolt"},
+    }
+    builder = PromptBuilder(default_budget=60)
+    fitted = builder.fit_context(context)
+    assert count_tokens(fitted) <= 60
+    assert json.loads(fitted) == {"project": {"name": "demo"}, "stack": {"language": "Python", "framework": "Slack Bolt"}}
+
+
+def test_budget_is_chosen_per_model():
+    builder = PromptBuilder(budgets=parse_budgets("small-model=10, large-model=4000"), default_budget=1500)
+    assert builder.budget_for("small-model") == 10
+    assert builder.budget_for("large-model") == 4000
+    assert builder.budget_for("other-model") == 1500
+    context = {"project": {"name": "demo", "description": "A Slack bot that answers questions about a project"}}
+    assert count_tokens(builder.fit_context(context, "small-model"), "small-model") <= 10
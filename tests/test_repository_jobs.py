@@ -0,0 +1,65 @@
+import threading
+import pytest
+import agent.file_operations as file_operations
+from agent.repository_jobs import RepositoryJobManager
+
+
+@pytest.fixture
+def release(monkeypatch):
+    # Clones block until the test sets the event.
+    release = threading.Event()
+
+    def clone_repository(remote_url, project_name, on_progress=None, **options):
+        release.wait(5)
+        return f"/repos/{project_name}"
+    monkeypatch.setattr(file_operations, "clone_repository", clone_repository)
+    return release
+
+
+def test_only_one_job_per_project_starts(release):
+    manager = RepositoryJobManager(max_workers=4)
+    created = []
+    barrier = threading.Barrier(8)
+
+    def submit():
+        barrier.wait()
+        created.append(manager.submit("demo", "https://example.com/demo.git", on_created=lambda job: None)[1])
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert created.count(True) == 1
+    release.set()
+    manager.shutdown(wait=True)
+
+
+def test_on_created_runs_before_the_job_starts(release):
+    manager = RepositoryJobManager()
+    seen = []
+    release.set()
+    job, created = manager.submit("demo", "https://example.com/demo.git", on_created=lambda job: seen.append(job.status))
+    job.future.result(5)
+    assert created and seen == ["queued"] and job.status == "succeeded"
+    manager.shutdown(wait=True)
+
+
+def test_finished_jobs_are_pruned(release):
+    manager = RepositoryJobManager(job_ttl=0)
+    release.set()
+    job, _ = manager.submit("demo", "https://example.com/demo.git")
+    job.future.result(5)
+    assert manager.active_job("demo") is None
+    assert manager.jobs == {}
+    manager.shutdown(wait=True)
+
+
+def test_clones_do_not_keep_depending_on_the_mirror(tmp_path, monkeypatch):
+    commands = []
+    monkeypatch.setattr(file_operations, "get_project_path", lambda name: str(tmp_path / name))
+    monkeypatch.setattr(file_operations, "update_mirror", lambda remote_url, on_progress=None: str(tmp_path / "mirror.git"))
+    monkeypatch.setattr(file_operations, "run_git", lambda args, on_progress=None: commands.append(args))
+    file_operations.clone_repository("https://example.com/demo.git", "demo", depth=0, filter_spec="")
+    clone = commands[0]
+    assert clone[clone.index("--reference-if-able") + 1] == str(tmp_path / "mirror.git")
+    assert "--dissociate" in clone[:clone.index("--")]
@@ -0,0 +1,80 @@
+import time
+from agent.response_cache import ResponseCache
+
+SYSTEM = "You help."
+
+
+def test_instances_share_the_database(tmp_path):
+    path = str(tmp_path / "responses.db")
+    first, second = ResponseCache(db_path=path), ResponseCache(db_path=path)
+    first.set("model", SYSTEM, "question", "answer")
+    assert second.get("model", SYSTEM, "question") == "answer"
+
+
+def test_invalidation_reaches_other_instances(tmp_path):
+    path = str(tmp_path / "responses.db")
+    first, second = ResponseCache(db_path=path), ResponseCache(db_path=path)
+    first.set("model", SYSTEM, "question", "answer", namespace="demo")
+    assert second.get("model", SYSTEM, "question") == "answer"
+    first.invalidate("demo")
+    assert second.get("model", SYSTEM, "question") is None
+
+
+def test_eviction_keeps_entries_another_instance_uses(tmp_path):
+    path = str(tmp_path / "responses.db")
+    first, second = ResponseCache(db_path=path, max_entries=2), ResponseCache(db_path=path, max_entries=2)
+    second.set("model", SYSTEM, "hot", "hot answer")
+    first.set("model", SYSTEM, "one", "1")
+    assert second.get("model", SYSTEM, "hot") == "hot answer"
+    first.set("model", SYSTEM, "two", "2")
+    # "one" is the least recently used row, whichever process wrote it.
+    assert first.get("model", SYSTEM, "hot") == "hot answer"
+    assert second.get("model", SYSTEM, "one") is None
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "responses.db"), ttl=0.05)
+    cache.set("model", SYSTEM, "question", "answer")
+    assert cache.get("model", SYSTEM, "question") == "answer"
+    time.sleep(0.1)
+    assert cache.get("model", SYSTEM, "question") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "responses.db"), max_entries=2)
+    cache.set("model", SYSTEM, "first", "1")
+    cache.set("model", SYSTEM, "second", "2")
+    assert cache.get("model", SYSTEM, "first") == "1"
+    cache.set("model", SYSTEM, "third", "3")
+    assert cache.get("model", SYSTEM, "second") is None
+    assert cache.get("model", SYSTEM, "first") == "1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(db_path=path)
+    cache.set("model", SYSTEM, "question", "answer")
+    cache.close()
+    reopened = ResponseCache(db_path=path)
+    assert reopened.stats()["entries"] == 1
+    assert reopened.get("model", SYSTEM, "question") == "answer"
+
+
+def test_semantic_tier_matches_rephrasings_in_the_same_scope(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "responses.db"), semantic_threshold=0.9)
+    cache.set("model", SYSTEM, "How do I run the tests?", "Use pytest.")
+    assert cache.get("model", SYSTEM, "how do I run the tests") == "Use pytest."
+    assert cache.get("other-model", SYSTEM, "how do I run the tests") is None
+    assert cache.get("model", SYSTEM, "Where is the deployment config?") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_invalidate_only_drops_its_namespace(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "responses.db"))
+    cache.set("model", SYSTEM, "about demo", "demo answer", namespace="demo")
+    cache.set("model", SYSTEM, "about other", "other answer", namespace="other")
+    cache.invalidate("demo")
+    assert cache.get("model", SYSTEM, "about demo") is None
+    assert cache.get("model", SYSTEM, "about other") == "other answer"
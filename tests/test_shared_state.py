@@ -0,0 +1,86 @@
+import time
+import pytest
+import agent.session_manager as session_manager
+from agent.session_manager import SessionRegistry
+from agent.shared_state import MemoryStateStore, SQLiteStateStore
+from tests.conftest import PROJECT
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state(request, tmp_path):
+    state = MemoryStateStore() if request.param == "memory" else SQLiteStateStore(str(tmp_path / "state.db"))
+    yield state
+    state.close()
+
+
+def test_add_if_absent_adds_all_keys_or_none(state):
+    assert state.add_if_absent("events", ["a", "b"])
+    assert not state.add_if_absent("events", ["b", "c"])
+    assert state.get("events", "c") is None
+    assert state.add_if_absent("events", "c", value={"seen": 1})
+    assert state.get("events", "c") == {"seen": 1}
+
+
+def test_add_if_absent_keys_expire(state):
+    assert state.add_if_absent("events", "a", ttl=0.05)
+    time.sleep(0.1)
+    assert state.add_if_absent("events", "a")
+
+
+def test_lease_is_exclusive_until_released_or_expired(state):
+    assert state.acquire_lease("job", "worker-1", ttl=10)
+    assert state.acquire_lease("job", "worker-1", ttl=10)
+    assert not state.acquire_lease("job", "worker-2", ttl=10)
+    state.release_lease("job", "worker-2")
+    assert not state.acquire_lease("job", "worker-2", ttl=10)
+    state.release_lease("job", "worker-1")
+    assert state.acquire_lease("job", "worker-2", ttl=0.05)
+    time.sleep(0.1)
+    assert state.acquire_lease("job", "worker-1", ttl=10)
+
+
+@pytest.fixture
+def workers(sessions, tmp_path):
+    # Two registries on the same contexts and state file, as two processes.
+    state = SQLiteStateStore(str(tmp_path / "state.db"))
+    first = SessionRegistry(storage_dir=sessions.storage_dir, template_file=sessions.template_file, state=state)
+    second = SessionRegistry(storage_dir=sessions.storage_dir, template_file=sessions.template_file, state=state)
+    first.worker_id, second.worker_id = "host:1", "host:2"
+    yield first, second
+    state.close()
+
+
+def test_claim_keeps_other_workers_out(workers, monkeypatch):
+    monkeypatch.setattr(session_manager, "SESSION_CLAIM_TIMEOUT", 0.1)
+    first, second = workers
+    with first.claim(first.get("U1", "C1")):
+        with pytest.raises(TimeoutError):
+            with second.claim(second.get("U1", "C1")):
+                pass
+    with second.claim(second.get("U1", "C1")):
+        pass
+
+
+def test_claim_picks_up_what_another_worker_persisted(workers):
+    first, second = workers
+    with first.claim(first.get("U1", "C1")) as session:
+        session.context_manager.load_context(PROJECT)
+    with first.claim(first.get("U2", "C1")) as session:
+        session.setup_state = {"step": "project_name"}
+    with second.claim(second.get("U1", "C1")) as session:
+        assert session.context_manager.current_project == PROJECT
+    with second.claim(second.get("U2", "C1")) as session:
+        assert session.setup_state == {"step": "project_name"}
+
+
+def test_refresh_reloads_a_project_saved_by_another_worker(workers):
+    first, second = workers
+    with first.claim(first.get("U1", "C1")) as session:
+        session.context_manager.load_context(PROJECT)
+    reader = second.get("U1", "C1")
+    with second.claim(reader):
+        assert reader.context_manager.get_param("project.name") != "renamed"
+    with first.claim(first.get("U1", "C1")) as session:
+        session.context_manager.set_param("project.name", "renamed", persist=True)
+    with second.claim(reader):
+        assert reader.context_manager.get_param("project.name") == "renamed"
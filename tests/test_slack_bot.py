@@ -0,0 +1,150 @@
+import uuid
+import pytest
+import chat_integration.payloads as payloads
+import chat_integration.streaming as streaming
+from chat_integration.dispatcher import BULK, INTERACTIVE, REVIEW
+from chat_integration.slack_bot import SlackBot
+from tests.conftest import wait_for
+
+
+def mention(text, user="U1", channel="C1", **extra):
+    return {"type": "app_mention", "user": user, "channel": channel, "text": f"<@UBENCHBOT> {text}", **extra}
+
+
+def posted(slack_server, method="chat.postMessage"):
+    return [payload for sent, payload, _ in list(slack_server.messages) if sent == method]
+
+
+def replies(slack_server, marker="Echo from"):
+    return [payload for payload in posted(slack_server) if marker in payload.get("text", "")]
+
+
+def test_replies_to_one_user_in_order(bot, slack_server):
+    for i in range(5):
+        bot.socket_mode_handler.send_event(mention(f"question {i}"))
+    texts = [payload["text"] for payload in wait_for(lambda: len(replies(slack_server)) >= 5 and replies(slack_server))]
+    assert [text.rsplit(" ", 1)[-1] for text in texts] == ["0", "1", "2", "3", "4"]
+    assert all(text.startswith("<@U1> ") for text in texts)
+
+
+def test_users_are_not_blocked_by_each_other(bot, slack_server, openai_server):
+    bot.sessions.get("U2", "C1").context_manager.load_context("demo")
+    openai_server.latency = 0.3
+    for i in range(3):
+        bot.socket_mode_handler.send_event(mention(f"slow {i}"))
+    bot.socket_mode_handler.send_event(mention("fast", user="U2"))
+    texts = [payload["text"] for payload in wait_for(lambda: len(replies(slack_server)) >= 4 and replies(slack_server))]
+    # U2's reply does not wait behind U1's three.
+    assert texts.index(next(text for text in texts if text.startswith("<@U2>"))) < 3
+
+
+def test_event_acks_do_not_wait_for_the_reply(bot, slack_server, openai_server):
+    openai_server.latency = 0.5
+    ack = bot.socket_mode_handler.send_event(mention("hello"))
+    assert ack < 0.5
+    wait_for(lambda: replies(slack_server))
+
+
+def test_redelivered_event_is_handled_once(bot, slack_server):
+    event = mention("only once", client_msg_id=str(uuid.uuid4()), ts="1700000000.000100")
+    bot.socket_mode_handler.send_event(event)
+    bot.socket_mode_handler.send_event(event)
+    # The same message also arrives as a direct message event.
+    bot.socket_mode_handler.send_event({**event, "type": "message", "channel_type": "im", "text": "only once"})
+    bot.socket_mode_handler.send_event(mention("after"))
+    wait_for(lambda: any("after" in payload["text"] for payload in replies(slack_server)))
+    assert len([payload for payload in replies(slack_server) if "only once" in payload["text"]]) == 1
+
+
+def test_streamed_reply_is_updated_in_place(bot, slack_server, openai_server, monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_FLUSH_CHARS", 20)
+    monkeypatch.setattr(streaming, "STREAM_FLUSH_INTERVAL", 0.0)
+    answer = " ".join(f"word{i}" for i in range(60))
+    openai_server.responder = lambda model, messages: answer
+    openai_server.chunk_delay = 0.01
+    bot.stream_responses = True
+    bot.socket_mode_handler.send_event(mention("stream this"))
+    updates = wait_for(lambda: [p for p in posted(slack_server, "chat.update") if p.get("text") == f"<@U1> {answer}"] and posted(slack_server, "chat.update"))
+    placeholder = posted(slack_server)
+    assert len(placeholder) == 1
+    # Intermediate edits grow the same message before the final text lands.
+    assert len(updates) > 2
+    assert {payload["ts"] for payload in updates} == {updates[0]["ts"]}
+    assert updates[-1]["text"] == f"<@U1> {answer}"
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_long_reply_is_split_into_thread(bot, slack_server, openai_server, monkeypatch, stream):
+    monkeypatch.setattr(payloads, "SLACK_MESSAGE_LIMIT", 500)
+    monkeypatch.setattr(streaming, "SLACK_MESSAGE_LIMIT", 500)
+    answer = "\n".join(f"line {i} " + "x" * 40 for i in range(40))
+    openai_server.responder = lambda model, messages: answer
+    bot.stream_responses = stream
+    bot.socket_mode_handler.send_event(mention("long answer please"))
+
+    def first():
+        sent = posted(slack_server) + posted(slack_server, "chat.update")
+        return next((payload for payload in sent if "continued in thread" in payload.get("text", "")), None)
+
+    def thread_parts():
+        return [payload for payload in posted(slack_server) if payload.get("thread_ts") and "_(" in payload["text"]]
+
+    head = wait_for(first)
+    total = int(head["text"].rsplit("_(1/", 1)[1].split(",", 1)[0])
+    rest = wait_for(lambda: len(thread_parts()) >= total - 1 and thread_parts())
+    assert len(rest) == total - 1
+    assert all(len(payload["text"]) <= 500 for payload in [head] + rest)
+    assert len({payload["thread_ts"] for payload in rest}) == 1
+    assert rest[-1]["text"].endswith(f"_({total}/{total})_")
+
+
+def test_very_long_reply_is_uploaded_as_a_snippet(bot, slack_server, openai_server, monkeypatch):
+    monkeypatch.setattr(payloads, "SLACK_SNIPPET_THRESHOLD", 2000)
+    answer = "y" * 5000
+    openai_server.responder = lambda model, messages: answer
+    bot.socket_mode_handler.send_event(mention("huge answer"))
+    wait_for(lambda: posted(slack_server, "files.completeUploadExternal"))
+    assert answer.encode() in slack_server.uploads.values()
+    assert any("attached as" in payload["text"] for payload in posted(slack_server))
+
+
+def test_project_switch_forgets_threaded_conversations(bot, slack_server):
+    session = bot.sessions.get("U1", "C1")
+    bot.agent.remember(session.key, "top level", "answer")
+    bot.agent.remember(f"{session.key}:1700000000.000100", "in a thread", "answer")
+    bot.agent.remember("C1:U2", "another user", "answer")
+    bot.handle_project_selection(session, "demo", lambda *args, **kwargs: None)
+    assert bot.agent.conversation_history(session.key) == []
+    assert bot.agent.conversation_history(f"{session.key}:1700000000.000100") == []
+    assert bot.agent.conversation_history("C1:U2")
+
+
+def test_setup_answers_starting_with_review_are_not_reviews(bot, slack_server):
+    session = bot.sessions.get("U1", "C1")
+    session.setup_state = {"step": "project_name"}
+    sent = []
+    bot.handle_user_input(session, "review tool", lambda text=None, **kwargs: sent.append(text))
+    assert not any(text and text.startswith("Reviewing") for text in sent)
+
+
+@pytest.mark.parametrize("text, priority", [
+    ("how do I deploy?", INTERACTIVE),
+    ("review", INTERACTIVE),
+    ("review ", INTERACTIVE),
+    ("reviewing the plan", INTERACTIVE),
+    ("review agent/core.py", REVIEW),
+    ("  Review agent/core.py ", REVIEW),
+    ("review agent", BULK),
+    ("review main..feature", BULK),
+])
+def test_classify_request(text, priority):
+    assert SlackBot.classify_request(text) == priority
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_reply_to_a_threaded_question_stays_in_the_thread(bot, slack_server, stream):
+    bot.stream_responses = stream
+    bot.socket_mode_handler.send_event(mention("in a thread", ts="1700000000.000200", thread_ts="1700000000.000100"))
+    reply = wait_for(lambda: [p for p in posted(slack_server) + posted(slack_server, "chat.update") if "Echo from" in p.get("text", "")])
+    assert all(payload.get("thread_ts") == "1700000000.000100" for payload in posted(slack_server))
+    assert reply[-1]["text"].endswith("in a thread")